@@ -1,11 +1,16 @@
 from datetime import datetime
 import sqlite3
 from sqlite3 import Connection, Cursor
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 
 from exceptions import DatabaseException
 from config import settings
 
+# embeddings_status values: "" when the embeddings are built (or there are no files),
+# EMBEDDINGS_PENDING while a rebuild is queued or running, EMBEDDINGS_FAILED when
+# the last rebuild failed after all its attempts
+EMBEDDINGS_PENDING = "I"
+EMBEDDINGS_FAILED = "F"
 
 # Get a database connection and cursor. Ensures the agents table is created if it does not exist.
 def _get_db_connection() -> Tuple[Connection, Cursor]:
@@ -108,7 +113,7 @@ def change_agent(
     welcome_message: str = "",
     suggested_prompts: str = "",
     files: str = "",
-    embeddings_status: str = "",
+    embeddings_status: Optional[str] = "",
 ) -> Dict[str, str]:
     conn, cursor = None, None
     try:
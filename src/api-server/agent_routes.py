@@ -10,6 +10,7 @@ from agent import (
     get_agents,
     get_agent,
     update_agent_embeddings_status,
+    EMBEDDINGS_PENDING,
 )
 from utils import (
     sanitize_agent_name,
@@ -17,6 +18,8 @@ from utils import (
     trigger_embeddings_generation,
     delete_agent_files,
 )
+from jobs import get_latest_embeddings_job, cancel_embeddings_jobs
+from answer_cache import answer_cache
 
 agent_router = APIRouter()
 
@@ -65,12 +68,8 @@ def route_save_agent(
         # Process and save files
         file_names_str = process_uploaded_files(agent_name=sanitized_name, new_files=new_files)
         print(2, file_names_str)
-        embeddings_status = ""
-        # Trigger embeddings generation if files are added
-        if file_names_str:
-            print(3)
-            trigger_embeddings_generation(agent_name=name)
-            embeddings_status = "I"
+        # Embeddings are generated if files are added
+        embeddings_status = EMBEDDINGS_PENDING if file_names_str else ""
 
         # Save agent data
         agent = save_agent(
@@ -82,6 +81,11 @@ def route_save_agent(
             files=file_names_str
         )
 
+        # Queue embeddings generation once the status is saved, so the job cannot finish before it
+        if embeddings_status:
+            print(3)
+            trigger_embeddings_generation(agent_name=sanitized_name)
+
         return {"agent": agent}
 
     except Exception as e:
@@ -113,11 +117,9 @@ def route_update_agent(
             deleted_files=deleted_files,
         )
         
-        embeddings_status = ""
-        # Trigger embeddings generation if files were modified
-        if new_files or deleted_files:
-            trigger_embeddings_generation(agent_name=agent_name)
-            embeddings_status="I"
+        # Embeddings are regenerated if files were modified; otherwise the status is
+        # kept (None), so a failed build stays visible until the files are fixed
+        embeddings_status = EMBEDDINGS_PENDING if new_files or deleted_files else None
 
         # Update agent in the database
         agent = change_agent(
@@ -128,6 +130,12 @@ def route_update_agent(
             files=file_names_str,
             embeddings_status=embeddings_status,
         )
+        # cached chat answers of the previous version are no longer valid
+        answer_cache.invalidate(agent_name)
+
+        # Queue embeddings generation once the status is saved, so the job cannot finish before it
+        if embeddings_status:
+            trigger_embeddings_generation(agent_name=agent_name)
         return {"agent": agent}
 
     except Exception as e:
@@ -164,11 +172,15 @@ def route_delete_agent(request: Request, agent_name: str) -> Response:
         access_token = request.cookies.get("access_token")
         verify_jwt_token(access_token=access_token)
 
+        # Drop embeddings jobs that have not started yet
+        cancel_embeddings_jobs(agent_name=agent_name)
+
         # Delete agent files
         delete_agent_files(agent_name=agent_name)
 
         # Delete agent from the database
         delete_agent(name=agent_name)
+        answer_cache.invalidate(agent_name)
 
         return Response(
             content=f"Agent '{agent_name}' deleted successfully.", status_code=200
@@ -191,8 +203,30 @@ def route_update_embeddings_status(agent_name: str, request: Request) -> Dict[st
 
         # Update embeddings status
         update_agent_embeddings_status(name=agent_name, embeddings_status="")
+        answer_cache.invalidate(agent_name)
 
         return {"message": "Embeddings status updated successfully"}
 
     except Exception as e:
-         raise HTTPException(detail=f"Unable to update embeddings_status in {agent_name}: {str(e)}", status_code=500)
\ No newline at end of file
+         raise HTTPException(detail=f"Unable to update embeddings_status in {agent_name}: {str(e)}", status_code=500)
+
+
+# Route to get the state of the latest embeddings job of an agent
+@agent_router.get("/{agent_name}/embeddings-job")
+def route_get_embeddings_job(agent_name: str, request: Request) -> Dict[str, Any]:
+    try:
+        # Verify API Key and JWT Token
+        verify_x_api_key(headers=request.headers)
+        access_token = request.cookies.get("access_token")
+        verify_jwt_token(access_token=access_token)
+
+        # Ensure agent_name is provided
+        if not agent_name:
+            raise HTTPException(status_code=400, detail="Agent name cannot be blank")
+
+        # Get the latest job, None if the agent never had one
+        job = get_latest_embeddings_job(agent_name=agent_name)
+        return {"job": job}
+
+    except Exception as e:
+         raise HTTPException(detail=f"Unable to get embeddings job of {agent_name}: {str(e)}", status_code=500)
\ No newline at end of file
@@ -0,0 +1,206 @@
+# answer_cache.py
+
+# Answers of first chat turns, reused when the same agent is asked the same
+# question again, or one whose embedding is nearly the same. Turns with history
+# are never cached: their answer depends on the conversation.
+#
+# Entries are scoped by the agent's version, a hash of its instructions, files
+# and last update. Edits and finished embeddings rebuilds both set updated_on,
+# so a changed agent never gets an answer of its previous version, also from
+# another worker; entries of the old version are dropped the first time the new
+# one is seen. Each api worker keeps its own cache.
+#
+# The prompt embeddings of each scope are the rows of one matrix, so finding the
+# most similar prompt is a single matrix-vector product.
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from config import settings
+from metrics import ANSWER_CACHE_LOOKUPS, ANSWER_CACHE_EVICTIONS
+
+# agent name, agent version, response length
+Scope = Tuple[str, str, str]
+
+# Collapse whitespace and case so trivially different prompts share an entry
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+# Version of an agent row: changes whenever what its answers depend on changes
+def agent_version(agent: Dict[str, Any]) -> str:
+    parts = [str(agent.get(field) or "") for field in ("instructions", "files", "updated_on", "embeddings_status")]
+    return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+# Unit vector, or None for a missing or zero embedding
+def _unit(vector: Optional[List[float]]) -> Optional[np.ndarray]:
+    if not vector:
+        return None
+    unit = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(unit))
+    return unit / norm if norm else None
+
+# A cached answer
+class _Entry:
+    __slots__ = ("answer",)
+
+    def __init__(self, answer: str) -> None:
+        self.answer = answer
+
+# Unit embeddings of the cached prompts of a scope, one row per prompt. A removed
+# row is replaced by the last one, so the first len(prompts) rows are in use.
+class _ScopeMatrix:
+    def __init__(self, dim: int) -> None:
+        self.rows = np.empty((16, dim), dtype=np.float32)
+        self.prompts: List[str] = []
+        self._positions: Dict[str, int] = {}
+
+    @property
+    def dim(self) -> int:
+        return self.rows.shape[1]
+
+    def add(self, prompt: str, embedding: np.ndarray) -> None:
+        row = self._positions.get(prompt)
+        if row is None:
+            row = len(self.prompts)
+            if row == len(self.rows):
+                self.rows = np.concatenate([self.rows, np.empty_like(self.rows)])
+            self._positions[prompt] = row
+            self.prompts.append(prompt)
+        self.rows[row] = embedding
+
+    def remove(self, prompt: str) -> None:
+        row = self._positions.pop(prompt, None)
+        if row is None:
+            return
+        last = self.prompts.pop()
+        if last != prompt:
+            self.rows[row] = self.rows[len(self.prompts)]
+            self.prompts[row] = last
+            self._positions[last] = row
+
+    # The prompt most similar to a unit embedding, if at least similarity
+    def best(self, embedding: np.ndarray, similarity: float) -> Optional[str]:
+        if not self.prompts:
+            return None
+        scores = self.rows[:len(self.prompts)] @ embedding
+        row = int(np.argmax(scores))
+        return self.prompts[row] if scores[row] >= similarity else None
+
+# One chat turn's use of the cache: looked up before the LLM call, filled after it
+class CacheLookup:
+    def __init__(self, scope: Scope, prompt: str) -> None:
+        self.scope = scope
+        self.prompt = prompt
+        self.embedding: Optional[np.ndarray] = None
+        # the cached answer, and whether it matched "exact" or "semantic"
+        self.answer: Optional[str] = None
+        self.match: Optional[str] = None
+
+# LRU of answers bounded by max_size entries; similarity is the minimum cosine
+# similarity of two prompt embeddings for one to reuse the other's answer
+class AnswerCache:
+    def __init__(self, max_size: int, similarity: float) -> None:
+        self.max_size = max_size
+        self.similarity = similarity
+        self._entries: "OrderedDict[Tuple[Scope, str], _Entry]" = OrderedDict()
+        # prompts of each scope, so similar prompts are only compared within an agent version
+        self._scopes: Dict[Scope, Dict[str, _Entry]] = {}
+        self._matrices: Dict[Scope, _ScopeMatrix] = {}
+        # newest version seen of each agent
+        self._versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    # Exact lookup of a prompt. The returned lookup holds the answer on a hit
+    def lookup(self, agent_name: str, version: str, response_length: str, prompt: str) -> CacheLookup:
+        scope = (agent_name, version, str(response_length).lower())
+        lookup = CacheLookup(scope, normalize_prompt(prompt))
+        with self._lock:
+            if self._versions.get(agent_name) != version:
+                self._drop_agent(agent_name)
+                self._versions[agent_name] = version
+            entry = self._entries.get((scope, lookup.prompt))
+            if entry is not None:
+                self._entries.move_to_end((scope, lookup.prompt))
+                lookup.answer, lookup.match = entry.answer, "exact"
+        if entry is not None:
+            ANSWER_CACHE_LOOKUPS.labels("exact").inc()
+        return lookup
+
+    # Look for the answer of the most similar cached prompt once the prompt's
+    # embedding is known; a miss is counted here, after both kinds of lookup
+    def match_similar(self, lookup: CacheLookup, embedding: Optional[List[float]]) -> bool:
+        lookup.embedding = _unit(embedding)
+        best_key = None
+        if lookup.embedding is not None:
+            with self._lock:
+                matrix = self._matrices.get(lookup.scope)
+                if matrix is not None and matrix.dim == len(lookup.embedding):
+                    prompt = matrix.best(lookup.embedding, self.similarity)
+                    if prompt is not None:
+                        best_key = (lookup.scope, prompt)
+                        self._entries.move_to_end(best_key)
+                        lookup.answer, lookup.match = self._entries[best_key].answer, "semantic"
+        ANSWER_CACHE_LOOKUPS.labels("semantic" if best_key is not None else "miss").inc()
+        return best_key is not None
+
+    # Keep the answer of a looked up prompt, unless its agent has changed since
+    def put(self, lookup: CacheLookup, answer: str) -> None:
+        if not answer:
+            return
+        agent_name, version, _ = lookup.scope
+        key = (lookup.scope, lookup.prompt)
+        evicted = 0
+        with self._lock:
+            if self._versions.get(agent_name) != version:
+                return
+            entry = _Entry(answer)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._scopes.setdefault(lookup.scope, {})[lookup.prompt] = entry
+            if lookup.embedding is not None:
+                matrix = self._matrices.get(lookup.scope)
+                if matrix is None:
+                    matrix = self._matrices[lookup.scope] = _ScopeMatrix(len(lookup.embedding))
+                # prompts embedded by another model are only matched exactly
+                if matrix.dim == len(lookup.embedding):
+                    matrix.add(lookup.prompt, lookup.embedding)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+        if evicted:
+            ANSWER_CACHE_EVICTIONS.labels().inc(evicted)
+
+    # Forget every answer of an agent
+    def invalidate(self, agent_name: str) -> None:
+        with self._lock:
+            self._drop_agent(agent_name)
+            self._versions.pop(agent_name, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _drop_agent(self, agent_name: str) -> None:
+        for scope in [scope for scope in self._scopes if scope[0] == agent_name]:
+            for prompt in list(self._scopes[scope]):
+                self._remove((scope, prompt))
+
+    def _remove(self, key: Tuple[Scope, str]) -> None:
+        scope, prompt = key
+        self._entries.pop(key, None)
+        matrix = self._matrices.get(scope)
+        if matrix is not None:
+            matrix.remove(prompt)
+        prompts = self._scopes.get(scope)
+        if prompts is not None:
+            prompts.pop(prompt, None)
+            if not prompts:
+                del self._scopes[scope]
+                self._matrices.pop(scope, None)
+
+answer_cache = AnswerCache(settings.answer_cache_size, settings.answer_cache_similarity)
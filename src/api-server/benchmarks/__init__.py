@@ -0,0 +1,4 @@
+# benchmarks
+
+# Benchmarks for the api-server. Run from the api-server directory, e.g.
+# `python -m benchmarks.chat_load`.
@@ -0,0 +1,166 @@
+# benchmarks/chat_load.py
+
+# Concurrent-chat capacity of one api-server worker. Stub embeddings and LLM
+# servers answer after fixed delays, so the api-server itself is what limits
+# throughput: with an LLM delay of D seconds, N concurrent chats can complete at
+# most N / D per second, and "efficiency" is the share of that reached.
+#
+# --app-dir points at any api-server tree, so a checkout of an earlier commit
+# can be measured the same way for a before/after comparison.
+#
+#   python -m benchmarks.chat_load [--concurrency 10,50,200] [--requests 400] [--llm-ms 500] [--retrieval-ms 50] [--app-dir .] [--json]
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import List, Tuple
+import httpx
+import uvicorn
+from fastapi import Body, FastAPI
+
+HEADERS = {"X-Requested-With": "XteNATqxnbBkPa6TCHcK0NTxOM1JVkQl"}
+AGENT_NAME = "bench"
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# One app standing in for both the embeddings server and the LLM server
+def stub_upstreams(retrieval_ms: float, llm_ms: float) -> FastAPI:
+    stub = FastAPI()
+
+    @stub.post("/query")
+    async def query(body: dict = Body(...)):
+        await asyncio.sleep(retrieval_ms / 1000.0)
+        return {"status": "success", "results": [f"chunk {i} about {body.get('prompt', '')}" for i in range(5)]}
+
+    @stub.post("/v1/chat/completions")
+    async def completions(body: dict = Body(...)):
+        await asyncio.sleep(llm_ms / 1000.0)
+        return {"choices": [{"message": {"role": "assistant", "content": "stub answer"}}]}
+
+    return stub
+
+def _start_stub(retrieval_ms: float, llm_ms: float) -> int:
+    port = _free_port()
+    config = uvicorn.Config(stub_upstreams(retrieval_ms, llm_ms), host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+    threading.Thread(target=uvicorn.Server(config).run, daemon=True).start()
+    _wait_until(f"http://127.0.0.1:{port}/docs", 30)
+    return port
+
+def _wait_until(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} not up after {timeout:.0f}s")
+
+# Send chats from concurrency clients; returns the latency in ms of each
+# successful chat, the number of errors and the wall time
+async def _load(url: str, requests: int, concurrency: int) -> Tuple[List[float], int, float]:
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def client_loop(client: httpx.AsyncClient) -> None:
+        nonlocal next_index, errors
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, json={"input": f"question {index}", "messages": []}, headers=HEADERS)
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - started) * 1000.0)
+            except httpx.HTTPError:
+                errors += 1
+
+    async with httpx.AsyncClient(limits=limits, timeout=300.0) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q / 100.0 * len(ordered)), len(ordered) - 1)]
+
+def run(app_dir: str, concurrency_levels: List[int], requests: int, retrieval_ms: float, llm_ms: float) -> list:
+    app_dir = os.path.abspath(app_dir)
+    stub_port = _start_stub(retrieval_ms, llm_ms)
+    results = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        # the database path is built relative to the working directory
+        env = {**os.environ, "DATA_DIR": os.path.relpath(data_dir, app_dir), "DEBUG": "false",
+               "EMBEDDINGS_SERVER": "127.0.0.1", "EMBEDDINGS_SERVER_PORT": str(stub_port),
+               "LLM_SERVER": "127.0.0.1", "LLM_SERVER_PORT": str(stub_port)}
+        subprocess.run([sys.executable, "-c", f"import agent; agent.save_agent({AGENT_NAME!r}, instructions='Answer briefly.')"],
+                       cwd=app_dir, env=env, check=True, capture_output=True)
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--workers", "1", "--log-level", "warning", "--backlog", "4096"],
+            cwd=app_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_until(f"http://127.0.0.1:{port}/health", 60)
+            url = f"http://127.0.0.1:{port}/api/chat/{AGENT_NAME}"
+            # open the connections before measuring
+            asyncio.run(_load(url, min(concurrency_levels), min(concurrency_levels)))
+            for concurrency in concurrency_levels:
+                latencies, errors, elapsed = asyncio.run(_load(url, requests, concurrency))
+                throughput = len(latencies) / elapsed if elapsed else 0.0
+                ideal = concurrency / ((retrieval_ms + llm_ms) / 1000.0)
+                results.append({
+                    "concurrency": concurrency,
+                    "requests": requests,
+                    "errors": errors,
+                    "chats_per_sec": throughput,
+                    "efficiency": throughput / ideal if ideal else 0.0,
+                    "p50_ms": _percentile(latencies, 50),
+                    "p95_ms": _percentile(latencies, 95),
+                    "p99_ms": _percentile(latencies, 99),
+                })
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent-chat capacity of one api-server worker")
+    parser.add_argument("--concurrency", default="10,50,200")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--retrieval-ms", type=float, default=50.0)
+    parser.add_argument("--llm-ms", type=float, default=500.0)
+    parser.add_argument("--app-dir", default=".", help="api-server tree to measure")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    results = run(args.app_dir, levels, args.requests, args.retrieval_ms, args.llm_ms)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'clients':>7} {'requests':>8} {'errors':>6} {'chats/s':>8} {'efficiency':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(f"{r['concurrency']:>7} {r['requests']:>8} {r['errors']:>6} {r['chats_per_sec']:>8.1f} {r['efficiency']:>10.2f} "
+              f"{r['p50_ms']:>8.0f} {r['p95_ms']:>8.0f} {r['p99_ms']:>8.0f}")
+
+if __name__ == "__main__":
+    main()
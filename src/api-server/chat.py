@@ -1,49 +1,132 @@
 # chat.py
 
-import requests
+import json
+import httpx
+from typing import AsyncIterator, Dict, List
 from config import settings
+from tokens import count_tokens, tokenizer_name
+from exceptions import ExternalServiceException
+from http_client import call_timeout, post_json, stream_json
+
+# tokens a chat template adds around each message (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+RAG_HEADER = "Using the information below answer the given query:\n"
+CHUNK_SEPARATOR = "\n\n"
+
+# Messages of one history entry, in order
+def _entry_messages(entry: Dict[str, str]) -> List[Dict[str, str]]:
+    messages = []
+    for role in ("user", "assistant", "system"):
+        if role in entry:
+            messages.append({"role": role, "content": entry[role]})
+    return messages
 
 # Helper function to compose the LLM request
-def compose_request(instruction, document_chunks, history, user_prompt):
+def compose_request(instruction, document_chunks, history, user_prompt, max_input_tokens=None):
     """
     Combines the instruction, document chunks, history, and user prompt into a complete prompt
-    for an LLM (vLLM, Ollama, or OpenAI-compatible API).
+    for an LLM (vLLM, Ollama, or OpenAI-compatible API), within a budget of input tokens.
+
+    The budget is filled in priority order: the instruction and the user prompt always go in,
+    then the newest CHAT_RECENT_TURNS history entries, then the document chunks best first,
+    then older history entries, newest first, until one does not fit. The header introducing
+    the chunks is counted with the first chunk, as it is only sent along with chunks.
+
+    Counting runs the tokenizer over every text, so async callers run this in a thread.
     
     :param instruction: The main system instruction to the LLM (e.g., "You are a Teacher...").
-    :param document_chunks: A list of document chunks relevant to the conversation.
+    :param document_chunks: A list of document chunks relevant to the conversation, best first.
     :param history: A list of past user prompts and system responses (as a list of dictionaries).
     :param user_prompt: The latest user input or question.
+    :param max_input_tokens: The token budget of the prompt (default MAX_INPUT_TOKENS).
     
-    :return: A formatted list of messages to be used for LLM completion API.
+    :return: A formatted list of messages to be used for LLM completion API, and the token counts used.
     """
-    
+    budget = max_input_tokens if max_input_tokens is not None else settings.max_input_tokens
+    history = history or []
+    document_chunks = document_chunks or []
+    entries = [_entry_messages(entry) for entry in history]
+
+    # count everything in one batch
+    texts = [instruction, "\nQuery: " + user_prompt, RAG_HEADER] + document_chunks
+    texts += [message["content"] for messages in entries for message in messages]
+    counts = count_tokens(texts)
+    instruction_tokens, prompt_tokens = counts[0] + MESSAGE_OVERHEAD_TOKENS, counts[1] + MESSAGE_OVERHEAD_TOKENS
+    header_tokens = counts[2]
+    chunk_tokens = [count + 1 for count in counts[3:3 + len(document_chunks)]]
+    entry_tokens, position = [], 3 + len(document_chunks)
+    for messages in entries:
+        entry_tokens.append(sum(counts[position:position + len(messages)]) + MESSAGE_OVERHEAD_TOKENS * len(messages))
+        position += len(messages)
+
+    # the instruction and the prompt are sent even if they alone exceed the budget
+    remaining = budget - instruction_tokens - prompt_tokens
+    used_entries = set()
+    newest_first = list(range(len(entries) - 1, -1, -1))
+    recent_count = max(settings.chat_recent_turns, 0)
+    # history stops at the first entry that does not fit, so the kept turns have no gaps
+    history_open = True
+
+    def add_entries(indexes: List[int]) -> None:
+        nonlocal remaining, history_open
+        for index in indexes:
+            if not history_open or entry_tokens[index] > remaining:
+                history_open = False
+                return
+            used_entries.add(index)
+            remaining -= entry_tokens[index]
+
+    # newest turns
+    add_entries(newest_first[:recent_count])
+
+    # best chunks; a chunk that does not fit is skipped for a smaller one after it.
+    # The first chunk kept also pays for the header
+    used_chunks = []
+    for index, tokens in enumerate(chunk_tokens):
+        cost = tokens if used_chunks else tokens + header_tokens
+        if cost <= remaining:
+            used_chunks.append(index)
+            remaining -= cost
+
+    # older turns with what is left
+    add_entries(newest_first[recent_count:])
+
     # Start with the instruction as the system message
     messages = [
         {"role": "system", "content": instruction}
     ]
         
-    # Add the past history of user prompts and system responses
-    for entry in history:
-        if "user" in entry:
-            messages.append({"role": "user", "content": entry["user"]})
-        if "assistant" in entry:
-            messages.append({"role": "assistant", "content": entry["assistant"]})
-        if "system" in entry:
-            messages.append({"role": "system", "content": entry["system"]})
+    # Add the kept history of user prompts and system responses, oldest first
+    for index, entry in enumerate(entries):
+        if index in used_entries:
+            messages.extend(entry)
 
     rag_prompt = ""    
     # Add document chunks as a system message (summarizing or presenting document context)
-    if document_chunks:
-        rag_prompt += "Using the information below answer the given query:\n"
-        chunked_documents = "\n\n".join(document_chunks)
+    if used_chunks:
+        rag_prompt += RAG_HEADER
+        chunked_documents = CHUNK_SEPARATOR.join(document_chunks[index] for index in used_chunks)
         rag_prompt += chunked_documents
 
     rag_prompt += '\nQuery: '
     rag_prompt += user_prompt
     # Add the latest user prompt
     messages.append({"role": "user", "content": rag_prompt})
-    
-    return messages
+
+    history_tokens = sum(entry_tokens[index] for index in used_entries)
+    chunks_tokens = sum(chunk_tokens[index] for index in used_chunks) + (header_tokens if used_chunks else 0)
+    usage = {
+        "budget": budget,
+        "total": instruction_tokens + prompt_tokens + history_tokens + chunks_tokens,
+        "instruction": instruction_tokens,
+        "prompt": prompt_tokens,
+        "history": history_tokens,
+        "chunks": chunks_tokens,
+        "history_entries": {"used": len(used_entries), "dropped": len(entries) - len(used_entries)},
+        "document_chunks": {"used": len(used_chunks), "dropped": len(document_chunks) - len(used_chunks)},
+        "tokenizer": tokenizer_name(),
+    }
+    return messages, usage
 
 # Helper function to map response length to max_tokens
 def get_max_tokens_by_length(response_length: str) -> int:
@@ -55,7 +138,7 @@ def get_max_tokens_by_length(response_length: str) -> int:
     return length_map.get(str(response_length).lower(), settings.chat_response_length_medium)  # Default to medium if not provided
 
 # Helper function to call the vllm server
-def send_prompt_vllm(
+async def send_prompt_vllm(
     messages: list,
     response_length: str = settings.chat_response_length_default,  # short, medium, long
     temperature: float = settings.chat_temperature, # controls the randomness or creativity of token selection by adjusting the overall probability distribution.
@@ -66,9 +149,10 @@ def send_prompt_vllm(
     try:
         max_tokens = get_max_tokens_by_length(response_length)
 
-        # Call the vLLM API using requests
+        # Call the vLLM API through the shared client
         url = f"http://{settings.llm_server}:{settings.llm_server_port}/v1/chat/completions"
-        response = requests.post(url,
+        response = await post_json("llm", "chat", url,
+            timeout=call_timeout(settings.llm_connect_timeout, settings.llm_timeout),
             json={
                "model": settings.llm_model_name,
                 "messages": messages,
@@ -77,8 +161,7 @@ def send_prompt_vllm(
                 "top_p": top_p,
                 "frequency_penalty": frequency_penalty,
                 "presence_penalty": presence_penalty
-            },
-            timeout=600
+            }
         )
         response.raise_for_status()
         response_data = response.json()
@@ -91,6 +174,50 @@ def send_prompt_vllm(
         }
         return resp_json
         
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Error connecting to vLLM server: {str(e)}")
+    except httpx.HTTPError as e:
+        raise ExternalServiceException(detail=f"Error connecting to vLLM server: {str(e)}")
+
+
+# Helper function to stream a completion from the vllm server, yielding the
+# content of each token as it arrives. Closing the generator closes the
+# connection, which makes vLLM abort the request.
+async def stream_prompt_vllm(
+    messages: list,
+    response_length: str = settings.chat_response_length_default,
+    temperature: float = settings.chat_temperature,
+    top_p: float = settings.chat_top_p,
+    frequency_penalty: float = settings.chat_frequency_penalty,
+    presence_penalty: float = settings.chat_presence_penalty
+    ) -> AsyncIterator[str]:
+    url = f"http://{settings.llm_server}:{settings.llm_server_port}/v1/chat/completions"
+    try:
+        async with stream_json("llm", "chat_stream", url,
+            timeout=call_timeout(settings.llm_connect_timeout, settings.llm_timeout),
+            json={
+                "model": settings.llm_model_name,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": get_max_tokens_by_length(response_length),
+                "top_p": top_p,
+                "frequency_penalty": frequency_penalty,
+                "presence_penalty": presence_penalty,
+                "stream": True
+            }
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise ExternalServiceException(detail=f"vLLM server returned {response.status_code}: {response.text}")
+            # server-sent events: one "data: <json>" line per chunk, "data: [DONE]" at the end
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                content = choices[0].get("delta", {}).get("content") if choices else None
+                if content:
+                    yield content
 
+    except httpx.HTTPError as e:
+        raise ExternalServiceException(detail=f"Error connecting to vLLM server: {str(e)}")
@@ -1,11 +1,17 @@
 # chat_routes.py
 
+import json
+import time
+import asyncio
 from fastapi import APIRouter, Request, Body, HTTPException
-from typing import Dict, Any
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 from auth import verify_x_api_key
-from agent import get_agent
-from chat import compose_request, send_prompt_vllm
-from utils import query_embeddings
+from agent import get_agent, EMBEDDINGS_PENDING
+from chat import compose_request, send_prompt_vllm, stream_prompt_vllm
+from utils import logger, query_embeddings
+from answer_cache import CacheLookup, agent_version, answer_cache
+from metrics import CHAT_FIRST_TOKEN_SECONDS, CHAT_STREAMS
 from config import settings
 
 # Create an API Router for chat-related routes
@@ -35,35 +41,147 @@ def route_get_agent(agent_name: str, request: Request) -> Dict[str, Any]:
          raise HTTPException(detail=f"Unable to get agent {agent_name} in chat: {str(e)}", status_code=500)
 
 
+# Like asyncio.gather, but when one awaitable fails the others are cancelled before
+# the error is raised, so a retrieval request does not outlive a failed chat turn
+async def _gather_or_cancel(*awaitables: Any) -> List[Any]:
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+# Compose the LLM messages of a chat request: the agent's instruction, the chunks
+# retrieved for the input, the history and the input itself. A turn without history
+# goes through the answer cache: retrieval starts along with the agent lookup, the
+# exact prompt is looked up once the agent is known (a hit cancels retrieval), and a
+# similar one once retrieval has embedded it. On a hit the lookup holds the answer
+# and no messages are composed; on a miss it is returned to store the answer.
+async def _prepare_chat(agent_name: str, body: Dict[str, Any]) -> Tuple[Optional[CacheLookup], Optional[List[Dict[str, str]]], str, Optional[Dict[str, Any]]]:
+    # Get input details
+    input_text: str = body.get("input", "")
+    messages: Dict[str, Any] = body.get("messages")
+    response_length: str = body.get("response_length", settings.chat_response_length_default)
+
+    lookup = None
+    if answer_cache.enabled and not messages:
+        # retrieve while the agent, whose version the cache needs, is looked up
+        retrieval = asyncio.ensure_future(query_embeddings(agent_name=agent_name, prompt=input_text, include_embedding=True))
+        try:
+            agent = await asyncio.to_thread(get_agent, name=agent_name)
+        except BaseException:
+            retrieval.cancel()
+            raise
+        # answers are not cached while the agent's embeddings are being rebuilt
+        if agent.get("embeddings_status") != EMBEDDINGS_PENDING:
+            lookup = answer_cache.lookup(agent_name, agent_version(agent), response_length, input_text)
+            if lookup.answer is not None:
+                retrieval.cancel()
+                return lookup, None, response_length, None
+        document_chunks, embedding = await retrieval
+        if lookup is not None and answer_cache.match_similar(lookup, embedding):
+            return lookup, None, response_length, None
+    else:
+        # Look up the agent and get the document text array via embeddings query at the same time
+        agent, (document_chunks, _) = await _gather_or_cancel(
+            asyncio.to_thread(get_agent, name=agent_name),
+            query_embeddings(agent_name=agent_name, prompt=input_text))
+    # Compose request to be sent to LLM; tokens are counted in a thread, off the event loop
+    messages, token_usage = await asyncio.to_thread(
+        compose_request,
+        instruction=agent["instructions"], 
+        document_chunks=document_chunks, 
+        history=messages, 
+        user_prompt=input_text
+    )
+    return lookup, messages, response_length, token_usage
+
 # to generate user prompt to get LLM response
 @chat_router.post("/{agent_name}")
-def route_post_chat(agent_name: str, request: Request, body: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
+async def route_post_chat(agent_name: str, request: Request, body: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
     try:
         verify_x_api_key(headers=request.headers)
 
         if not agent_name:
             raise HTTPException(status_code=400, detail="Agent name cannot be blank")
 
-        # Get input details
-        agent: Dict[str, Any] = get_agent(name=agent_name)
-        input_text: str = body.get("input", "")
-        messages: Dict[str, Any] = body.get("messages")
-        response_length: str = body.get("response_length", settings.chat_response_length_default)
-
-        # Get document text array via embeddings query
-        document_chunks = query_embeddings(agent_name=agent_name)
-        # Compose request to be sent to LLM
-        messages = compose_request(
-            instruction=agent["instructions"], 
-            document_chunks=document_chunks, 
-            history=messages, 
-            user_prompt=input_text
-        )
+        lookup, messages, response_length, token_usage = await _prepare_chat(agent_name, body)
+        if lookup is not None and lookup.answer is not None:
+            return {"content": lookup.answer, "role": "assistant", "tokens": None, "cached": True}
+
         # Send request to the LLM server
-        llm_response = send_prompt_vllm(messages=messages, response_length=response_length)
+        llm_response = await send_prompt_vllm(messages=messages, response_length=response_length)
+        if lookup is not None:
+            answer_cache.put(lookup, llm_response["content"])
 
-        return {"content": llm_response["content"], "role": llm_response["role"]}
+        return {"content": llm_response["content"], "role": llm_response["role"], "tokens": token_usage, "cached": False}
         #return {"content": "Response from LLM", "role": "assistant"}
 
     except Exception as e:
-         raise HTTPException(detail=f"Unable to post chat request {agent_name}: {str(e)}", status_code=500)
\ No newline at end of file
+         raise HTTPException(detail=f"Unable to post chat request {agent_name}: {str(e)}", status_code=500)
+
+# Format one server-sent event
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# to stream the LLM response as server-sent events: a "token" event per piece of
+# content, then "done" with the whole message, or "error". When the client goes
+# away the LLM request is closed as well.
+@chat_router.post("/{agent_name}/stream")
+async def route_post_chat_stream(agent_name: str, request: Request, body: Dict[str, Any] = Body(...)) -> StreamingResponse:
+    started = time.perf_counter()
+    try:
+        verify_x_api_key(headers=request.headers)
+
+        if not agent_name:
+            raise HTTPException(status_code=400, detail="Agent name cannot be blank")
+
+        # retrieval happens before the stream starts, so its errors are plain HTTP errors
+        lookup, messages, response_length, token_usage = await _prepare_chat(agent_name, body)
+
+    except Exception as e:
+         raise HTTPException(detail=f"Unable to post chat request {agent_name}: {str(e)}", status_code=500)
+
+    # a cached answer is sent as a single token
+    async def cached_events() -> AsyncIterator[str]:
+        CHAT_FIRST_TOKEN_SECONDS.labels().observe(time.perf_counter() - started)
+        CHAT_STREAMS.labels("done").inc()
+        yield _sse("token", {"content": lookup.answer})
+        yield _sse("done", {"content": lookup.answer, "role": "assistant", "tokens": None, "cached": True})
+
+    async def events() -> AsyncIterator[str]:
+        tokens = stream_prompt_vllm(messages=messages, response_length=response_length)
+        content: List[str] = []
+        outcome = "disconnected"
+        try:
+            async for token in tokens:
+                if not content:
+                    CHAT_FIRST_TOKEN_SECONDS.labels().observe(time.perf_counter() - started)
+                content.append(token)
+                yield _sse("token", {"content": token})
+                # servers that do not cancel the stream on disconnect are caught here
+                if await request.is_disconnected():
+                    return
+            outcome = "done"
+            if lookup is not None:
+                answer_cache.put(lookup, "".join(content))
+            yield _sse("done", {"content": "".join(content), "role": "assistant", "tokens": token_usage, "cached": False})
+        except Exception as e:
+            outcome = "error"
+            logger.error(f"Chat stream of {agent_name} failed: {str(e)}")
+            detail = str(e.detail) if isinstance(e, HTTPException) else str(e)
+            yield _sse("error", {"detail": detail if settings.debug else "Unable to complete chat request"})
+        finally:
+            CHAT_STREAMS.labels(outcome).inc()
+            # close the LLM request if the client went away mid-stream
+            await tokens.aclose()
+
+    return StreamingResponse(
+        cached_events() if lookup is not None and lookup.answer is not None else events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # let nginx pass each event on instead of buffering the response
+            "X-Accel-Buffering": "no",
+        })
@@ -35,11 +35,36 @@ class Settings:
         # embeddings-server info
         self.embeddings_server = os.getenv("EMBEDDINGS_SERVER", "embeddings-server")
         self.embeddings_server_port = self._get_env_int("EMBEDDINGS_SERVER_PORT", 8002) # port used by the embeddings-server
+        self.embeddings_connect_timeout = self._get_env_float("EMBEDDINGS_CONNECT_TIMEOUT", 5.0)
+        # seconds a chat waits for the chunks of its prompt
+        self.embeddings_query_timeout = self._get_env_float("EMBEDDINGS_QUERY_TIMEOUT", 30.0)
+
+        # embeddings jobs: rebuilds running at once across all workers, seconds a rebuild may take,
+        # seconds a running job's lease lasts without renewal (its worker renews it every third of it),
+        # attempts before a job fails, backoff between attempts and the queue poll interval
+        self.embeddings_job_concurrency = self._get_env_int("EMBEDDINGS_JOB_CONCURRENCY", 1)
+        self.embeddings_job_timeout = self._get_env_int("EMBEDDINGS_JOB_TIMEOUT", 3600)
+        self.embeddings_job_lease = max(self._get_env_int("EMBEDDINGS_JOB_LEASE", 60), 3)
+        self.embeddings_job_max_attempts = self._get_env_int("EMBEDDINGS_JOB_MAX_ATTEMPTS", 5)
+        self.embeddings_job_retry_base = self._get_env_int("EMBEDDINGS_JOB_RETRY_BASE", 10)
+        self.embeddings_job_retry_max = self._get_env_int("EMBEDDINGS_JOB_RETRY_MAX", 600)
+        self.embeddings_job_poll_interval = self._get_env_float("EMBEDDINGS_JOB_POLL_INTERVAL", 1.0)
 
         # llm-server info
         self.llm_server = os.getenv("LLM_SERVER", "llm-server")
         self.llm_server_port = self._get_env_int("LLM_SERVER_PORT", 8000) # port used by the llm-server
         self.llm_model_name = os.getenv("LLM_MODEL_NAME", "microsoft/Phi-3-mini-4k-instruct")
+        # tokenizer used to fit chat prompts in the input budget (defaults to the LLM's own)
+        self.llm_tokenizer_name = os.getenv("LLM_TOKENIZER_NAME", "").strip() or self.llm_model_name
+        # seconds to connect to the llm-server and to wait for a completion
+        self.llm_connect_timeout = self._get_env_float("LLM_CONNECT_TIMEOUT", 5.0)
+        self.llm_timeout = self._get_env_float("LLM_TIMEOUT", 600.0)
+
+        # Calls to the embeddings and llm servers share one keep-alive client per worker:
+        # max open connections, idle connections kept, and seconds an idle connection is kept
+        self.http_max_connections = self._get_env_int("HTTP_MAX_CONNECTIONS", 100)
+        self.http_max_keepalive_connections = self._get_env_int("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)
+        self.http_keepalive_expiry = self._get_env_float("HTTP_KEEPALIVE_EXPIRY", 30.0)
         
         # chat params
         self.chat_response_length_default = os.getenv("CHAT_RESPONSE_LENGTH_DEFAULT", "M")
@@ -51,6 +76,16 @@ class Settings:
         self.chat_top_p = self._get_env_float("CHAT_TOP_P", 0.9)
         self.chat_frequency_penalty = self._get_env_float("CHAT_FREQUENCY_PENALTY", 0.0)  # Values from 0.0 to 2.0
         self.chat_presence_penalty = self._get_env_float("CHAT_PRESENCE_PENALTY", 0.0)
+        # Prompt tokens sent to the LLM at most; leave room for the response within its context.
+        # The instruction and the question always go in, then the newest CHAT_RECENT_TURNS history
+        # entries, then the retrieved chunks best first, then older history while tokens remain
+        self.max_input_tokens = self._get_env_int("MAX_INPUT_TOKENS", 3072)
+        self.chat_recent_turns = self._get_env_int("CHAT_RECENT_TURNS", 2)
+        # Answers of chat turns without history kept per worker and reused for the same
+        # prompt to the same agent version, or one at least ANSWER_CACHE_SIMILARITY
+        # cosine-similar to it (0 = disabled)
+        self.answer_cache_size = self._get_env_int("ANSWER_CACHE_SIZE", 0)
+        self.answer_cache_similarity = self._get_env_float("ANSWER_CACHE_SIMILARITY", 0.95)
 
         # Allowed hosts handling
         allowed_hosts_str = os.getenv("ALLOWED_HOSTS", "")
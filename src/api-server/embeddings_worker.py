@@ -0,0 +1,102 @@
+# embeddings_worker.py
+
+# Background worker that runs the queued embeddings jobs against the
+# embeddings-server. Every uvicorn worker runs one; the jobs table keeps the
+# concurrency limit global and lets only one job per agent run at a time.
+
+import asyncio
+from typing import Any, Dict, Optional
+
+from config import settings
+from jobs import (
+    claim_embeddings_job,
+    complete_embeddings_job,
+    fail_embeddings_job,
+    has_open_embeddings_job,
+    renew_embeddings_job_lease,
+    requeue_embeddings_job,
+)
+from agent import update_agent_embeddings_status, EMBEDDINGS_FAILED
+from answer_cache import answer_cache
+from utils import logger, post_embeddings_generation, EmbeddingsServerBusy
+
+# Seconds to wait before the next attempt of a failed job
+def _retry_delay(attempts: int, retry_after: Optional[int] = None) -> int:
+    delay = settings.embeddings_job_retry_base * (2 ** max(attempts - 1, 0))
+    if retry_after:
+        delay = max(delay, retry_after)
+    return min(delay, settings.embeddings_job_retry_max)
+
+# Renew the lease of a running job until cancelled
+async def _keep_lease(job_id: int) -> None:
+    while True:
+        await asyncio.sleep(settings.embeddings_job_lease / 3)
+        try:
+            await asyncio.to_thread(renew_embeddings_job_lease, job_id)
+        except Exception as e:
+            logger.error(f"Lease of embeddings job {job_id} not renewed: {str(e)}")
+
+# Run one claimed job and record its outcome. A job interrupted by a shutdown
+# goes back to the queue so the next start picks it up right away.
+async def _run_job(job: Dict[str, Any]) -> None:
+    job_id, agent_name, attempts = job["id"], job["agent_name"], job["attempts"]
+    retry_after: Optional[int] = None
+    failed = False
+    lease = asyncio.create_task(_keep_lease(job_id))
+    try:
+        logger.debug(f"Running embeddings job {job_id} for agent: {agent_name} (attempt {attempts})")
+        await post_embeddings_generation(agent_name)
+        await asyncio.to_thread(complete_embeddings_job, job_id)
+    except asyncio.CancelledError:
+        logger.info(f"Embeddings job {job_id} for {agent_name} interrupted, requeued")
+        # runs inline: the event loop is shutting down
+        requeue_embeddings_job(job_id)
+        raise
+    except Exception as e:
+        if isinstance(e, EmbeddingsServerBusy):
+            retry_after = e.retry_after
+        if attempts < settings.embeddings_job_max_attempts:
+            delay = _retry_delay(attempts, retry_after)
+            logger.error(f"Embeddings job {job_id} for {agent_name} failed, retrying in {delay}s: {str(e)}")
+            await asyncio.to_thread(fail_embeddings_job, job_id, str(e), delay)
+            return
+        logger.error(f"Embeddings job {job_id} for {agent_name} failed: {str(e)}")
+        await asyncio.to_thread(fail_embeddings_job, job_id, str(e))
+        failed = True
+    finally:
+        lease.cancel()
+
+    # set the final status once nothing else is queued for the agent: cleared
+    # after a successful build, EMBEDDINGS_FAILED after the last failed attempt
+    try:
+        if not await asyncio.to_thread(has_open_embeddings_job, agent_name):
+            await asyncio.to_thread(update_agent_embeddings_status, agent_name, EMBEDDINGS_FAILED if failed else "")
+            # answers cached from the previous index are no longer valid
+            answer_cache.invalidate(agent_name)
+    except Exception as e:
+        # the agent may have been deleted in the meantime
+        logger.debug(f"Embeddings status of {agent_name} not updated: {str(e)}")
+
+# Poll the queue and start jobs as long as the concurrency limit allows. When
+# cancelled, the running jobs are cancelled (and requeued) before returning.
+async def run_embeddings_worker() -> None:
+    running = set()
+    try:
+        while True:
+            try:
+                job = await asyncio.to_thread(claim_embeddings_job)
+            except Exception as e:
+                logger.error(f"Embeddings worker could not claim a job: {str(e)}")
+                job = None
+
+            if job is None:
+                await asyncio.sleep(settings.embeddings_job_poll_interval)
+                continue
+
+            task = asyncio.create_task(_run_job(job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    finally:
+        for task in list(running):
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
@@ -0,0 +1,81 @@
+# http_client.py
+
+# One keep-alive httpx.AsyncClient shared by all calls to the embeddings and
+# LLM servers of a worker process. It is opened at app startup and closed at
+# shutdown; connections are pooled up to HTTP_MAX_CONNECTIONS. Each call passes
+# its own timeout and is counted in the upstream metrics.
+
+import time
+import asyncio
+import httpx
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+from config import settings
+from metrics import UPSTREAM_REQUESTS, UPSTREAM_SECONDS
+
+_client: Optional[httpx.AsyncClient] = None
+
+# Open the shared client
+def start_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+                keepalive_expiry=settings.http_keepalive_expiry),
+            timeout=httpx.Timeout(settings.embeddings_query_timeout, connect=settings.embeddings_connect_timeout))
+    return _client
+
+# Close the shared client and its connections
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+# The shared client, opened on first use outside the app (e.g. in scripts)
+def get_http_client() -> httpx.AsyncClient:
+    return _client if _client is not None else start_http_client()
+
+# Timeout of a call: connect within connect seconds, and wait at most read seconds for data
+def call_timeout(connect: float, read: float) -> httpx.Timeout:
+    return httpx.Timeout(read, connect=connect)
+
+# POST JSON to a service through the shared client, recording the outcome and duration
+async def post_json(service: str, operation: str, url: str, timeout: httpx.Timeout, **kwargs: Any) -> httpx.Response:
+    started = time.perf_counter()
+    try:
+        response = await get_http_client().post(url, timeout=timeout, **kwargs)
+    except httpx.TimeoutException:
+        UPSTREAM_REQUESTS.labels(service, operation, "timeout").inc()
+        raise
+    except httpx.HTTPError:
+        UPSTREAM_REQUESTS.labels(service, operation, "error").inc()
+        raise
+    finally:
+        UPSTREAM_SECONDS.labels(service, operation).observe(time.perf_counter() - started)
+    UPSTREAM_REQUESTS.labels(service, operation, str(response.status_code)).inc()
+    return response
+
+# POST JSON to a service and stream the response body. The call is counted when
+# the stream ends; "cancelled" when the caller stopped reading, which closes the
+# upstream connection so the service can stop its work.
+@asynccontextmanager
+async def stream_json(service: str, operation: str, url: str, timeout: httpx.Timeout, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        async with get_http_client().stream("POST", url, timeout=timeout, **kwargs) as response:
+            outcome = str(response.status_code)
+            yield response
+    except httpx.TimeoutException:
+        outcome = "timeout"
+        raise
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "cancelled"
+        raise
+    finally:
+        UPSTREAM_REQUESTS.labels(service, operation, outcome).inc()
+        UPSTREAM_SECONDS.labels(service, operation).observe(time.perf_counter() - started)
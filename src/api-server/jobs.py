@@ -0,0 +1,258 @@
+# jobs.py
+
+# Durable queue of embeddings generation jobs, kept in the same sqlite
+# database as the agents. Job states: pending, running, done, failed, cancelled.
+# A running job holds a lease that its worker renews while it runs; a job whose
+# lease ran out belongs to a worker that died and is claimed again.
+
+import time
+import sqlite3
+from sqlite3 import Connection, Cursor
+from typing import Any, Dict, Optional, Tuple
+
+from exceptions import DatabaseException
+from config import settings
+
+# Get a database connection and cursor. Ensures the jobs table is created if it does not exist.
+def _get_db_connection() -> Tuple[Connection, Cursor]:
+    try:
+        # autocommit mode so the claim transactions below are explicit
+        conn = sqlite3.connect(settings.database_url, timeout=30, isolation_level=None)
+        cursor = conn.cursor()
+        _create_table(cursor=cursor)
+        return conn, cursor
+    except sqlite3.Error as e:
+        raise DatabaseException(detail=f"Database connection error: {str(e)}")
+
+# Create the embeddings_jobs table if it does not exist.
+def _create_table(cursor: Cursor) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS embeddings_jobs (
+            id INTEGER PRIMARY KEY,
+            agent_name TEXT,
+            state TEXT DEFAULT "pending",
+            attempts INTEGER DEFAULT 0,
+            requests INTEGER DEFAULT 1,
+            error TEXT DEFAULT "",
+            next_run_on INTEGER,
+            created_on INTEGER,
+            started_on INTEGER,
+            finished_on INTEGER,
+            updated_on INTEGER,
+            lease_until INTEGER
+        )
+        """
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_jobs_agent ON embeddings_jobs (agent_name, state)")
+    # tables created before leases were added
+    cursor.execute("PRAGMA table_info(embeddings_jobs)")
+    if "lease_until" not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE embeddings_jobs ADD COLUMN lease_until INTEGER")
+
+# Convert a row from the database to a dictionary.
+def row_to_dict(cursor: Cursor, row: tuple) -> Dict[str, Any]:
+    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+
+# Queue a job for an agent. A job already pending for the agent absorbs the
+# request, so several quick edits lead to a single rebuild.
+def enqueue_embeddings_job(agent_name: str) -> Dict[str, Any]:
+    conn, cursor = None, None
+    try:
+        conn, cursor = _get_db_connection()
+        now = int(time.time())
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT id FROM embeddings_jobs WHERE agent_name = ? AND state = 'pending' ORDER BY id LIMIT 1", (agent_name,))
+        row = cursor.fetchone()
+        if row:
+            job_id = row[0]
+            cursor.execute("UPDATE embeddings_jobs SET requests = requests + 1, updated_on = ? WHERE id = ?", (now, job_id))
+        else:
+            cursor.execute(
+                """
+                INSERT INTO embeddings_jobs (agent_name, state, next_run_on, created_on, updated_on)
+                VALUES (?, 'pending', ?, ?, ?)
+                """,
+                (agent_name, now, now, now),
+            )
+            job_id = cursor.lastrowid
+        cursor.execute("COMMIT")
+
+        cursor.execute("SELECT * FROM embeddings_jobs WHERE id = ?", (job_id,))
+        return row_to_dict(cursor=cursor, row=cursor.fetchone())
+    except sqlite3.Error as e:
+        raise DatabaseException(detail=f"Embeddings job could not be queued for {agent_name}: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+# Claim the next due job, or return None if there is none or the global
+# concurrency limit is reached. Only one job per agent runs at a time.
+def claim_embeddings_job() -> Optional[Dict[str, Any]]:
+    conn, cursor = None, None
+    try:
+        conn, cursor = _get_db_connection()
+        now = int(time.time())
+        cursor.execute("BEGIN IMMEDIATE")
+
+        # jobs left running by a crashed process (lease expired) or overrunning the timeout are retried
+        cursor.execute(
+            """
+            UPDATE embeddings_jobs SET state = 'pending', next_run_on = ?, lease_until = NULL, updated_on = ?
+            WHERE state = 'running' AND (COALESCE(lease_until, 0) < ? OR started_on < ?)
+            """,
+            (now, now, now, now - settings.embeddings_job_timeout),
+        )
+
+        cursor.execute("SELECT COUNT(1) FROM embeddings_jobs WHERE state = 'running'")
+        if cursor.fetchone()[0] >= settings.embeddings_job_concurrency:
+            cursor.execute("COMMIT")
+            return None
+
+        cursor.execute(
+            """
+            SELECT id FROM embeddings_jobs
+            WHERE state = 'pending' AND next_run_on <= ?
+              AND agent_name NOT IN (SELECT agent_name FROM embeddings_jobs WHERE state = 'running')
+            ORDER BY next_run_on, id
+            LIMIT 1
+            """,
+            (now,),
+        )
+        row = cursor.fetchone()
+        if not row:
+            cursor.execute("COMMIT")
+            return None
+
+        job_id = row[0]
+        cursor.execute(
+            "UPDATE embeddings_jobs SET state = 'running', attempts = attempts + 1, started_on = ?, lease_until = ?, updated_on = ? WHERE id = ?",
+            (now, now + settings.embeddings_job_lease, now, job_id),
+        )
+        cursor.execute("COMMIT")
+
+        cursor.execute("SELECT * FROM embeddings_jobs WHERE id = ?", (job_id,))
+        return row_to_dict(cursor=cursor, row=cursor.fetchone())
+    except sqlite3.Error as e:
+        raise DatabaseException(detail=f"Embeddings job could not be claimed: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+# Extend the lease of a running job; False if the job is no longer running
+def renew_embeddings_job_lease(job_id: int) -> bool:
+    conn, cursor = None, None
+    try:
+        conn, cursor = _get_db_connection()
+        now = int(time.time())
+        cursor.execute(
+            "UPDATE embeddings_jobs SET lease_until = ?, updated_on = ? WHERE id = ? AND state = 'running'",
+            (now + settings.embeddings_job_lease, now, job_id),
+        )
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        raise DatabaseException(detail=f"Lease of embeddings job {job_id} could not be renewed: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+# Put a running job back in the queue to run right away, without counting the
+# attempt; used for jobs interrupted by a shutdown
+def requeue_embeddings_job(job_id: int) -> None:
+    conn, cursor = None, None
+    try:
+        conn, cursor = _get_db_connection()
+        now = int(time.time())
+        cursor.execute(
+            """
+            UPDATE embeddings_jobs SET state = 'pending', attempts = MAX(attempts - 1, 0), next_run_on = ?, lease_until = NULL, updated_on = ?
+            WHERE id = ? AND state = 'running'
+            """,
+            (now, now, job_id),
+        )
+    except sqlite3.Error as e:
+        raise DatabaseException(detail=f"Embeddings job {job_id} could not be requeued: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+# Mark a running job as done
+def complete_embeddings_job(job_id: int) -> None:
+    _finish_job(job_id=job_id, state="done", error="")
+
+# Put a failed job back in the queue after retry_in seconds, or mark it failed
+def fail_embeddings_job(job_id: int, error: str, retry_in: Optional[int] = None) -> None:
+    if retry_in is None:
+        _finish_job(job_id=job_id, state="failed", error=error)
+        return
+    conn, cursor = None, None
+    try:
+        conn, cursor = _get_db_connection()
+        now = int(time.time())
+        cursor.execute(
+            "UPDATE embeddings_jobs SET state = 'pending', error = ?, next_run_on = ?, lease_until = NULL, updated_on = ? WHERE id = ? AND state = 'running'",
+            (error, now + retry_in, now, job_id),
+        )
+    except sqlite3.Error as e:
+        raise DatabaseException(detail=f"Embeddings job {job_id} could not be rescheduled: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+# Cancel the jobs of an agent that have not started yet
+def cancel_embeddings_jobs(agent_name: str) -> None:
+    conn, cursor = None, None
+    try:
+        conn, cursor = _get_db_connection()
+        now = int(time.time())
+        cursor.execute(
+            "UPDATE embeddings_jobs SET state = 'cancelled', finished_on = ?, updated_on = ? WHERE agent_name = ? AND state = 'pending'",
+            (now, now, agent_name),
+        )
+    except sqlite3.Error as e:
+        raise DatabaseException(detail=f"Embeddings jobs of {agent_name} could not be cancelled: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+# Get the latest job of an agent, or None if it never had one
+def get_latest_embeddings_job(agent_name: str) -> Optional[Dict[str, Any]]:
+    conn, cursor = None, None
+    try:
+        conn, cursor = _get_db_connection()
+        cursor.execute("SELECT * FROM embeddings_jobs WHERE agent_name = ? ORDER BY id DESC LIMIT 1", (agent_name,))
+        row = cursor.fetchone()
+        return row_to_dict(cursor=cursor, row=row) if row else None
+    except sqlite3.Error as e:
+        raise DatabaseException(detail=f"Error in retrieving embeddings job of {agent_name}: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+# Whether an agent still has a job waiting or running
+def has_open_embeddings_job(agent_name: str) -> bool:
+    conn, cursor = None, None
+    try:
+        conn, cursor = _get_db_connection()
+        cursor.execute("SELECT COUNT(1) FROM embeddings_jobs WHERE agent_name = ? AND state IN ('pending', 'running')", (agent_name,))
+        return cursor.fetchone()[0] > 0
+    except sqlite3.Error as e:
+        raise DatabaseException(detail=f"Error in checking embeddings jobs of {agent_name}: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+def _finish_job(job_id: int, state: str, error: str) -> None:
+    conn, cursor = None, None
+    try:
+        conn, cursor = _get_db_connection()
+        now = int(time.time())
+        cursor.execute(
+            "UPDATE embeddings_jobs SET state = ?, error = ?, finished_on = ?, lease_until = NULL, updated_on = ? WHERE id = ?",
+            (state, error, now, now, job_id),
+        )
+    except sqlite3.Error as e:
+        raise DatabaseException(detail=f"Embeddings job {job_id} could not be updated: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
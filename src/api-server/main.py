@@ -1,8 +1,9 @@
 # main.py
 
+import asyncio
 from fastapi import FastAPI, Request
 from fastapi import HTTPException as FastAPIHttpException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
@@ -20,6 +21,11 @@ from exceptions import (
 )
 from config import settings
 from utils import logger
+from embeddings_worker import run_embeddings_worker
+from http_client import start_http_client, close_http_client
+from metrics import Gauge, render_metrics
+from answer_cache import answer_cache
+from tokens import get_tokenizer
 
 # Initialize the FastAPI app
 app = FastAPI()
@@ -34,10 +40,33 @@ app = FastAPI()
 #     allow_headers=["*"],
 # )
 
+# Run the embeddings jobs queued by agent edits in the background
+@app.on_event("startup")
+async def startup() -> None:
+    # one pooled client for all calls to the embeddings and llm servers
+    start_http_client()
+    # load the tokenizer used to fit prompts in MAX_INPUT_TOKENS before the first chat
+    await asyncio.to_thread(get_tokenizer)
+    app.state.embeddings_worker = asyncio.create_task(run_embeddings_worker())
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    # running embeddings jobs are requeued before the worker returns
+    app.state.embeddings_worker.cancel()
+    await asyncio.gather(app.state.embeddings_worker, return_exceptions=True)
+    await close_http_client()
+
 @app.get("/health")
 async def health_check():
     return {"status": "OK"}
 
+# Prometheus metrics of this worker process
+Gauge("sia_answer_cache_entries", "Chat answers held in the answer cache", callback=lambda: {(): len(answer_cache)})
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # Include the routers for modular routes
 app.include_router(router=auth_router, prefix="/api/auth")
 app.include_router(router=agent_router, prefix="/api/agents")
@@ -0,0 +1,54 @@
+# tokens.py
+
+# Token counting for prompt assembly, with the tokenizer of the LLM read from
+# <models>/<LLM_TOKENIZER_NAME>/tokenizer.json (fetched by the model-downloader).
+# The tokenizer is loaded once per process; without it tokens are estimated at
+# one per four characters.
+
+import os
+import threading
+from typing import List, Optional
+
+from config import settings
+from utils import logger
+
+# characters per token of the estimate used without a tokenizer
+CHARS_PER_TOKEN = 4
+
+_tokenizer_lock = threading.Lock()
+_tokenizer = None
+_tokenizer_checked = False
+
+# The LLM tokenizer, or None if it is not available
+def get_tokenizer() -> Optional[object]:
+    global _tokenizer, _tokenizer_checked
+    if _tokenizer_checked:
+        return _tokenizer
+    with _tokenizer_lock:
+        # another thread may have loaded it while we waited
+        if not _tokenizer_checked:
+            path = os.path.join(settings.models_dir, settings.llm_tokenizer_name, "tokenizer.json")
+            try:
+                from tokenizers import Tokenizer
+                _tokenizer = Tokenizer.from_file(path)
+                # count whole texts, whatever the file configures for model inputs
+                _tokenizer.no_truncation()
+                _tokenizer.no_padding()
+                logger.debug(f"Loaded LLM tokenizer from {path}")
+            except Exception as e:
+                logger.info(f"LLM tokenizer not loaded ({str(e)}), estimating tokens from characters")
+            _tokenizer_checked = True
+    return _tokenizer
+
+# Name of the way tokens are counted, for reports
+def tokenizer_name() -> str:
+    return settings.llm_tokenizer_name if get_tokenizer() is not None else "estimate"
+
+# Token counts of several texts, without special tokens
+def count_tokens(texts: List[str]) -> List[int]:
+    tokenizer = get_tokenizer()
+    if not texts:
+        return []
+    if tokenizer is None:
+        return [-(-len(text) // CHARS_PER_TOKEN) for text in texts]
+    return [len(encoding.ids) for encoding in tokenizer.encode_batch(texts, add_special_tokens=False)]
@@ -7,12 +7,13 @@
 import os
 import shutil
 import re
-import requests
-import threading
+import httpx
 import logging
 from config import settings
-from typing import List, Any
+from typing import List, Any, Dict, Optional, Tuple
 from exceptions import FileStorageException, ExternalServiceException
+from jobs import enqueue_embeddings_job
+from http_client import call_timeout, post_json
 # Setup logger configuration
 def setup_logger() -> logging.Logger:
     # Set up the logging configuration based on the DEBUG mode in environment.
@@ -138,21 +139,38 @@ def process_uploaded_files(agent_name: str, new_files: List[Any] = [], deleted_f
     except Exception as e:
         raise FileStorageException(detail=f"Error processing files of {agent_name}: {str(e)}")
 
-# Trigger embeddings generation asynchronously
-def trigger_embeddings_generation(agent_name: str) -> None:
-    def generate_embeddings_task():
-        try:
-            logger.debug(f"Triggering embeddings generation for agent: {agent_name}")
-
-            # set the url, headers
-            url = f"http://{settings.embeddings_server}:{settings.embeddings_server_port}/generate"
-            headers = {settings.header_name: settings.header_key}
-            requests.post(url, json={"agent_name": agent_name}, headers=headers)
-        except Exception as e:
-            raise ExternalServiceException(detail=f"Failed to trigger embeddings generation for {agent_name}")
-
-    # Run the task in a separate thread
-    threading.Thread(target=generate_embeddings_task).start()
+# Raised when the embeddings server is at capacity and asks to retry later
+class EmbeddingsServerBusy(ExternalServiceException):
+    def __init__(self, detail: str = "Embeddings server busy", retry_after: Optional[int] = None):
+        super().__init__(detail=detail, status_code=503)
+        self.retry_after = retry_after
+
+# Queue embeddings generation; the embeddings worker runs the job in the background
+def trigger_embeddings_generation(agent_name: str) -> Dict[str, Any]:
+    logger.debug(f"Queueing embeddings generation for agent: {agent_name}")
+    return enqueue_embeddings_job(agent_name=agent_name)
+
+# Ask the embeddings server to (re)build the embeddings of an agent and wait for it
+async def post_embeddings_generation(agent_name: str) -> None:
+    # set the url, headers
+    url = f"http://{settings.embeddings_server}:{settings.embeddings_server_port}/generate"
+    headers = {settings.header_name: settings.header_key}
+    try:
+        response = await post_json(
+            "embeddings", "generate", url,
+            timeout=call_timeout(settings.embeddings_connect_timeout, settings.embeddings_job_timeout),
+            json={"agent_name": agent_name},
+            headers=headers)
+    except httpx.HTTPError as e:
+        raise ExternalServiceException(detail=f"Failed to generate embeddings for {agent_name}: {str(e)}")
+
+    if response.status_code in (429, 503):
+        retry_after = response.headers.get("Retry-After", "")
+        raise EmbeddingsServerBusy(
+            detail=f"Embeddings server busy for {agent_name}",
+            retry_after=int(retry_after) if retry_after.isdigit() else None)
+    if response.status_code != 200:
+        raise ExternalServiceException(detail=f"Failed to generate embeddings for {agent_name}: {response.status_code} {response.text}")
 
 # Delete all files of an agent and its directory
 def delete_agent_files(agent_name: str) -> None:
@@ -163,21 +181,26 @@ def delete_agent_files(agent_name: str) -> None:
     if os.path.exists(agent_dir):
         shutil.rmtree(agent_dir)
 
-# Query embeddings from the embeddings server
-def query_embeddings(agent_name: str) -> List[Any]:
+# Query the chunks of an agent relevant to a prompt from the embeddings server
+async def query_embeddings(agent_name: str, prompt: str, include_embedding: bool = False) -> Tuple[List[Any], Optional[List[float]]]:
     try:
         url = f"http://{settings.embeddings_server}:{settings.embeddings_server_port}/query"
-        headers = {
-            "X-Requested-With": "XteNATqxnbBkPa6TCHcK0NTxOM1JVkQl"
-        }
+        headers = {settings.header_name: settings.header_key}
+        body: Dict[str, Any] = {"agent_name": agent_name, "prompt": prompt}
+        if include_embedding:
+            body["include_embedding"] = True
 
         # Get the response
-        response = requests.post(url, json={"agent_name": agent_name, "prompt": ""}, headers=headers)
-        #response.raise_for_status()
+        response = await post_json(
+            "embeddings", "query", url,
+            timeout=call_timeout(settings.embeddings_connect_timeout, settings.embeddings_query_timeout),
+            json=body,
+            headers=headers)
+        response.raise_for_status()
         response_json = response.json()
-        # Pick the document chunks
+        # Pick the document chunks, and the prompt's embedding if it was asked for and computed
         document_chunks = response_json.get('results', [])
-        return document_chunks
+        return document_chunks, response_json.get('embedding')
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise ExternalServiceException(detail=f"Error querying embeddings for agent {agent_name}: {str(e)}")
@@ -0,0 +1,123 @@
+# batcher.py
+
+# Coalesces concurrent query embeddings into a single batched forward pass.
+# Requests wait at most max_wait_ms for others to join, and a batch never
+# grows beyond max_batch_size. While one batch is encoding, new requests
+# queue up and form the next batch. Encoding runs on a dedicated thread, and
+# once max_pending prompts are waiting new ones are rejected with ExecutorBusy.
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from metrics import EMBED_BATCH_SIZE, QUERY_QUEUE_WAIT_MS
+from executors import ExecutorBusy
+
+class EmbeddingBatcher:
+    def __init__(self, encode: Callable[[List[str]], List[List[float]]], max_batch_size: int = 32, max_wait_ms: float = 5.0, max_pending: int = 0, retry_after: int = 1) -> None:
+        self.encode = encode
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait = max(max_wait_ms, 0.0) / 1000.0
+        # 0 means unbounded
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+        # histograms used to tune the max wait and max batch size, also on /metrics
+        self.batch_sizes = EMBED_BATCH_SIZE.labels("query")
+        self.queue_wait_ms = QUERY_QUEUE_WAIT_MS.labels()
+
+        self._pending: List[Tuple[str, asyncio.Future, float]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # Start the background loop on the running event loop
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    # Stop the background loop and fail any request still waiting
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for _, future, _ in self._pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Embedding batcher stopped"))
+        self._pending = []
+
+    # Embed one text, sharing the forward pass with concurrent callers
+    async def embed(self, text: str) -> List[float]:
+        self.start()
+        if self.max_pending and len(self._pending) >= self.max_pending:
+            raise ExecutorBusy("embed", self.retry_after)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch_size:
+            self._full.set()
+        self._wakeup.set()
+        return await future
+
+    # Return the batch size and queue wait histograms
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "pending": len(self._pending),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+
+            # give concurrent requests a few ms to join unless the batch is already full
+            if len(self._pending) < self.max_batch_size and self.max_wait > 0:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            if self._pending:
+                self._wakeup.set()
+
+            # skip callers that went away while waiting
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_wait_ms.observe((started - enqueued) * 1000.0)
+            self.batch_sizes.observe(len(batch))
+
+            try:
+                vectors = await loop.run_in_executor(self._executor, self.encode, [text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future, _), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
@@ -0,0 +1,11 @@
+# benchmarks
+
+# Benchmarks for the embeddings-server. Run from the embeddings-server
+# directory, e.g. `python -m benchmarks.rerank`, or `python -m benchmarks` for
+# the ingest and query suite. They run offline: models are read from the
+# models dir and the Hugging Face hub is never contacted.
+
+import os
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
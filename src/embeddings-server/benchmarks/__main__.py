@@ -0,0 +1,108 @@
+# benchmarks/__main__.py
+
+# Ingest and query benchmarks in one run, written as JSON tagged with the git
+# commit and the settings that shape the results, so runs on different commits
+# can be compared. Everything runs offline against the local model.
+#
+#   python -m benchmarks [--files 100,1000] [--concurrency 1,4,16] [--requests 400] [--output results.json] [--compare old.json]
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from typing import Optional
+
+from config import settings
+from benchmarks import ingest, query
+
+# metrics compared by --compare, and whether higher is better
+COMPARED = {
+    "ingest": {"key": "files", "metrics": {"files_per_sec": True, "chunks_per_sec": True, "peak_rss_mb": False}},
+    "query": {"key": "concurrency", "metrics": {"qps": True, "p50_ms": False, "p95_ms": False, "p99_ms": False}},
+}
+
+# Commit of the working tree, and whether it has uncommitted changes
+def git_revision() -> dict:
+    def git(*args: str) -> Optional[str]:
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "embedding_model": settings.embedding_model_name,
+        "embedding_backend": settings.embedding_backend,
+        "vector_store": settings.vector_store,
+        "retrieval_strategy": settings.retrieval_strategy,
+        "chunk_size": settings.chunk_size,
+        "no_workers": settings.no_workers,
+    }
+
+# Print the change of each compared metric between two result files
+def compare(old: dict, new: dict) -> None:
+    print(f"comparing {str(old.get('commit'))[:12]} -> {str(new.get('commit'))[:12]}")
+    for section, spec in COMPARED.items():
+        previous = {r[spec["key"]]: r for r in old.get(section, [])}
+        for r in new.get(section, []):
+            before = previous.get(r[spec["key"]])
+            if before is None:
+                continue
+            for metric, higher_is_better in spec["metrics"].items():
+                if not before.get(metric):
+                    continue
+                change = r[metric] / before[metric] - 1
+                better = change > 0 if higher_is_better else change < 0
+                print(f"  {section} {spec['key']}={r[spec['key']]:<6} {metric:<15} {before[metric]:>10.2f} -> {r[metric]:>10.2f} "
+                      f"({change:+.1%}{'' if abs(change) < 0.05 else ', better' if better else ', worse'})")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest and query benchmarks, as JSON")
+    parser.add_argument("--files", default="100,1000", help="corpus sizes of the ingest runs")
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--model", default=os.path.join(settings.models_dir, settings.embedding_model_name))
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--query-files", type=int, default=100, help="corpus size of the query server")
+    parser.add_argument("--skip", choices=["ingest", "query"], help="leave out one of the benchmarks")
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.model):
+        sys.exit(f"Model not found at {args.model}; benchmarks run offline, download it first")
+
+    results = {**git_revision(), "started_on": int(time.time()), "environment": environment()}
+    if args.skip != "ingest":
+        sizes = [int(files) for files in args.files.split(",") if files.strip()]
+        results["ingest"] = ingest.run(sizes, args.paragraphs, args.model)
+        if args.output:
+            ingest.print_table(results["ingest"])
+    if args.skip != "query":
+        levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+        results["query"] = query.run(levels, args.requests, args.query_files, args.paragraphs)
+        if args.output:
+            query.print_table(results["query"])
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
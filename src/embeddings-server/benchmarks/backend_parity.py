@@ -0,0 +1,98 @@
+# benchmarks/backend_parity.py
+
+# Compares the embedding backends against the float PyTorch model on a sample
+# corpus: cosine drift of each embedding, recall@k of the nearest neighbours of
+# sample queries, single-query latency and batch throughput.
+#
+#   python -m benchmarks.backend_parity [--model <path>] [--backends onnx,onnx-int8] [--chunks 2000] [--queries 200] [--k 5] [--json]
+
+import os
+import json
+import time
+import random
+import argparse
+import numpy as np
+
+from config import settings
+from embedder import get_embedder
+from ranking import normalize_rows
+from benchmarks.corpus import paragraph
+
+# Embed texts and return the vectors and texts/sec
+def _embed(embedder, texts) -> tuple:
+    started = time.perf_counter()
+    vectors = np.asarray(embedder.embed(texts), dtype=np.float32)
+    return normalize_rows(vectors), len(texts) / (time.perf_counter() - started)
+
+# Latency of embedding one query at a time, in ms
+def _latency(embedder, queries) -> dict:
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        embedder.embed([query])
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return {"p50_ms": float(np.percentile(timings, 50)), "p95_ms": float(np.percentile(timings, 95))}
+
+def run(model_path: str, backends, chunks: int, queries: int, k: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    corpus = [paragraph(rng, sentences=rng.randint(2, 6)) for _ in range(chunks)]
+    sample_queries = [paragraph(rng, sentences=1) for _ in range(queries)]
+
+    # the float model is the reference
+    reference = get_embedder(model_path, "torch")
+    reference_corpus, reference_throughput = _embed(reference, corpus)
+    reference_queries, _ = _embed(reference, sample_queries)
+    reference_top = np.argsort(-(reference_queries @ reference_corpus.T), axis=1)[:, :k]
+
+    results = [{
+        "backend": "torch",
+        "cosine_drift_mean": 0.0,
+        "cosine_drift_max": 0.0,
+        f"recall@{k}": 1.0,
+        "texts_per_sec": reference_throughput,
+        **_latency(reference, sample_queries),
+    }]
+    for backend in backends:
+        embedder = get_embedder(model_path, backend)
+        backend_corpus, throughput = _embed(embedder, corpus)
+        backend_queries, _ = _embed(embedder, sample_queries)
+
+        # 1 - cosine similarity between the two embeddings of the same chunk
+        drift = np.clip(1.0 - np.sum(reference_corpus * backend_corpus, axis=1), 0.0, None)
+        backend_top = np.argsort(-(backend_queries @ backend_corpus.T), axis=1)[:, :k]
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(reference_top, backend_top)])
+
+        results.append({
+            "backend": backend,
+            "cosine_drift_mean": float(drift.mean()),
+            "cosine_drift_max": float(drift.max()),
+            f"recall@{k}": float(recall),
+            "texts_per_sec": throughput,
+            **_latency(embedder, sample_queries),
+        })
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Embedding backend parity and speed")
+    parser.add_argument("--model", default=os.path.join(settings.models_dir, settings.embedding_model_name))
+    parser.add_argument("--backends", default="onnx,onnx-int8")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip() and b.strip() != "torch"]
+    results = run(args.model, backends, args.chunks, args.queries, args.k)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    recall_key = f"recall@{args.k}"
+    print(f"{'backend':<10} {'drift mean':>11} {'drift max':>10} {recall_key:>9} {'texts/s':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for r in results:
+        print(f"{r['backend']:<10} {r['cosine_drift_mean']:>11.6f} {r['cosine_drift_max']:>10.6f} {r[recall_key]:>9.3f} "
+              f"{r['texts_per_sec']:>9.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
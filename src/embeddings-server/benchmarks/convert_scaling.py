@@ -0,0 +1,80 @@
+# benchmarks/convert_scaling.py
+
+# Throughput of the convert/clean/split stage of ingestion against the number
+# of worker processes (EMBEDDINGS_NO_WORKERS). Embedding is not included.
+#
+# The default corpus is multi-page PDFs (80 paragraphs, 10 pages each):
+# parsing them dominates, as in real ingests. Small text files convert in
+# milliseconds, so the cost of pickling their chunks back from the workers hides
+# any speedup; the server skips the pool for small ingests (INGEST_POOL_MIN_FILES).
+#
+#   python -m benchmarks.convert_scaling [--files 240] [--paragraphs 80] [--kinds pdf] [--workers 1,2,4,8] [--json]
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from chunker import _preprocess_file, _get_preprocessors
+from benchmarks.corpus import generate_corpus
+
+# Load the converters in a worker; the pause keeps it busy so each worker gets one call
+def _warm_worker(_: int) -> int:
+    _get_preprocessors()
+    time.sleep(0.5)
+    return os.getpid()
+
+# Preprocess every file with the given number of workers and return docs/sec
+def run_once(paths, workers: int) -> dict:
+    if workers <= 1:
+        started = time.perf_counter()
+        results = [_preprocess_file(path) for path in paths]
+        elapsed = time.perf_counter() - started
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            # start the workers and load the converters first so start-up is not counted
+            list(pool.map(_warm_worker, range(workers)))
+            started = time.perf_counter()
+            results = list(pool.map(_preprocess_file, paths, chunksize=4))
+            elapsed = time.perf_counter() - started
+    chunks = sum(len(documents) for documents, _ in results)
+    return {
+        "workers": workers,
+        "files": len(paths),
+        "chunks": chunks,
+        "seconds": elapsed,
+        "docs_per_sec": len(paths) / elapsed,
+    }
+
+def main() -> None:
+    cpus = os.cpu_count() or 1
+    default_workers = sorted({1, 2, 4, 8, 16, cpus} & set(range(1, cpus + 1)))
+    parser = argparse.ArgumentParser(description="Convert/clean/split throughput per worker count")
+    parser.add_argument("--files", type=int, default=240)
+    parser.add_argument("--paragraphs", type=int, default=80)
+    parser.add_argument("--kinds", default="pdf", help="file kinds of the corpus: txt, md, pdf")
+    parser.add_argument("--workers", default=",".join(str(w) for w in default_workers))
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dir:
+        kinds = tuple(kind.strip() for kind in args.kinds.split(",") if kind.strip())
+        paths = generate_corpus(dir, args.files, paragraphs=args.paragraphs, kinds=kinds)
+        results = [run_once(paths, int(w)) for w in args.workers.split(",") if w.strip()]
+
+    baseline = results[0]["docs_per_sec"] if results else 0
+    for r in results:
+        r["speedup"] = r["docs_per_sec"] / baseline if baseline else 0
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'workers':>7} {'files':>6} {'chunks':>7} {'docs/s':>9} {'speedup':>8}")
+    for r in results:
+        print(f"{r['workers']:>7} {r['files']:>6} {r['chunks']:>7} {r['docs_per_sec']:>9.1f} {r['speedup']:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/corpus.py
+
+# Synthetic text, markdown and PDF files for the ingestion benchmarks, generated
+# from a fixed seed so runs are comparable across commits.
+
+import os
+import random
+from typing import List, Tuple
+
+WORDS = (
+    "agent document retrieval embedding vector index query chunk model server "
+    "printer error network storage backup policy invoice customer order payment "
+    "release deploy config token latency cache worker process memory disk file"
+).split()
+
+# A paragraph of random sentences
+def paragraph(rng: random.Random, sentences: int = 6) -> str:
+    lines = []
+    for _ in range(sentences):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 18))]
+        lines.append(" ".join(words).capitalize() + ".")
+    return " ".join(lines)
+
+# Write a minimal single-font PDF with one text page per entry of pages
+def write_pdf(path: str, pages: List[List[str]]) -> None:
+    objects: List[bytes] = []
+    page_ids = [3 + 2 * i for i in range(len(pages))]
+    font_id = 3 + 2 * len(pages)
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    for page_id, lines in zip(page_ids, pages):
+        text = ["BT", "/F1 10 Tf", "12 TL", "40 800 Td"]
+        for line in lines:
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            text.append(f"({escaped}) Tj T*")
+        text.append("ET")
+        stream = "\n".join(text).encode("latin-1", "replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {page_id + 1} 0 R >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(output)
+
+# Generate count files cycling through kinds (txt, md and pdf), each about
+# paragraphs long. Returns the paths written.
+def generate_corpus(dir: str, count: int, paragraphs: int = 20, seed: int = 0, kinds: Tuple[str, ...] = ("txt", "md", "pdf")) -> List[str]:
+    rng = random.Random(seed)
+    os.makedirs(dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        path = os.path.join(dir, f"doc_{i:05d}.{kind}")
+        blocks = [paragraph(rng) for _ in range(paragraphs)]
+        if kind == "txt":
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(blocks))
+        elif kind == "md":
+            with open(path, "w", encoding="utf-8") as f:
+                for n, block in enumerate(blocks):
+                    f.write(f"## Section {n}\n\n{block}\n\n")
+        else:
+            # about 90 characters per line, 60 lines per page
+            lines = []
+            for block in blocks:
+                words = block.split()
+                for start in range(0, len(words), 14):
+                    lines.append(" ".join(words[start:start + 14]))
+                lines.append("")
+            write_pdf(path, [lines[start:start + 60] for start in range(0, len(lines), 60)])
+        paths.append(path)
+    return paths
@@ -0,0 +1,93 @@
+# benchmarks/ingest.py
+
+# End-to-end ingest throughput: chunk_files_in_dir over a synthetic corpus of
+# text, markdown and PDF files, embedding included. Each run happens in a fresh
+# process; the model is loaded before the clock starts. Peak RSS is the one the
+# run reports, preprocessing worker processes included.
+#
+#   python -m benchmarks.ingest [--files 100,1000] [--paragraphs 20] [--model <path>] [--json]
+
+import os
+import json
+import time
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from config import settings
+from benchmarks.corpus import generate_corpus
+
+AGENT_NAME = "bench"
+
+# Peak resident memory of this process in MB
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# Ingest a directory into a new store, in a worker process
+def _ingest(dir: str, model_path: str, store_path: str) -> dict:
+    from chunker import chunk_files_in_dir, shutdown_process_pool
+    from embedder import get_embedder
+
+    started = time.perf_counter()
+    get_embedder(model_path)
+    load_seconds = time.perf_counter() - started
+    rss_before = _peak_rss_mb()
+
+    started = time.perf_counter()
+    summary = chunk_files_in_dir(AGENT_NAME, dir, model_path, store_path, full=True)
+    elapsed = time.perf_counter() - started
+    shutdown_process_pool()
+    return {"summary": summary, "seconds": elapsed, "load_seconds": load_seconds,
+            "rss_after_load_mb": rss_before, "peak_rss_mb": summary["peak_rss_mb"]}
+
+def run_once(files: int, paragraphs: int, model_path: str, seed: int = 0) -> dict:
+    with tempfile.TemporaryDirectory() as root:
+        corpus_dir = os.path.join(root, "agent")
+        paths = generate_corpus(corpus_dir, files, paragraphs=paragraphs, seed=seed)
+        corpus_mb = sum(os.path.getsize(path) for path in paths) / (1024 * 1024)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            result = pool.submit(_ingest, corpus_dir, model_path, os.path.join(root, "store")).result()
+
+    summary = result["summary"]
+    seconds = result["seconds"]
+    return {
+        "files": files,
+        "corpus_mb": round(corpus_mb, 2),
+        "chunks": summary["chunks"],
+        "seconds": seconds,
+        "files_per_sec": files / seconds,
+        "chunks_per_sec": summary["chunks"] / seconds,
+        "model_load_seconds": result["load_seconds"],
+        "rss_after_load_mb": result["rss_after_load_mb"],
+        "peak_rss_mb": result["peak_rss_mb"],
+        "stage_seconds": summary["seconds"],
+        "embedding": summary["embedding"],
+    }
+
+def run(sizes, paragraphs: int, model_path: str) -> list:
+    return [run_once(files, paragraphs, model_path) for files in sizes]
+
+def print_table(results: list) -> None:
+    print(f"{'files':>6} {'MB':>7} {'chunks':>7} {'seconds':>8} {'files/s':>8} {'chunks/s':>9} {'peak RSS MB':>12}")
+    for r in results:
+        print(f"{r['files']:>6} {r['corpus_mb']:>7.1f} {r['chunks']:>7} {r['seconds']:>8.2f} {r['files_per_sec']:>8.1f} "
+              f"{r['chunks_per_sec']:>9.1f} {r['peak_rss_mb']:>12.0f}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest throughput and memory")
+    parser.add_argument("--files", default="100,1000")
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--model", default=os.path.join(settings.models_dir, settings.embedding_model_name))
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = run([int(files) for files in args.files.split(",") if files.strip()], args.paragraphs, args.model)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print_table(results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# benchmarks/query.py
+
+# Latency and throughput of /query under concurrent load. Starts a local server
+# on a temporary data dir (models linked from the configured models dir), ingests
+# a synthetic corpus through /generate, then sends queries with each number of
+# concurrent clients. Every prompt is distinct, so the embedding cache does not
+# hide the model. Pass --url to measure a running server and agent instead.
+#
+#   python -m benchmarks.query [--concurrency 1,4,16] [--requests 400] [--files 100] [--url http://host:8002 --agent name] [--json]
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+import httpx
+import numpy as np
+
+from config import settings
+from benchmarks.corpus import WORDS, generate_corpus
+
+AGENT_NAME = "bench"
+HEADERS = {settings.header_name: settings.header_key}
+
+# Distinct prompts of a few corpus words each
+def prompts(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [f"{i} " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 10))) for i in range(count)]
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# Run a server on a temporary data dir holding a synthetic agent, and yield its url
+@contextmanager
+def local_server(files: int, paragraphs: int, timeout: float = 600.0) -> Iterator[str]:
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.symlink(os.path.abspath(settings.models_dir), os.path.join(data_dir, "models"))
+        generate_corpus(os.path.join(data_dir, "agents", AGENT_NAME), files, paragraphs=paragraphs)
+        port = _free_port()
+        server_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=server_dir, env={**os.environ, "DATA_DIR": data_dir})
+        url = f"http://127.0.0.1:{port}"
+        try:
+            _wait_ready(url, process, timeout)
+            response = httpx.post(f"{url}/generate", json={"agent_name": AGENT_NAME}, headers=HEADERS, timeout=timeout)
+            response.raise_for_status()
+            yield url
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+# Wait until the server has warmed up
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{url}/ready", timeout=5).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Server at {url} not ready after {timeout:.0f}s")
+
+# Send the prompts from concurrency clients; returns the latency in ms of each
+# successful request, the number of errors and the wall time
+async def _load(url: str, agent_name: str, texts: List[str], concurrency: int) -> Tuple[List[float], int, float]:
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def client_loop(client: httpx.AsyncClient) -> None:
+        nonlocal next_index, errors
+        while next_index < len(texts):
+            prompt = texts[next_index]
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/query", json={"agent_name": agent_name, "prompt": prompt}, headers=HEADERS)
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - started) * 1000.0)
+            except httpx.HTTPError:
+                errors += 1
+
+    async with httpx.AsyncClient(limits=limits, timeout=60.0) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+def run_once(url: str, agent_name: str, concurrency: int, requests: int, seed: int = 0) -> dict:
+    # a few unmeasured requests open the connections and the agent's store
+    asyncio.run(_load(url, agent_name, prompts(concurrency, seed=seed + 10_000), concurrency))
+    latencies, errors, elapsed = asyncio.run(_load(url, agent_name, prompts(requests, seed=seed), concurrency))
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "qps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else 0.0,
+        "p95_ms": float(np.percentile(latencies, 95)) if latencies else 0.0,
+        "p99_ms": float(np.percentile(latencies, 99)) if latencies else 0.0,
+    }
+
+def run(concurrency_levels, requests: int, files: int, paragraphs: int, url: Optional[str] = None, agent_name: str = AGENT_NAME) -> list:
+    if url:
+        return [run_once(url, agent_name, c, requests) for c in concurrency_levels]
+    with local_server(files, paragraphs) as local_url:
+        return [run_once(local_url, AGENT_NAME, c, requests) for c in concurrency_levels]
+
+def print_table(results: list) -> None:
+    print(f"{'clients':>7} {'requests':>8} {'errors':>6} {'QPS':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(f"{r['concurrency']:>7} {r['requests']:>8} {r['errors']:>6} {r['qps']:>8.1f} "
+              f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="/query latency and throughput under concurrent load")
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--files", type=int, default=100, help="corpus size of the local server")
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--url", help="measure a running server instead of a local one")
+    parser.add_argument("--agent", default=AGENT_NAME, help="agent to query on --url")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    results = run(levels, args.requests, args.files, args.paragraphs, url=args.url, agent_name=args.agent)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print_table(results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# benchmarks/rerank.py
+
+# Cost of re-ranking one query's candidate pool with each retrieval strategy.
+#
+#   python -m benchmarks.rerank [--pool-sizes 50,200,1000] [--dim 384] [--top-n 5] [--repeat 200] [--json]
+
+import json
+import time
+import argparse
+import numpy as np
+
+from ranking import normalize_rows, rank
+
+# Time each strategy over random candidate pools and return ms per query
+def run(pool_sizes, dim: int, top_n: int, repeat: int, threshold: float, mmr_lambda: float, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    results = []
+    for pool_size in pool_sizes:
+        candidates = normalize_rows(rng.standard_normal((pool_size, dim)).astype(np.float32))
+        queries = normalize_rows(rng.standard_normal((repeat, dim)).astype(np.float32))
+        for strategy in ("knn", "threshold", "mmr"):
+            started = time.perf_counter()
+            for query in queries:
+                rank(strategy, query, candidates, top_n, threshold=threshold, mmr_lambda=mmr_lambda)
+            elapsed = time.perf_counter() - started
+            results.append({
+                "strategy": strategy,
+                "pool_size": pool_size,
+                "dim": dim,
+                "top_n": top_n,
+                "ms_per_query": elapsed * 1000.0 / repeat,
+            })
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-rank cost per query")
+    parser.add_argument("--pool-sizes", default="50,200,1000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--threshold", type=float, default=0.0)
+    parser.add_argument("--mmr-lambda", type=float, default=0.5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    pool_sizes = [int(size) for size in args.pool_sizes.split(",") if size.strip()]
+    results = run(pool_sizes, args.dim, args.top_n, args.repeat, args.threshold, args.mmr_lambda)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'strategy':<10} {'pool':>6} {'ms/query':>10}")
+    for r in results:
+        print(f"{r['strategy']:<10} {r['pool_size']:>6} {r['ms_per_query']:>10.4f}")
+
+if __name__ == "__main__":
+    main()
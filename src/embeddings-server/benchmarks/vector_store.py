@@ -0,0 +1,106 @@
+# benchmarks/vector_store.py
+
+# Build time, query latency and memory of each vector store over corpora of
+# random embeddings. The default sizes stop at 100k; 1M is opt-in because its
+# 384-dim rows alone are 1.5 GB of float32 to generate, and building Chroma's
+# HNSW index over them takes far longer than the smaller sizes together. Pass
+# --stores flat to measure only the flat index.
+#
+#   python -m benchmarks.vector_store [--sizes 1000,10000,100000,1000000] [--stores chroma,flat] [--dim 384] [--queries 200] [--json]
+
+import os
+import gc
+import json
+import time
+import resource
+import argparse
+import tempfile
+import numpy as np
+from haystack import Document
+
+from vector_store import open_vector_store
+
+# documents written per call, as the chunker does per batch
+WRITE_BATCH = 1000
+
+# Current resident memory of this process in MB
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # no procfs: fall back to the peak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_once(backend: str, size: int, dim: int, queries: int, top_k: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as store_path:
+        agent_name = f"bench_{backend}_{size}"
+
+        # build: write in batches and save
+        store = open_vector_store(agent_name, store_path, backend)
+        started = time.perf_counter()
+        for start in range(0, size, WRITE_BATCH):
+            count = min(WRITE_BATCH, size - start)
+            embeddings = rng.standard_normal((count, dim)).astype(np.float32)
+            store.write([
+                Document(id=f"chunk-{start + i}", content=f"chunk {start + i}", embedding=embeddings[i].tolist())
+                for i in range(count)
+            ])
+        store.save()
+        build_seconds = time.perf_counter() - started
+        del store
+        gc.collect()
+
+        # open cold and measure what the open store and the first query cost
+        rss_before = _rss_mb()
+        started = time.perf_counter()
+        store = open_vector_store(agent_name, store_path, backend)
+        query_vectors = rng.standard_normal((queries, dim)).astype(np.float32)
+        store.search(query_vectors[0].tolist(), top_k)
+        first_query_ms = (time.perf_counter() - started) * 1000.0
+        memory_mb = _rss_mb() - rss_before
+
+        timings = []
+        for query in query_vectors:
+            started = time.perf_counter()
+            store.search(query.tolist(), top_k)
+            timings.append((time.perf_counter() - started) * 1000.0)
+        del store
+        gc.collect()
+
+    return {
+        "store": backend,
+        "chunks": size,
+        "dim": dim,
+        "build_seconds": build_seconds,
+        "open_and_first_query_ms": first_query_ms,
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "memory_mb": memory_mb,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Vector store build time, query latency and memory")
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--stores", default="chroma,flat")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    stores = [store.strip() for store in args.stores.split(",") if store.strip()]
+    results = [run_once(store, size, args.dim, args.queries, args.top_k) for size in sizes for store in stores]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'store':<7} {'chunks':>8} {'build s':>9} {'open+1st ms':>12} {'p50 ms':>8} {'p95 ms':>8} {'mem MB':>8}")
+    for r in results:
+        print(f"{r['store']:<7} {r['chunks']:>8} {r['build_seconds']:>9.2f} {r['open_and_first_query_ms']:>12.1f} "
+              f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['memory_mb']:>8.1f}")
+
+if __name__ == "__main__":
+    main()
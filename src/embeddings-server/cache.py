@@ -0,0 +1,219 @@
+# cache.py
+
+# Cache of query embeddings keyed by model and normalized prompt text.
+# The in-process tier is a size-bounded LRU with an optional TTL. The optional
+# disk tier is a SQLite file in the data dir, shared by all uvicorn workers
+# and kept across restarts. Disk reads block, so async callers look up the
+# memory tier first and read the disk off the event loop; disk writes are
+# queued and written in batches by a background thread.
+
+import os
+import time
+import sqlite3
+import hashlib
+import queue
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Collapse whitespace so trivially different prompts share an entry
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+class QueryEmbeddingCache:
+    def __init__(self, max_size: int = 2048, ttl_seconds: int = 0, disk_path: Optional[str] = None, disk_max_entries: int = 100000) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.disk_max_entries = disk_max_entries
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: "OrderedDict[str, Tuple[List[float], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+        self._disk_writes = 0
+        # write-behind queue of (key, vector, created); writes are dropped when it is full
+        self._disk_queue: "queue.Queue[Tuple[str, List[float], float]]" = queue.Queue(maxsize=4096)
+        self._disk_writer: Optional[threading.Thread] = None
+        if disk_path:
+            self._open_disk(disk_path)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @property
+    def disk_enabled(self) -> bool:
+        return self.enabled and self._disk is not None
+
+    # Return the cached embedding of a prompt, or None on a miss. Reads the disk
+    # tier on a memory miss, so async callers use get_memory and get_disk instead.
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        vector = self.get_memory(model, text)
+        if vector is None and self.disk_enabled:
+            vector = self.get_disk(model, text)
+        return vector
+
+    # Look up the in-process tier only; never blocks on I/O. A miss is counted
+    # here only when there is no disk tier left to try.
+    def get_memory(self, model: str, text: str) -> Optional[List[float]]:
+        if not self.enabled:
+            return None
+        key = self._key(model, text)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, created = entry
+                if not self._expired(created, now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+            if self._disk is None:
+                self.misses += 1
+        return None
+
+    # Look up the disk tier only (blocking); a hit is copied into memory
+    def get_disk(self, model: str, text: str) -> Optional[List[float]]:
+        if not self.disk_enabled:
+            return None
+        key = self._key(model, text)
+        now = time.time()
+        vector = self._disk_get(key, now)
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, vector, now)
+        return vector
+
+    # Add the embedding of a prompt to the cache; the disk write happens in the background
+    def put(self, model: str, text: str, vector: List[float]) -> None:
+        if not self.enabled:
+            return
+        key = self._key(model, text)
+        now = time.time()
+        with self._lock:
+            self._store(key, vector, now)
+        if self._disk is not None:
+            try:
+                self._disk_queue.put_nowait((key, vector, now))
+            except queue.Full:
+                pass
+
+    # Wait until the queued disk writes are done
+    def flush(self) -> None:
+        if self._disk_writer is not None:
+            self._disk_queue.join()
+
+    # Return the hit/miss counters
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def _key(self, model: str, text: str) -> str:
+        return hashlib.sha1(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created > self.ttl_seconds
+
+    # Insert into the LRU and evict beyond max_size (lock must be held)
+    def _store(self, key: str, vector: List[float], created: float) -> None:
+        self._entries[key] = (vector, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _open_disk(self, disk_path: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(disk_path, timeout=1.0, check_same_thread=False, isolation_level=None)
+            # WAL lets several worker processes read while one writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB,
+                    created_on REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_query_embeddings_created ON query_embeddings (created_on)")
+            self._disk = conn
+            self._disk_writer = threading.Thread(target=self._write_disk, name="query-cache-writer", daemon=True)
+            self._disk_writer.start()
+        except sqlite3.Error as e:
+            print(f"Query cache disk tier disabled: {str(e)}")
+            self._disk = None
+
+    def _disk_get(self, key: str, now: float) -> Optional[List[float]]:
+        if self._disk is None:
+            return None
+        try:
+            with self._disk_lock:
+                row = self._disk.execute("SELECT vector, created_on FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None or self._expired(row[1], now):
+            return None
+        return array("f", row[0]).tolist()
+
+    # Background writer: drain the queue and write each batch in one transaction
+    def _write_disk(self) -> None:
+        while True:
+            batch = [self._disk_queue.get()]
+            while len(batch) < 256:
+                try:
+                    batch.append(self._disk_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._disk_put(batch)
+            finally:
+                for _ in batch:
+                    self._disk_queue.task_done()
+
+    def _disk_put(self, batch: List[Tuple[str, List[float], float]]) -> None:
+        try:
+            with self._disk_lock:
+                self._disk.execute("BEGIN")
+                self._disk.executemany(
+                    "INSERT OR REPLACE INTO query_embeddings (key, vector, created_on) VALUES (?, ?, ?)",
+                    [(key, array("f", vector).tobytes(), created) for key, vector, created in batch],
+                )
+                # trim the oldest entries every so often instead of on every write
+                self._disk_writes += len(batch)
+                if self._disk_writes >= 1000:
+                    self._disk_writes = 0
+                    self._disk.execute(
+                        "DELETE FROM query_embeddings WHERE key IN (SELECT key FROM query_embeddings ORDER BY created_on DESC LIMIT -1 OFFSET ?)",
+                        (self.disk_max_entries,),
+                    )
+                self._disk.execute("COMMIT")
+        except sqlite3.Error as e:
+            # the disk tier is best effort; a busy or broken file must not fail the query
+            print(f"Query cache disk write failed: {str(e)}")
+            try:
+                self._disk.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
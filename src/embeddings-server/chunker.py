@@ -1,83 +1,431 @@
 # chunker.py
 
 import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from haystack import Pipeline
-from haystack.components.writers import DocumentWriter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from haystack import Document
 from haystack.components.converters import MarkdownToDocument, PyPDFToDocument, TextFileToDocument
-from haystack.components.embedders import SentenceTransformersDocumentEmbedder
 from haystack.components.preprocessors import DocumentCleaner, DocumentSplitter
 from haystack.components.routers import FileTypeRouter
-from haystack.components.joiners import DocumentJoiner
-from haystack_integrations.document_stores.chroma import ChromaDocumentStore
-#from haystack.document_stores.types import DuplicatePolicy
 
 from config import settings
+from embedder import embed_documents
+from dedup import ChunkDeduplicator
+from memory import PeakMemory
+from lexical import LexicalIndexWriter, lexical_index_path
+from metrics import INGEST_CHUNKS, INGEST_FILES, INGEST_SECONDS, INGEST_STAGE_SECONDS
+from manifest import Manifest, FileEntry, manifest_path, file_hash
+from vector_store import open_vector_store
+from versions import build_lock, collection_name, current_version, drop_version, publish_version
 
-def chunk_files_in_dir(agent_name:str, dir: str, model_path: str, store_path: str):
-    # set the types supported
-    file_type_router = FileTypeRouter(mime_types=["text/plain", "application/pdf", "text/markdown"])
-
-    # set the converters
-    text_file_converter = TextFileToDocument()
-    markdown_converter = MarkdownToDocument()
-    pdf_converter = PyPDFToDocument()
-
-    # set the cleaner and splitter
-    document_cleaner = DocumentCleaner()
-    document_splitter = DocumentSplitter(
-        split_by=settings.chunk_strategy, 
-        split_length=settings.chunk_size, 
-        split_overlap=settings.chunk_overlap,
-        split_threshold=settings.min_chunk_size)
-
-    # set the joiner
-    document_joiner = DocumentJoiner()
-
-    # set the embedder
-    document_embedder = SentenceTransformersDocumentEmbedder(model=model_path)
-
-    # set the store
-    document_store = ChromaDocumentStore(collection_name=f"agent_{agent_name}", persist_path=store_path, distance_function=settings.distance_metric)
-    document_writer = DocumentWriter(document_store=document_store)
-
-    # add components to the pipeline
-    preprocessing_pipeline = Pipeline()
-    # router
-    preprocessing_pipeline.add_component(instance=file_type_router, name="file_type_router")
-    # document converters
-    preprocessing_pipeline.add_component(instance=text_file_converter, name="text_file_converter")
-    preprocessing_pipeline.add_component(instance=markdown_converter, name="markdown_converter")
-    preprocessing_pipeline.add_component(instance=pdf_converter, name="pypdf_converter")
-    # joiner
-    preprocessing_pipeline.add_component(instance=document_joiner, name="document_joiner")
-    # cleaner
-    preprocessing_pipeline.add_component(instance=document_cleaner, name="document_cleaner")
-    # splitter
-    preprocessing_pipeline.add_component(instance=document_splitter, name="document_splitter")
-    # embedder
-    preprocessing_pipeline.add_component(instance=document_embedder, name="document_embedder")
-    # document writer
-    preprocessing_pipeline.add_component(instance=document_writer, name="document_writer")
-
-    # connect the router with sources
-    preprocessing_pipeline.connect("file_type_router.text/plain", "text_file_converter.sources")
-    preprocessing_pipeline.connect("file_type_router.application/pdf", "pypdf_converter.sources")
-    preprocessing_pipeline.connect("file_type_router.text/markdown", "markdown_converter.sources")
-
-    # connect components with document joiner
-    preprocessing_pipeline.connect("text_file_converter", "document_joiner")
-    preprocessing_pipeline.connect("pypdf_converter", "document_joiner")
-    preprocessing_pipeline.connect("markdown_converter", "document_joiner")
-
-    # connect the document joiner with cleaner
-    preprocessing_pipeline.connect("document_joiner", "document_cleaner")
-    # connect cleaner with splitter
-    preprocessing_pipeline.connect("document_cleaner", "document_splitter")
-    # connect splitter with embedder
-    preprocessing_pipeline.connect("document_splitter", "document_embedder")
-    preprocessing_pipeline.connect("document_embedder", "document_writer")
-
-    # run the pipeline
-    result = preprocessing_pipeline.run({"file_type_router": {"sources": list(Path(dir).glob("**/*"))}})
-    return
+# files whose chunks are copied from the live version per read
+COPY_BATCH_FILES = 256
+
+# Components that convert, clean and split files, created once per process
+_preprocessors: Optional[Dict[str, Any]] = None
+
+# Pool of processes that preprocess files in parallel, None when running inline
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+def _get_preprocessors() -> Dict[str, Any]:
+    global _preprocessors
+    if _preprocessors is None:
+        _preprocessors = {
+            # set the types supported
+            "router": FileTypeRouter(mime_types=["text/plain", "application/pdf", "text/markdown"]),
+            # set the converters, keyed by the type they handle
+            "text/plain": TextFileToDocument(),
+            "application/pdf": PyPDFToDocument(),
+            "text/markdown": MarkdownToDocument(progress_bar=False),
+            # set the cleaner and splitter
+            "cleaner": DocumentCleaner(),
+            "splitter": DocumentSplitter(
+                split_by=settings.chunk_strategy,
+                split_length=settings.chunk_size,
+                split_overlap=settings.chunk_overlap,
+                split_threshold=settings.min_chunk_size),
+        }
+    return _preprocessors
+
+# Convert, clean and split one file into chunks. Runs in the worker processes
+# (or inline with one worker) and returns the chunks with the seconds spent per stage.
+def _preprocess_file(path: str) -> Tuple[List[Document], Dict[str, float]]:
+    components = _get_preprocessors()
+    timings = {"convert": 0.0, "clean": 0.0, "split": 0.0}
+
+    started = time.perf_counter()
+    documents: List[Document] = []
+    routed = components["router"].run(sources=[Path(path)])
+    for mime_type, sources in routed.items():
+        # unsupported files are routed to "unclassified" and skipped
+        converter = components.get(mime_type)
+        if converter is not None and sources:
+            documents.extend(converter.run(sources=sources)["documents"])
+    timings["convert"] = time.perf_counter() - started
+    if not documents:
+        return documents, timings
+
+    started = time.perf_counter()
+    documents = components["cleaner"].run(documents=documents)["documents"]
+    timings["clean"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    documents = components["splitter"].run(documents=documents)["documents"]
+    timings["split"] = time.perf_counter() - started
+    return documents, timings
+
+# Get the process pool sized by EMBEDDINGS_NO_WORKERS, or None to preprocess inline.
+# Workers are spawned rather than forked so they do not inherit torch threads.
+def _get_process_pool() -> Optional[ProcessPoolExecutor]:
+    global _process_pool
+    if settings.no_workers <= 1:
+        return None
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(max_workers=settings.no_workers, mp_context=multiprocessing.get_context("spawn"))
+    return _process_pool
+
+# Stop the worker processes
+def shutdown_process_pool() -> None:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+
+# Drop a pool whose worker died, so the next ingest starts a new one
+def _reset_process_pool(pool: ProcessPoolExecutor) -> None:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+# Preprocess the files batch by batch and yield, per batch, the chunks of each file,
+# the stage timings and the files that could not be preprocessed, which are skipped.
+# With a process pool the files of the next batch are submitted before the current
+# batch is handed over, so conversion of the next batch overlaps embedding of the
+# current one while at most two batches are in memory. If a worker process dies the
+# pool is dropped and the ingest fails, since the file that killed it is unknown.
+# Fewer than INGEST_POOL_MIN_FILES files are preprocessed inline: spawning the
+# workers and pickling the chunks back costs more than it saves on them.
+def _preprocessed_batches(dir: str, files: Dict[str, FileEntry]) -> Iterator[Tuple[Dict[str, List[Document]], Dict[str, float], List[str]]]:
+    pool = _get_process_pool() if len(files) >= settings.ingest_pool_min_files else None
+    batches = list(_file_batches(files))
+
+    def submit(batch: List[str]) -> Dict[str, Future]:
+        return {name: pool.submit(_preprocess_file, str(Path(dir) / name)) for name in batch}
+
+    try:
+        pending = submit(batches[0]) if pool is not None and batches else {}
+        for index, batch in enumerate(batches):
+            timings = {"convert": 0.0, "clean": 0.0, "split": 0.0}
+            chunks: Dict[str, List[Document]] = {}
+            failed: List[str] = []
+            if pool is not None:
+                futures = pending
+                pending = submit(batches[index + 1]) if index + 1 < len(batches) else {}
+            for name in batch:
+                try:
+                    if pool is None:
+                        documents, file_timings = _preprocess_file(str(Path(dir) / name))
+                    else:
+                        documents, file_timings = futures[name].result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    print(f"Skipping file {name}: {str(e)}")
+                    failed.append(name)
+                    continue
+                chunks[name] = documents
+                for stage, seconds in file_timings.items():
+                    timings[stage] += seconds
+            yield chunks, timings, failed
+    except BrokenProcessPool:
+        _reset_process_pool(pool)
+        raise
+
+# Settings that shape the chunks; if any of them changes every file is re-indexed
+def _index_signature(model_path: str) -> Dict[str, Any]:
+    return {
+        "model_path": model_path,
+        "embedding_backend": settings.embedding_backend,
+        "vector_store": settings.vector_store,
+        "distance_metric": settings.distance_metric,
+        "chunk_strategy": settings.chunk_strategy,
+        "chunk_size": settings.chunk_size,
+        "chunk_overlap": settings.chunk_overlap,
+        "min_chunk_size": settings.min_chunk_size,
+        "dedup_chunks": settings.dedup_chunks,
+        "dedup_simhash_distance": settings.dedup_simhash_distance,
+    }
+
+# Index the files of an agent into a new version of its index, then make that
+# version live (see versions.py). Chunks of files unchanged since the live
+# version are copied with their embeddings; only added or changed files are
+# converted and embedded. full=True re-indexes every file. The summary reports
+# the peak memory of the run, preprocessing worker processes included. Builds of
+# the same agent run one at a time (see build_lock).
+def chunk_files_in_dir(agent_name:str, dir: str, model_path: str, store_path: str, full: bool = False) -> Dict[str, Any]:
+    with build_lock(agent_name, store_path), PeakMemory() as memory:
+        return _index_files(agent_name, dir, model_path, store_path, full, memory)
+
+def _index_files(agent_name: str, dir: str, model_path: str, store_path: str, full: bool, memory: PeakMemory) -> Dict[str, Any]:
+    run_started = time.perf_counter()
+    signature = _index_signature(model_path)
+
+    # the live version is the base of an incremental build
+    base_version = current_version(agent_name, store_path)
+    base_collection = collection_name(agent_name, base_version)
+    base = None if full else Manifest.load(manifest_path(base_collection, store_path))
+    if base is not None and base.signature != signature:
+        base = None
+
+    # compare the files on disk with the live version
+    changed: Dict[str, FileEntry] = {}
+    unchanged: Dict[str, FileEntry] = {}
+    current = set()
+    for path in sorted(Path(dir).glob("**/*")):
+        if not path.is_file():
+            continue
+        name = os.path.relpath(path, dir)
+        current.add(name)
+        stat = path.stat()
+        entry = base.files.get(name) if base is not None else None
+        if entry is not None and entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+            unchanged[name] = entry
+            continue
+        digest = file_hash(str(path))
+        if entry is not None and entry.hash == digest:
+            # touched but not modified
+            entry.mtime = stat.st_mtime
+            unchanged[name] = entry
+            continue
+        changed[name] = FileEntry(hash=digest, size=stat.st_size, mtime=stat.st_mtime)
+    deleted = [name for name in base.files if name not in current] if base is not None else []
+
+    # a file whose chunks were dropped as duplicates of a changed or deleted file
+    # is indexed again, so those chunks come back if the original is gone
+    moved = True
+    while moved:
+        moved = False
+        touched = set(changed) | set(deleted)
+        for name, entry in list(unchanged.items()):
+            if touched.intersection(entry.duplicate_of):
+                del unchanged[name]
+                changed[name] = FileEntry(hash=entry.hash, size=entry.size, mtime=entry.mtime)
+                moved = True
+
+    if base is not None and not changed and not deleted:
+        # nothing to rebuild: the live version stays, with the mtimes of touched files updated
+        base.save(manifest_path(base_collection, store_path))
+        summary = _summary(base_version, memory, unchanged=len(unchanged))
+        INGEST_FILES.labels(agent_name, "unchanged").inc(len(unchanged))
+        INGEST_SECONDS.labels(agent_name).observe(time.perf_counter() - run_started)
+        if settings.DEBUG:
+            print(f"Agent {agent_name} is up to date: {summary}")
+        return summary
+
+    # build the next version next to the live one, dropping what an interrupted build left there
+    version = base_version + 1
+    collection = collection_name(agent_name, version)
+    drop_version(agent_name, store_path, version)
+    vector_store = open_vector_store(collection, store_path)
+    lexical_index = LexicalIndexWriter(lexical_index_path(collection, store_path))
+    manifest = Manifest(signature=signature)
+
+    # drops chunks that repeat one already in the new version
+    deduplicator = ChunkDeduplicator(settings.dedup_simhash_distance) if settings.dedup_chunks else None
+
+    # copy the chunks of unchanged files from the live version
+    copied_count = 0
+    started = time.perf_counter()
+    if unchanged:
+        base_store = open_vector_store(base_collection, store_path)
+        names = list(unchanged)
+        for start in range(0, len(names), COPY_BATCH_FILES):
+            batch = names[start:start + COPY_BATCH_FILES]
+            documents = base_store.get([doc_id for name in batch for doc_id in unchanged[name].chunk_ids])
+            found = {document.id for document in documents}
+            for name in batch:
+                entry = unchanged[name]
+                if all(doc_id in found for doc_id in entry.chunk_ids):
+                    manifest.files[name] = entry
+                else:
+                    # chunks missing from the live version: index the file again
+                    changed[name] = FileEntry(hash=entry.hash, size=entry.size, mtime=entry.mtime)
+            owners = {doc_id: name for name in batch if name in manifest.files for doc_id in unchanged[name].chunk_ids}
+            documents = [document for document in documents if document.id in owners]
+            for document in documents:
+                lexical_index.add(document.id, document.content)
+                if deduplicator is not None:
+                    deduplicator.add(document.content or "", owners[document.id])
+            vector_store.write(documents)
+            copied_count += len(documents)
+        del base_store
+    copy_seconds = time.perf_counter() - started
+    if unchanged:
+        INGEST_STAGE_SECONDS.labels(agent_name, "copy").observe(copy_seconds)
+
+    # convert, split, embed and write the added or changed files batch by batch,
+    # so at most two batches of texts and embeddings are in memory. The new
+    # version's rows and postings are spilled to disk as they are written; what
+    # still grows with the corpus is the ids of its chunks and the dedup hashes.
+    # Conversion, cleaning and splitting run in EMBEDDINGS_NO_WORKERS processes.
+    chunk_count = 0
+    batch_count = 0
+    # files that could not be converted; left out of the manifest so the next ingest retries them
+    failed_files: List[str] = []
+    timings = {"convert": 0.0, "clean": 0.0, "split": 0.0, "dedup": 0.0, "embed": 0.0, "write": 0.0}
+    embedding = {"tokens": 0, "padded_tokens": 0, "batches": 0, "seconds": 0.0}
+    if changed:
+        for chunks, batch_timings, failed in _preprocessed_batches(dir, changed):
+            batch_start = dict(timings)
+            failed_files.extend(failed)
+            for stage, seconds in batch_timings.items():
+                timings[stage] += seconds
+
+            if deduplicator is not None:
+                started = time.perf_counter()
+                for name, file_chunks in chunks.items():
+                    kept = []
+                    for document in file_chunks:
+                        duplicate_of = deduplicator.match(document.content or "", name)
+                        if duplicate_of is None:
+                            kept.append(document)
+                        elif duplicate_of != name and duplicate_of not in changed[name].duplicate_of:
+                            changed[name].duplicate_of.append(duplicate_of)
+                    chunks[name] = kept
+                timings["dedup"] += time.perf_counter() - started
+
+            documents: List[Document] = [document for file_chunks in chunks.values() for document in file_chunks]
+            if documents:
+                started = time.perf_counter()
+                documents, embed_stats = embed_documents(model_path, documents)
+                timings["embed"] += time.perf_counter() - started
+                for key in embedding:
+                    embedding[key] += embed_stats[key]
+
+                # write the chunks and record which file each one came from
+                started = time.perf_counter()
+                for name, file_chunks in chunks.items():
+                    changed[name].chunk_ids.extend(document.id for document in file_chunks)
+                for document in documents:
+                    lexical_index.add(document.id, document.content)
+                vector_store.write(documents)
+                timings["write"] += time.perf_counter() - started
+
+            chunk_count += len(documents)
+            batch_count += 1
+            for stage, seconds in timings.items():
+                if stage != "dedup" or deduplicator is not None:
+                    INGEST_STAGE_SECONDS.labels(agent_name, stage).observe(seconds - batch_start[stage])
+            if settings.DEBUG:
+                print(f"Agent {agent_name}: batch {batch_count} wrote {len(documents)} chunks from {len(chunks)} files, peak RSS {memory.peak_mb():.0f} MB")
+            # drop the batch before taking the next one
+            del chunks, documents
+    for name in failed_files:
+        del changed[name]
+    manifest.files.update(changed)
+
+    vector_store.save()
+    lexical_index.save()
+    manifest.save(manifest_path(collection, store_path))
+    # switch queries to the new version; the old one is dropped later by the version GC
+    publish_version(agent_name, store_path, version)
+
+    summary = _summary(
+        version, memory,
+        changed=len(changed),
+        deleted=len(deleted),
+        failed=len(failed_files),
+        unchanged=len(manifest.files) - len(changed),
+        copied_chunks=copied_count,
+        copy_seconds=copy_seconds,
+        chunks=chunk_count,
+        dedup=deduplicator.stats() if deduplicator is not None else None,
+        batches=batch_count,
+        timings=timings,
+        embedding=embedding,
+    )
+    INGEST_FILES.labels(agent_name, "indexed").inc(len(changed))
+    INGEST_FILES.labels(agent_name, "unchanged").inc(summary["unchanged"])
+    INGEST_FILES.labels(agent_name, "deleted").inc(len(deleted))
+    INGEST_FILES.labels(agent_name, "failed").inc(len(failed_files))
+    INGEST_CHUNKS.labels(agent_name, "embedded").inc(chunk_count)
+    INGEST_CHUNKS.labels(agent_name, "copied").inc(copied_count)
+    if deduplicator is not None:
+        INGEST_CHUNKS.labels(agent_name, "duplicate").inc(deduplicator.stats()["embeddings_saved"])
+    INGEST_SECONDS.labels(agent_name).observe(time.perf_counter() - run_started)
+    if settings.DEBUG:
+        print(f"Indexed agent {agent_name}: {summary}")
+    return summary
+
+# Summary of an ingest run; an agent found up to date reports zeros for the work
+# it skipped, so both kinds of run have the same keys
+def _summary(
+    version: int,
+    memory: PeakMemory,
+    changed: int = 0,
+    deleted: int = 0,
+    failed: int = 0,
+    unchanged: int = 0,
+    copied_chunks: int = 0,
+    copy_seconds: float = 0.0,
+    chunks: int = 0,
+    dedup: Optional[Dict[str, int]] = None,
+    batches: int = 0,
+    timings: Optional[Dict[str, float]] = None,
+    embedding: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    timings = timings or {"convert": 0.0, "clean": 0.0, "split": 0.0, "dedup": 0.0, "embed": 0.0, "write": 0.0}
+    embedding = embedding or {"tokens": 0, "padded_tokens": 0, "batches": 0, "seconds": 0.0}
+    return {
+        "version": version,
+        "changed": changed,
+        "deleted": deleted,
+        "failed": failed,
+        "unchanged": unchanged,
+        "copied_chunks": copied_chunks,
+        "copy_seconds": round(copy_seconds, 3),
+        "chunks": chunks,
+        "dedup": dedup,
+        "batches": batches,
+        "peak_rss_mb": round(memory.peak_mb()),
+        "seconds": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+        "embedding": {
+            "tokens": embedding["tokens"],
+            "batches": embedding["batches"],
+            # share of the computed tokens that were padding
+            "padding_ratio": round(1 - embedding["tokens"] / embedding["padded_tokens"], 4) if embedding["padded_tokens"] else 0.0,
+            "tokens_per_sec": round(embedding["tokens"] / embedding["seconds"]) if embedding["seconds"] else 0,
+        },
+    }
+
+# Split files into batches of at most INGEST_BATCH_FILES files and INGEST_BATCH_MB
+# bytes; a file larger than the byte budget forms a batch of its own.
+# INGEST_BATCH_FILES=0 processes everything in a single batch.
+def _file_batches(files: Dict[str, FileEntry]) -> Iterator[List[str]]:
+    max_files = settings.ingest_batch_files
+    max_bytes = settings.ingest_batch_mb * 1024 * 1024
+    if max_files <= 0:
+        yield list(files)
+        return
+
+    batch: List[str] = []
+    batch_bytes = 0
+    for name, entry in files.items():
+        if batch and (len(batch) >= max_files or (max_bytes > 0 and batch_bytes + entry.size > max_bytes)):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(name)
+        batch_bytes += entry.size
+    if batch:
+        yield batch
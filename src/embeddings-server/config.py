@@ -12,8 +12,17 @@ class Settings:
         
         #self.ner_model_name: str = os.getenv("NER_MODEL_NAME", "dbmdz/bert-large-cased-finetuned-conll03-english")
         self.embedding_model_name: str = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+        # Embedding backend: torch, onnx (ONNX Runtime) or onnx-int8 (int8 dynamic quantization)
+        self.embedding_backend: str = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+        # Ingest embeds chunks sorted by token length, in batches of at most this many
+        # padded tokens (batch size x longest chunk) and this many chunks
+        self.embed_batch_tokens = self._get_env_int("EMBED_BATCH_TOKENS", 16384)
+        self.embed_batch_max_size = self._get_env_int("EMBED_BATCH_MAX_SIZE", 128)
         self.embedding_model_filename: str = os.getenv("EMBEDDING_MODEL_FILENAME", "pytorch_model.bin") 
+        # Processes that convert, clean and split files during ingestion (1 = in the server process)
         self.no_workers: int = self._get_env_int("EMBEDDINGS_NO_WORKERS", 1)
+        # ingests of fewer changed files preprocess them inline, not worth spawning the workers for
+        self.ingest_pool_min_files: int = self._get_env_int("INGEST_POOL_MIN_FILES", 16)
         self.hf_api_token: str = os.getenv("HUGGING_FACE_HUB_TOKEN", "NONE")
 
         # Supported file types
@@ -29,14 +38,67 @@ class Settings:
         self.max_chunk_count = self._get_env_int("MAX_CHUNK_COUNT", 0)
         if self.max_chunk_count == 0:
             self.max_chunk_count = None  # Set to None if not specified.
+        # Chunks that duplicate an indexed chunk are dropped before embedding: exactly, or within
+        # this many differing bits of their 64-bit SimHash (0 = exact only); DEDUP_CHUNKS=false keeps all
+        self.dedup_chunks = os.getenv("DEDUP_CHUNKS", "true").strip().lower() == "true"
+        self.dedup_simhash_distance = self._get_env_int("DEDUP_SIMHASH_DISTANCE", 3)
+        # Ingest streams files through the pipeline in batches of at most this many files and MB,
+        # writing each batch before the next one (INGEST_BATCH_FILES=0 processes all files at once)
+        self.ingest_batch_files = self._get_env_int("INGEST_BATCH_FILES", 32)
+        self.ingest_batch_mb = self._get_env_int("INGEST_BATCH_MB", 64)
         # query
         # Number of top similar chunks to retrieve
         self.top_n = self._get_env_int("TOP_N", 5)
-        self.retrieval_strategy = os.getenv("RETRIEVAL_STRATEGY", "knn")
+        # knn: plain top-n, mmr: diversified top-n, threshold: top-n above THRESHOLD_SIMILARITY (cosine),
+        # hybrid: vector and BM25 rankings fused with reciprocal-rank fusion
+        self.retrieval_strategy = os.getenv("RETRIEVAL_STRATEGY", "knn").strip().lower()
         self.threshold_similarity = self._get_env_float("THRESHOLD_SIMILARITY", 0.8)
         self.mmr_lambda = self._get_env_float("MMR_LAMBDA", 0.5) 
         self.distance_metric = os.getenv("DISTANCE_METRIC", "cosine")
-        #self.initial_results = self._get_env_int("INITIAL_RESULTS", 100) 
+        # Vector store: chroma, or flat (exact NumPy search over a per-agent matrix in store_dir/flat)
+        self.vector_store = os.getenv("VECTOR_STORE", "chroma").strip().lower()
+        # Precision of the flat store's on-disk matrices: float16, int8 or float32. The smaller
+        # types use less page cache, but each search has to widen the rows to float32
+        self.flat_store_dtype = os.getenv("FLAT_STORE_DTYPE", "float16").strip().lower()
+        # hybrid: rank constant of reciprocal-rank fusion, and queries of at most this many terms
+        # are answered from the lexical index alone (0 disables the fast path)
+        self.rrf_k = self._get_env_int("RRF_K", 60)
+        self.lexical_fastpath_max_terms = self._get_env_int("LEXICAL_FASTPATH_MAX_TERMS", 3)
+        # Optional cross-encoder re-ranking (empty RERANK_MODEL_NAME disables it): candidates scored
+        # per query, pairs per batch, and the ms per query it may spend before falling back to vector order
+        self.rerank_model_name = os.getenv("RERANK_MODEL_NAME", "").strip()
+        self.rerank_candidates = self._get_env_int("RERANK_CANDIDATES", 30)
+        self.rerank_batch_size = self._get_env_int("RERANK_BATCH_SIZE", 16)
+        self.rerank_budget_ms = self._get_env_float("RERANK_BUDGET_MS", 150.0)
+        # A rebuild goes to a new index version; the previous one is kept this many seconds after the
+        # swap for queries still using it, and superseded versions are looked for every interval (0 = never)
+        self.version_gc_grace_seconds = self._get_env_int("VERSION_GC_GRACE_SECONDS", 300)
+        self.version_gc_interval_seconds = self._get_env_int("VERSION_GC_INTERVAL_SECONDS", 60)
+        # Warm-up at startup opens the stores of this many most recently used agents (0 = none);
+        # /ready answers 200 once warm-up is done
+        self.warmup_agents = self._get_env_int("WARMUP_AGENTS", 4)
+        # Number of agent stores kept open and the seconds an unused one stays open (0 keeps it until evicted)
+        self.store_cache_size = self._get_env_int("STORE_CACHE_SIZE", 32)
+        self.store_cache_idle_seconds = self._get_env_int("STORE_CACHE_IDLE_SECONDS", 1800)
+        # Query embeddings are batched across concurrent requests: max prompts per batch and max ms to wait for one
+        self.query_batch_max_size = self._get_env_int("QUERY_BATCH_MAX_SIZE", 32)
+        self.query_batch_max_wait_ms = self._get_env_float("QUERY_BATCH_MAX_WAIT_MS", 5.0)
+        # Query embedding cache: max entries in memory (0 disables), TTL in seconds (0 never expires)
+        self.query_cache_size = self._get_env_int("QUERY_CACHE_SIZE", 2048)
+        self.query_cache_ttl_seconds = self._get_env_int("QUERY_CACHE_TTL_SECONDS", 0)
+        # Optional SQLite tier in the data dir shared by all workers and restarts
+        self.query_cache_disk = os.getenv("QUERY_CACHE_DISK", "false").strip().lower() == "true"
+        self.query_cache_disk_max_entries = self._get_env_int("QUERY_CACHE_DISK_MAX_ENTRIES", 100000)
+        # Blocking work runs in bounded pools: threads and queued requests per pool, and the
+        # Retry-After seconds sent with a 503 once a pool is full
+        self.ingest_workers = self._get_env_int("INGEST_WORKERS", 1)
+        self.ingest_queue_size = self._get_env_int("INGEST_QUEUE_SIZE", 4)
+        self.ingest_retry_after = self._get_env_int("INGEST_RETRY_AFTER", 30)
+        self.query_workers = self._get_env_int("QUERY_WORKERS", 4)
+        self.query_queue_size = self._get_env_int("QUERY_QUEUE_SIZE", 64)
+        self.query_retry_after = self._get_env_int("QUERY_RETRY_AFTER", 1)
+        # Size of the candidate pool re-ranked by the mmr, threshold and hybrid strategies
+        self.initial_results = self._get_env_int("INITIAL_RESULTS", 100) 
 
         # Directory paths
         self.data_dir: str = os.getenv("DATA_DIR", "data")
@@ -44,6 +106,7 @@ class Settings:
         self.agents_dir: str = os.path.join(self.data_dir, "agents")
         self.models_dir: str = os.path.join(self.data_dir, "models")
         self.store_dir: str = os.path.join(self.data_dir, "store")
+        self.cache_dir: str = os.path.join(self.data_dir, "cache")
         
         # Security settings
         self.header_name: str = "X-Requested-With"  # Fixed header name for requests from the frontend
@@ -0,0 +1,112 @@
+# dedup.py
+
+# Drops chunks that repeat content already indexed for an agent before they
+# reach the embedding model. Exact duplicates are found by a hash of the
+# normalized text, near duplicates by the Hamming distance between 64-bit
+# SimHash fingerprints of word shingles. Fingerprints are indexed in
+# DEDUP_SIMHASH_DISTANCE + 1 bands: two fingerprints within that distance agree
+# on at least one band, so a chunk is only compared with chunks sharing a band.
+# Hashes, fingerprints and sources are kept as packed integers, so an agent's
+# chunks cost a few dozen bytes each.
+
+import hashlib
+from array import array
+from typing import Dict, List, Optional
+import numpy as np
+
+from lexical import tokenize
+
+# words per shingle
+SHINGLE_SIZE = 3
+# shorter chunks give unstable fingerprints and are only matched exactly
+MIN_NEAR_TOKENS = 8
+
+_BITS = np.arange(64, dtype=np.uint64)
+
+# Stable 64-bit hash of a string
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+# 64-bit SimHash of a token sequence: each bit is the majority vote of that bit
+# over the hashes of the shingles
+def simhash(tokens: List[str]) -> int:
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = [" ".join(tokens)]
+    else:
+        shingles = [" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)]
+    hashes = np.array([_hash64(shingle) for shingle in shingles], dtype=np.uint64)
+    bits = ((hashes[:, None] >> _BITS) & np.uint64(1)).astype(np.int32)
+    votes = bits.sum(axis=0) * 2 - len(shingles)
+    return int(np.sum((votes > 0).astype(np.uint64) << _BITS))
+
+class ChunkDeduplicator:
+    def __init__(self, max_distance: int = 3) -> None:
+        # max Hamming distance of near duplicates; 0 matches exact duplicates only
+        self.max_distance = max(0, min(max_distance, 63))
+        self.bands = self.max_distance + 1
+        width = 64 // self.bands
+        # (shift, mask) of each band; the last band takes the remaining bits
+        self._bands = [(i * width, (1 << (width if i < self.bands - 1 else 64 - i * width)) - 1) for i in range(self.bands)]
+        # sources by index, and the index of each source
+        self._sources: List[str] = []
+        self._source_index: Dict[str, int] = {}
+        # text hash -> index of the source of the first chunk with that text
+        self._exact: Dict[int, int] = {}
+        # fingerprint and source index of each fingerprinted chunk
+        self._fingerprints = array("Q")
+        self._owners = array("I")
+        # per band: band value -> positions in _fingerprints of chunks with that value
+        self._buckets: List[Dict[int, array]] = [{} for _ in range(self.bands)]
+        self.exact_count = 0
+        self.near_count = 0
+
+    # Record a chunk as indexed without checking it
+    def add(self, content: str, source: str) -> None:
+        tokens = tokenize(content)
+        self._exact.setdefault(self._text_hash(tokens), self._intern(source))
+        if self.max_distance > 0 and len(tokens) >= MIN_NEAR_TOKENS:
+            self._add_fingerprint(simhash(tokens), source)
+
+    # Return the source of an indexed chunk this one duplicates, or None after
+    # recording it as indexed
+    def match(self, content: str, source: str) -> Optional[str]:
+        tokens = tokenize(content)
+        text_hash = self._text_hash(tokens)
+        duplicate_of = self._exact.get(text_hash)
+        if duplicate_of is not None:
+            self.exact_count += 1
+            return self._sources[duplicate_of]
+        self._exact[text_hash] = self._intern(source)
+
+        if self.max_distance == 0 or len(tokens) < MIN_NEAR_TOKENS:
+            return None
+        fingerprint = simhash(tokens)
+        for band, (shift, mask) in enumerate(self._bands):
+            for position in self._buckets[band].get((fingerprint >> shift) & mask, ()):
+                if bin(fingerprint ^ self._fingerprints[position]).count("1") <= self.max_distance:
+                    self.near_count += 1
+                    return self._sources[self._owners[position]]
+        self._add_fingerprint(fingerprint, source)
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {"exact": self.exact_count, "near": self.near_count, "embeddings_saved": self.exact_count + self.near_count}
+
+    def _add_fingerprint(self, fingerprint: int, source: str) -> None:
+        position = len(self._fingerprints)
+        self._fingerprints.append(fingerprint)
+        self._owners.append(self._intern(source))
+        for band, (shift, mask) in enumerate(self._bands):
+            self._buckets[band].setdefault((fingerprint >> shift) & mask, array("I")).append(position)
+
+    def _intern(self, source: str) -> int:
+        index = self._source_index.get(source)
+        if index is None:
+            index = self._source_index[source] = len(self._sources)
+            self._sources.append(source)
+        return index
+
+    # 64-bit hash of the text with case, punctuation and whitespace ignored
+    @staticmethod
+    def _text_hash(tokens: List[str]) -> int:
+        return _hash64(" ".join(tokens))
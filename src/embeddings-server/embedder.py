@@ -0,0 +1,234 @@
+# embedder.py
+
+# Embedding backends, selected with EMBEDDING_BACKEND:
+#   torch     - sentence-transformers on PyTorch (default)
+#   onnx      - the same transformer exported to ONNX and run with ONNX Runtime
+#   onnx-int8 - the ONNX model with int8 dynamic quantization of its weights
+# The ONNX files are exported next to the model on first use
+# (<model>/onnx/model.onnx and model_int8.onnx) and reused afterwards.
+
+import os
+import json
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from haystack import Document
+
+from config import settings
+from metrics import EMBED_BATCH_SIZE
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# texts per forward pass
+BATCH_SIZE = 32
+
+_embedders_lock = threading.Lock()
+_embedders: Dict[Tuple[str, str], Any] = {}
+
+# sentence-transformers on PyTorch
+class TorchEmbedder:
+    def __init__(self, model_path: str) -> None:
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_path)
+
+    # Number of tokens of each text after truncation, special tokens included
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        encoded = self.model.tokenizer(texts, truncation=True, max_length=self.model.max_seq_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def embed(self, texts: List[str], batch_size: int = BATCH_SIZE) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True)
+
+# The transformer of a sentence-transformers model run with ONNX Runtime; pooling
+# and normalization follow the model's own modules.json
+class OnnxEmbedder:
+    def __init__(self, model_path: str, quantize: bool = False) -> None:
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        onnx_path = export_onnx(model_path, quantize=quantize)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+        bert_config = _read_json(os.path.join(model_path, "sentence_bert_config.json")) or {}
+        self.max_seq_length = bert_config.get("max_seq_length") or min(self.tokenizer.model_max_length, 512)
+        self.pooling, self.normalize = _read_modules(model_path)
+
+    # Number of tokens of each text after truncation, special tokens included
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_seq_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def embed(self, texts: List[str], batch_size: int = BATCH_SIZE) -> np.ndarray:
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(texts[start:start + batch_size], padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np")
+            feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            batches.append(_pool(hidden, encoded["attention_mask"], self.pooling))
+        if not batches:
+            return np.zeros((0, 0), dtype=np.float32)
+        embeddings = np.concatenate(batches).astype(np.float32)
+        if self.normalize:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.maximum(norms, 1e-12)
+        return embeddings
+
+# Export the transformer of a model to ONNX, and quantize it to int8 if asked.
+# Returns the path of the file to load. Files are written to a temporary name
+# and renamed, so concurrent workers never load a half-written model.
+def export_onnx(model_path: str, quantize: bool = False) -> str:
+    onnx_dir = os.path.join(model_path, "onnx")
+    float_path = os.path.join(onnx_dir, "model.onnx")
+    int8_path = os.path.join(onnx_dir, "model_int8.onnx")
+    os.makedirs(onnx_dir, exist_ok=True)
+
+    if not os.path.exists(float_path):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(model_path, device="cpu")
+        transformer = model[0].auto_model.eval()
+        sample = model.tokenizer(["export the embedding model"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+        temp_path = f"{float_path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                transformer,
+                args=(),
+                kwargs={name: sample[name] for name in input_names},
+                f=temp_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+                dynamo=False)
+        os.replace(temp_path, float_path)
+        if settings.DEBUG:
+            print(f"Exported {model_path} to {float_path}")
+
+    if not quantize:
+        return float_path
+
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        temp_path = f"{int8_path}.{os.getpid()}.tmp"
+        quantize_dynamic(float_path, temp_path, weight_type=QuantType.QInt8)
+        os.replace(temp_path, int8_path)
+        if settings.DEBUG:
+            print(f"Quantized {float_path} to {int8_path}")
+    return int8_path
+
+# Get the loaded embedder of a model for the configured backend, loading it on first use
+def get_embedder(model_path: str, backend: Optional[str] = None) -> Any:
+    backend = backend or settings.embedding_backend
+    key = (model_path, backend)
+    embedder = _embedders.get(key)
+    if embedder is not None:
+        return embedder
+
+    with _embedders_lock:
+        # another thread may have loaded it while we waited
+        embedder = _embedders.get(key)
+        if embedder is None:
+            if backend == "torch":
+                embedder = TorchEmbedder(model_path)
+            elif backend == "onnx":
+                embedder = OnnxEmbedder(model_path)
+            elif backend == "onnx-int8":
+                embedder = OnnxEmbedder(model_path, quantize=True)
+            else:
+                raise ValueError(f"Unknown EMBEDDING_BACKEND {backend}, expected one of {', '.join(BACKENDS)}")
+            _embedders[key] = embedder
+            if settings.DEBUG:
+                print(f"Loaded embedding model {model_path} ({backend})")
+    return embedder
+
+# Embed several texts in one call
+def embed_texts(model_path: str, texts: List[str], backend: Optional[str] = None) -> List[List[float]]:
+    return get_embedder(model_path, backend).embed(texts).tolist()
+
+# Embed texts in batches of similar token length. Texts are sorted by length so
+# each batch is padded to little more than its own members, and a batch takes as
+# many texts as fit in EMBED_BATCH_TOKENS padded tokens (at most EMBED_BATCH_MAX_SIZE).
+# Returns the embeddings in the original order and the batching stats.
+def embed_bucketed(model_path: str, texts: List[str], backend: Optional[str] = None) -> Tuple[np.ndarray, Dict[str, float]]:
+    embedder = get_embedder(model_path, backend)
+    stats = {"texts": len(texts), "tokens": 0, "padded_tokens": 0, "batches": 0, "seconds": 0.0}
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32), stats
+
+    lengths = embedder.token_lengths(texts)
+    # longest first, so a batch that does not fit in memory fails early
+    order = sorted(range(len(texts)), key=lambda i: lengths[i], reverse=True)
+    max_tokens = max(settings.embed_batch_tokens, 1)
+    max_size = max(settings.embed_batch_max_size, 1)
+
+    embeddings: Optional[np.ndarray] = None
+    start = 0
+    while start < len(order):
+        # the first text of a batch is its longest, so it sets the padded length
+        padded_length = lengths[order[start]]
+        size = max(1, min(max_size, max_tokens // max(padded_length, 1), len(order) - start))
+        batch = order[start:start + size]
+
+        started = time.perf_counter()
+        vectors = np.asarray(embedder.embed([texts[i] for i in batch], batch_size=size), dtype=np.float32)
+        stats["seconds"] += time.perf_counter() - started
+        if embeddings is None:
+            embeddings = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+        # put the vectors back at the positions of their texts
+        embeddings[batch] = vectors
+
+        stats["tokens"] += sum(lengths[i] for i in batch)
+        stats["padded_tokens"] += padded_length * len(batch)
+        stats["batches"] += 1
+        EMBED_BATCH_SIZE.labels("ingest").observe(len(batch))
+        start += size
+    return embeddings, stats
+
+# Set the embedding of each document from its content. Returns the documents
+# and the batching stats of embed_bucketed.
+def embed_documents(model_path: str, documents: List[Document], backend: Optional[str] = None) -> Tuple[List[Document], Dict[str, float]]:
+    embeddings, stats = embed_bucketed(model_path, [document.content or "" for document in documents], backend)
+    for document, embedding in zip(documents, embeddings):
+        document.embedding = embedding.tolist()
+    return documents, stats
+
+# Pool token embeddings into one vector per text
+def _pool(hidden: np.ndarray, attention_mask: np.ndarray, mode: str) -> np.ndarray:
+    if mode == "cls":
+        return hidden[:, 0]
+    mask = attention_mask[:, :, None].astype(hidden.dtype)
+    if mode == "max":
+        return np.where(mask > 0, hidden, -1e9).max(axis=1)
+    return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+# Pooling mode and whether embeddings are normalized, read from the model's modules
+def _read_modules(model_path: str) -> Tuple[str, bool]:
+    pooling, normalize = "mean", False
+    for module in _read_json(os.path.join(model_path, "modules.json")) or []:
+        module_type = module.get("type", "")
+        if module_type.endswith("Pooling"):
+            config = _read_json(os.path.join(model_path, module.get("path", ""), "config.json")) or {}
+            if config.get("pooling_mode_cls_token"):
+                pooling = "cls"
+            elif config.get("pooling_mode_max_tokens"):
+                pooling = "max"
+            elif not config.get("pooling_mode_mean_tokens", True):
+                raise ValueError(f"Pooling of {model_path} is not supported by the ONNX backend")
+        elif module_type.endswith("Normalize"):
+            normalize = True
+    return pooling, normalize
+
+def _read_json(path: str) -> Optional[Any]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,61 @@
+# executors.py
+
+# Bounded thread pools that keep blocking work off the event loop. Ingest and
+# query get separate pools so a long ingest can never starve retrieval, and a
+# pool that is full rejects new work at once instead of letting it hang.
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+# Raised when a pool has no free worker and its queue is full
+class ExecutorBusy(Exception):
+    def __init__(self, name: str, retry_after: int) -> None:
+        super().__init__(f"{name} capacity exhausted")
+        self.name = name
+        self.retry_after = retry_after
+
+class BoundedExecutor:
+    def __init__(self, name: str, max_workers: int, max_queue: int, retry_after: int = 1) -> None:
+        self.name = name
+        self.max_workers = max(max_workers, 1)
+        self.max_queue = max(max_queue, 0)
+        self.retry_after = retry_after
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    # Run a blocking function in the pool, or raise ExecutorBusy if the pool is full
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorBusy(self.name, self.retry_after)
+            self._in_flight += 1
+
+        future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        # release the slot when the work finishes, even if the caller went away
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    # Return the running/queued counts
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            in_flight = self._in_flight
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": min(in_flight, self.max_workers),
+            "queued": max(in_flight - self.max_workers, 0),
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, _future: Any) -> None:
+        with self._lock:
+            self._in_flight -= 1
@@ -0,0 +1,252 @@
+# lexical.py
+
+# Per-agent BM25 inverted index built at ingest time. It catches exact terms
+# (product codes, error IDs) that dense retrieval misses, and answers short
+# keyword queries without running the embedding model at all.
+
+import os
+import re
+import gzip
+import json
+import math
+import heapq
+import shutil
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# (term, chunk) pairs a LexicalIndexWriter keeps in memory before spilling them to a run file
+RUN_POSTINGS = 1_000_000
+
+# Keep codes such as "err-404", "v1.2" or "sku_123" as single terms
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+# Split text into lowercase terms
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+# Path of the lexical index of a collection, next to its vector store
+def lexical_index_path(collection: str, store_path: str) -> str:
+    return os.path.join(store_path, "lexical", f"{collection}.json.gz")
+
+class LexicalIndex:
+    def __init__(self) -> None:
+        # chunk id -> chunk text and its length in terms
+        self.contents: Dict[str, str] = {}
+        self.lengths: Dict[str, int] = {}
+        # term -> {chunk id: term frequency}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    # Add (or replace) a chunk
+    def add(self, doc_id: str, content: str) -> None:
+        if doc_id in self.contents:
+            self.remove([doc_id])
+        terms = tokenize(content or "")
+        self.contents[doc_id] = content or ""
+        self.lengths[doc_id] = len(terms)
+        self.total_length += len(terms)
+        frequencies: Dict[str, int] = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+
+    # Remove chunks by id; unknown ids are ignored
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        for doc_id in doc_ids:
+            content = self.contents.pop(doc_id, None)
+            if content is None:
+                continue
+            self.total_length -= self.lengths.pop(doc_id, 0)
+            for term in set(tokenize(content)):
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(doc_id, None)
+                    if not posting:
+                        del self.postings[term]
+
+    # Text of a chunk
+    def content(self, doc_id: str) -> str:
+        return self.contents.get(doc_id, "")
+
+    # Return the best (chunk id, BM25 score) pairs for a query
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        n = len(self.contents)
+        if n == 0 or top_k <= 0:
+            return []
+        average_length = self.total_length / n if self.total_length else 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            df = len(posting)
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            for doc_id, frequency in posting.items():
+                norm = K1 * (1.0 - B + B * self.lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (K1 + 1.0) / (frequency + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    # Save the index atomically; chunk ids are replaced by positions to keep postings compact
+    def save(self, path: str) -> None:
+        ids = list(self.contents)
+        positions = {doc_id: i for i, doc_id in enumerate(ids)}
+        data = {
+            "version": 1,
+            "ids": ids,
+            "contents": [self.contents[doc_id] for doc_id in ids],
+            "lengths": [self.lengths[doc_id] for doc_id in ids],
+            "postings": {
+                term: [[positions[doc_id], frequency] for doc_id, frequency in posting.items()]
+                for term, posting in self.postings.items()
+            },
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+
+    # Load a saved index, or None if the agent has none yet
+    @classmethod
+    def load(cls, path: str) -> Optional["LexicalIndex"]:
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls()
+        ids = data["ids"]
+        index.contents = dict(zip(ids, data["contents"]))
+        index.lengths = dict(zip(ids, data["lengths"]))
+        index.total_length = sum(data["lengths"])
+        index.postings = {
+            term: {ids[position]: frequency for position, frequency in posting}
+            for term, posting in data["postings"].items()
+        }
+        return index
+
+# Builds the index of a new version at ingest without holding it in memory: chunk
+# texts go to a temporary file as they are added, and postings are written to a
+# run file, sorted by term, every RUN_POSTINGS (term, chunk) pairs. save() merges
+# the runs into the same file LexicalIndex.save writes. Chunk ids must be unique.
+class LexicalIndexWriter:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # next to the index, dropping what an interrupted build left there
+        self._dir = f"{path}.build"
+        shutil.rmtree(self._dir, ignore_errors=True)
+        os.makedirs(self._dir)
+        # one JSON [id, content, length] per chunk, in position order
+        self._chunks = open(os.path.join(self._dir, "chunks.jsonl"), "w", encoding="utf-8")
+        # term -> positions and frequencies of the chunks added since the last run
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._pairs = 0
+        self._runs: List[str] = []
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, doc_id: str, content: str) -> None:
+        terms = tokenize(content or "")
+        self._chunks.write(json.dumps([doc_id, content or "", len(terms)], separators=(",", ":")) + "\n")
+        frequencies: Dict[str, int] = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+        for term, frequency in frequencies.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = (array("I"), array("I"))
+            posting[0].append(self.count)
+            posting[1].append(frequency)
+        self._pairs += len(frequencies)
+        self.count += 1
+        if self._pairs >= RUN_POSTINGS:
+            self._write_run()
+
+    # Write the index atomically and remove the temporary files
+    def save(self) -> None:
+        self._chunks.close()
+        if self._postings or not self._runs:
+            self._write_run()
+        chunks_path = os.path.join(self._dir, "chunks.jsonl")
+        temp_path = f"{self.path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            f.write('{"version":1')
+            # ids, contents and lengths are each one pass over the chunks file
+            for key, field in (("ids", 0), ("contents", 1), ("lengths", 2)):
+                f.write(f',"{key}":[')
+                with open(chunks_path, "r", encoding="utf-8") as chunks:
+                    for i, line in enumerate(chunks):
+                        if i:
+                            f.write(",")
+                        f.write(json.dumps(json.loads(line)[field], separators=(",", ":")))
+                f.write("]")
+            f.write(',"postings":{')
+            for i, (term, pairs) in enumerate(self._merged_postings()):
+                if i:
+                    f.write(",")
+                f.write(json.dumps(term))
+                f.write(":[")
+                f.write(",".join(f"[{position},{frequency}]" for position, frequency in pairs))
+                f.write("]")
+            f.write("}}")
+        os.replace(temp_path, self.path)
+        self.discard()
+
+    # Remove the temporary files without saving
+    def discard(self) -> None:
+        if not self._chunks.closed:
+            self._chunks.close()
+        self._postings = {}
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    # One line per term, in term order: term, then position frequency pairs
+    def _write_run(self) -> None:
+        path = os.path.join(self._dir, f"run-{len(self._runs):05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for term in sorted(self._postings):
+                positions, frequencies = self._postings[term]
+                f.write(term)
+                for position, frequency in zip(positions, frequencies):
+                    f.write(f" {position} {frequency}")
+                f.write("\n")
+        self._runs.append(path)
+        self._postings = {}
+        self._pairs = 0
+
+    # (term, [(position, frequency)]) of all runs, by term; the runs hold increasing
+    # positions and the merge is stable, so each posting stays in position order
+    def _merged_postings(self) -> Iterator[Tuple[str, List[Tuple[int, int]]]]:
+        files = [open(path, "r", encoding="utf-8") for path in self._runs]
+        try:
+            lines = heapq.merge(*files, key=lambda line: line.split(" ", 1)[0].rstrip("\n"))
+            term, pairs = None, []
+            for line in lines:
+                fields = line.split()
+                if fields[0] != term:
+                    if term is not None:
+                        yield term, pairs
+                    term, pairs = fields[0], []
+                values = fields[1:]
+                pairs.extend((int(values[i]), int(values[i + 1])) for i in range(0, len(values), 2))
+            if term is not None:
+                yield term, pairs
+        finally:
+            for f in files:
+                f.close()
+
+# Combine several rankings (best first) with reciprocal-rank fusion
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
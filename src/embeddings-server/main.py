@@ -1,13 +1,24 @@
 from fastapi import FastAPI, HTTPException, Request, Body
+from fastapi.responses import JSONResponse, PlainTextResponse
 from starlette.datastructures import Headers
 from typing import List, Optional
 import os
+import time
 import httpx
 import asyncio
 from typing import Optional, Dict, Any
 from config import settings
-from chunker import chunk_files_in_dir
-from retriever import get_chunks
+from chunker import chunk_files_in_dir, shutdown_process_pool
+from retriever import get_chunks, get_lexical_chunks, lexical_fastpath_applies
+from registry import invalidate_agent
+from embedder import embed_texts
+from reranker import reranker_stats
+from versions import start_version_gc, stop_version_gc
+from warmup import Warmup
+from batcher import EmbeddingBatcher
+from cache import QueryEmbeddingCache
+from executors import BoundedExecutor, ExecutorBusy
+from metrics import Gauge, QUERIES, QUERY_CHUNKS, QUERY_EMBEDDING_CACHE, QUERY_STAGE_SECONDS, render_metrics
 
 # Initialize FastAPI
 app = FastAPI()
@@ -38,16 +49,80 @@ def verify_x_api_key(headers: Headers) -> str:
 
 # define embedding model_path 
 embedding_model_path = os.path.join(settings.models_dir, settings.embedding_model_name)
+# cached query embeddings are only valid for the model and backend that produced them
+embedding_cache_key = f"{embedding_model_path}:{settings.embedding_backend}"
 # Initialize the embedding_model & tokenizer
 #embedding_model = AutoModel.from_pretrained(embedding_model_path)
 #embedding_tokenizer = AutoTokenizer.from_pretrained(embedding_model_path)
 
+# coalesce concurrent query embeddings into batched forward passes
+query_batcher = EmbeddingBatcher(
+    encode=lambda texts: embed_texts(embedding_model_path, texts),
+    max_batch_size=settings.query_batch_max_size,
+    max_wait_ms=settings.query_batch_max_wait_ms,
+    max_pending=settings.query_queue_size,
+    retry_after=settings.query_retry_after)
+
+# cache of query embeddings for repeated prompts
+query_cache = QueryEmbeddingCache(
+    max_size=settings.query_cache_size,
+    ttl_seconds=settings.query_cache_ttl_seconds,
+    disk_path=os.path.join(settings.cache_dir, "query_embeddings.db") if settings.query_cache_disk else None,
+    disk_max_entries=settings.query_cache_disk_max_entries)
+
+# separate pools so ingestion can never starve retrieval
+ingest_executor = BoundedExecutor("ingest", settings.ingest_workers, settings.ingest_queue_size, retry_after=settings.ingest_retry_after)
+query_executor = BoundedExecutor("query", settings.query_workers, settings.query_queue_size, retry_after=settings.query_retry_after)
+
+# queue depths are read when /metrics is scraped, not tracked per request
+Gauge("sia_queue_depth", "Requests waiting in each queue", ("queue",), callback=lambda: {
+    ("embed",): query_batcher.stats()["pending"],
+    ("ingest",): ingest_executor.stats()["queued"],
+    ("query",): query_executor.stats()["queued"],
+})
+Gauge("sia_executor_running", "Requests running in each pool", ("pool",), callback=lambda: {
+    ("ingest",): ingest_executor.stats()["running"],
+    ("query",): query_executor.stats()["running"],
+})
+Gauge("sia_executor_rejected", "Requests rejected by each pool since start", ("pool",), callback=lambda: {
+    ("ingest",): ingest_executor.stats()["rejected"],
+    ("query",): query_executor.stats()["rejected"],
+})
+
+# loads the models and the most used stores before /ready reports 200
+warmup = Warmup(embedding_model_path, settings.store_dir)
+warmup_task: Optional[asyncio.Future] = None
+
+@app.on_event("startup")
+async def startup() -> None:
+    global warmup_task
+    # drop superseded index versions in the background
+    start_version_gc(settings.store_dir)
+    # warm up in a thread so /health answers while the model loads
+    warmup_task = asyncio.get_running_loop().run_in_executor(None, warmup.run)
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    stop_version_gc()
+    await query_batcher.stop()
+    ingest_executor.shutdown()
+    query_executor.shutdown()
+    shutdown_process_pool()
+
+# Reject work quickly when a pool is full instead of letting the request hang
+@app.exception_handler(ExecutorBusy)
+async def executor_busy_handler(request: Request, exc: ExecutorBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Server busy ({exc.name}), retry later"},
+        headers={"Retry-After": str(exc.retry_after)})
+
 # 1. Route to generate chunks and save them in the vector store
 @app.post("/generate")
 async def generate(
     request: Request, 
     body: Dict[str, Any] = Body(...)
-    ) -> Dict[str, str]:
+    ) -> Dict[str, Any]:
 
     # verify request is from api-server
     verify_x_api_key(headers=request.headers)
@@ -60,35 +135,100 @@ async def generate(
     if not os.path.exists(agent_dir):
         raise HTTPException(status_code=404, detail="Agent directory not found")
 
-    chunk_files_in_dir(agent_name, agent_dir, embedding_model_path, settings.store_dir)    
+    # only added or changed files are re-indexed unless a full rebuild is asked for
+    full: bool = bool(body.get("full", False))
+
+    # ingest in the dedicated pool so queries and /health stay responsive
+    summary = await ingest_executor.run(chunk_files_in_dir, agent_name, agent_dir, embedding_model_path, settings.store_dir, full=full)
+    # drop cached handles so the next query opens the rebuilt store
+    invalidate_agent(agent_name)
  
     # notify api server
     #asyncio.create_task(notify_api_server(agent_name=agent_name))
 
     # return message
-    return {"result": "done"}
+    return {"result": "done", "files": summary}
 
 # 2. Route to query the vector store based on input query and agent
 @app.post("/query")
 async def query(
     request: Request,
     agent_name: str = Body(...), 
-    prompt: str  = Body(...)
+    prompt: str  = Body(...),
+    include_embedding: bool = Body(False)
     ):
 
     # verify headers
     verify_x_api_key(headers=request.headers)
 
+    # short keyword queries may be answered from the lexical index without embedding;
+    # the term count is checked here so other queries skip the trip to the executor
+    if lexical_fastpath_applies(prompt):
+        chunks = await query_executor.run(get_lexical_chunks, agent_name, prompt, settings.store_dir)
+        if chunks is not None:
+            return query_response(agent_name, prompt, chunks, "lexical")
+
+    # reuse the embedding of a repeated prompt, else embed it together with concurrent queries;
+    # the disk tier of the cache is read off the event loop
+    query_embedding = query_cache.get_memory(embedding_cache_key, prompt)
+    if query_embedding is None and query_cache.disk_enabled:
+        query_embedding = await asyncio.to_thread(query_cache.get_disk, embedding_cache_key, prompt)
+    if query_embedding is None:
+        QUERY_EMBEDDING_CACHE.labels("miss").inc()
+        started = time.perf_counter()
+        query_embedding = await query_batcher.embed(prompt)
+        QUERY_STAGE_SECONDS.labels(agent_name, "embed").observe(time.perf_counter() - started)
+        query_cache.put(embedding_cache_key, prompt, query_embedding)
+    else:
+        QUERY_EMBEDDING_CACHE.labels("hit").inc()
     # initialize Query Handler
-    chunks = get_chunks(agent_name, prompt, embedding_model_path, settings.store_dir)
-    
-    return {
+    chunks = await query_executor.run(get_chunks, agent_name, prompt, embedding_model_path, settings.store_dir, query_embedding=query_embedding)
+    return query_response(agent_name, prompt, chunks, "vector", query_embedding if include_embedding else None)
+
+# Serialize the result of a query, timing the JSON encoding. The prompt's embedding
+# is included when asked for (the api-server matches similar questions with it);
+# the lexical fast path has none.
+def query_response(agent_name: str, prompt: str, chunks: List[str], path: str, embedding: Optional[List[float]] = None) -> JSONResponse:
+    started = time.perf_counter()
+    content = {
             "status": "success",
             "agent_name": agent_name,
             "prompt": prompt,
             "results": chunks
     }
+    if embedding is not None:
+        content["embedding"] = embedding
+    response = JSONResponse(content=content)
+    QUERY_STAGE_SECONDS.labels(agent_name, "serialize").observe(time.perf_counter() - started)
+    QUERIES.labels(agent_name, path).inc()
+    QUERY_CHUNKS.labels(agent_name).inc(len(chunks))
+    return response
 
 @app.get("/health")
 async def health_check():
-    return {"status": "OK"}
\ No newline at end of file
+    return {"status": "OK"}
+
+# Prometheus metrics of this worker process
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Readiness: 503 until startup warm-up is done, with the seconds of each phase
+@app.get("/ready")
+async def ready_check():
+    status = warmup.status()
+    if not warmup.ready:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+# Internal stats used to tune the server
+@app.get("/stats")
+async def stats():
+    return {
+        "query_batcher": query_batcher.stats(),
+        "query_cache": query_cache.stats(),
+        "ingest_executor": ingest_executor.stats(),
+        "query_executor": query_executor.stats(),
+        "reranker": reranker_stats(),
+        "warmup": warmup.status(),
+    }
\ No newline at end of file
@@ -0,0 +1,69 @@
+# manifest.py
+
+# Per-agent manifest of the files that have been indexed: content hash, size,
+# mtime and the ids of the chunks written for each file. It lets a rebuild
+# process only added or changed files and delete the chunks of removed ones.
+
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Optional
+
+# Path of the manifest of a collection, next to its vector store
+def manifest_path(collection: str, store_path: str) -> str:
+    return os.path.join(store_path, "manifests", f"{collection}.json")
+
+# SHA-256 of a file's content, read in blocks
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# What was indexed for one file
+class FileEntry:
+    def __init__(self, hash: str, size: int, mtime: float, chunk_ids: Optional[List[str]] = None, duplicate_of: Optional[List[str]] = None) -> None:
+        self.hash = hash
+        self.size = size
+        self.mtime = mtime
+        self.chunk_ids = chunk_ids or []
+        # files holding the chunks this file's duplicate chunks were dropped for
+        self.duplicate_of = duplicate_of or []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"hash": self.hash, "size": self.size, "mtime": self.mtime, "chunk_ids": self.chunk_ids, "duplicate_of": self.duplicate_of}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FileEntry":
+        return cls(hash=data["hash"], size=data["size"], mtime=data["mtime"], chunk_ids=data.get("chunk_ids", []), duplicate_of=data.get("duplicate_of", []))
+
+class Manifest:
+    def __init__(self, signature: Optional[Dict[str, Any]] = None, files: Optional[Dict[str, FileEntry]] = None) -> None:
+        # the settings the chunks were built with; a different signature means a full rebuild
+        self.signature = signature or {}
+        # path relative to the agent dir -> entry
+        self.files = files or {}
+
+    # Save the manifest atomically
+    def save(self, path: str) -> None:
+        data = {
+            "version": 1,
+            "signature": self.signature,
+            "files": {name: entry.to_dict() for name, entry in self.files.items()},
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+
+    # Load a saved manifest, or None if the agent has not been indexed with one
+    @classmethod
+    def load(cls, path: str) -> Optional["Manifest"]:
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        files = {name: FileEntry.from_dict(entry) for name, entry in data.get("files", {}).items()}
+        return cls(signature=data.get("signature", {}), files=files)
@@ -0,0 +1,91 @@
+# memory.py
+
+# Peak resident memory of one ingest run, counting this process and the
+# preprocessing worker processes. getrusage cannot do this: ru_maxrss of
+# RUSAGE_SELF is the peak since the process started, and RUSAGE_CHILDREN only
+# covers children that have exited. On Linux the resident size of this process
+# and of its child processes is sampled from /proc while the run lasts
+# and the largest total is kept; nothing process-wide is reset, so runs in
+# parallel do not disturb each other. They do share the server process and the
+# worker pool though, so with INGEST_WORKERS>1 each run reports the memory of
+# all the runs in progress. Elsewhere the lifetime peak is reported.
+
+import os
+import sys
+import resource
+import glob
+import threading
+from typing import List, Optional
+
+# seconds between samples
+SAMPLE_INTERVAL = 0.05
+
+_PAGE_KB = os.sysconf("SC_PAGE_SIZE") // 1024 if hasattr(os, "sysconf") else 4
+_HAS_PROC = os.path.exists("/proc/self/statm")
+
+# Resident memory of a process in kB, or 0 if it is gone
+def _rss_kb(pid: str) -> int:
+    try:
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_KB
+    except (OSError, IndexError, ValueError):
+        return 0
+
+# Pids of the child processes of this process, listed per thread that started them
+def _child_pids() -> List[str]:
+    pids: List[str] = []
+    for path in glob.glob("/proc/self/task/*/children"):
+        try:
+            with open(path, "r") as f:
+                pids.extend(f.read().split())
+        except OSError:
+            continue
+    return pids
+
+def _lifetime_peak_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+# Tracks the peak from start() until stop(); peak_mb() may be read while it runs
+class PeakMemory:
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        self.interval = interval
+        self._peak_kb = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "PeakMemory":
+        if not _HAS_PROC:
+            return self
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name="peak-memory", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> float:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._sample()
+        return self.peak_mb()
+
+    # Peak in MB: this process and its worker processes together
+    def peak_mb(self) -> float:
+        if not _HAS_PROC:
+            return _lifetime_peak_mb()
+        return self._peak_kb / 1024
+
+    def __enter__(self) -> "PeakMemory":
+        return self.start()
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        total = _rss_kb("self") + sum(_rss_kb(pid) for pid in _child_pids())
+        self._peak_kb = max(self._peak_kb, total)
@@ -0,0 +1,158 @@
+# metrics.py
+
+# Lightweight in-process metrics used to tune the server, rendered in the
+# Prometheus text format on /metrics. Each uvicorn worker process keeps its own.
+
+import bisect
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Histogram with fixed upper bounds; values above the last bound go to "+Inf"
+class Histogram:
+    def __init__(self, buckets: List[float]) -> None:
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    # Record a single value
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    # Return the cumulative bucket counts, the total and the sum
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self._counts)
+            total, value_sum = self._count, self._sum
+        cumulative: Dict[str, int] = {}
+        running = 0
+        for bound, count in zip(self.buckets + [float("inf")], counts):
+            running += count
+            cumulative["+Inf" if bound == float("inf") else f"{bound:g}"] = running
+        return {"buckets": cumulative, "count": total, "sum": value_sum}
+
+# Counter or gauge value of one series
+class Value:
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+# A named metric with one series per set of label values. Series are created on
+# first use and cached, so recording costs a dict lookup and a lock. A family
+# with a callback has no series of its own: the callback returns the values
+# (label values -> value) when metrics are rendered, at no cost in between.
+class Family:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.callback = callback
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    # The series of the given label values
+    def labels(self, *values: Any) -> Any:
+        key = tuple(str(value) for value in values)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, self._new_series())
+        return series
+
+    def _new_series(self) -> Any:
+        return Value()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.callback is not None:
+            values = self.callback()
+        else:
+            with self._lock:
+                values = {key: series.value for key, series in self._series.items()}
+        for key, value in values.items():
+            lines.append(f"{self.name}{_label_text(self.label_names, key)} {_number(value)}")
+        return lines
+
+class Counter(Family):
+    kind = "counter"
+
+class Gauge(Family):
+    kind = "gauge"
+
+# Histograms sharing the same bounds, one per set of label values
+class HistogramFamily(Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Optional[List[float]] = None) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = buckets or STAGE_BUCKETS
+
+    def _new_series(self) -> Histogram:
+        return Histogram(self.buckets)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = list(self._series.items())
+        for key, histogram in series:
+            snapshot = histogram.snapshot()
+            for bound, count in snapshot["buckets"].items():
+                lines.append(f"{self.name}_bucket{_label_text(self.label_names + ('le',), key + (bound,))} {count}")
+            labels = _label_text(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_number(snapshot['sum'])}")
+            lines.append(f"{self.name}_count{labels} {snapshot['count']}")
+        return lines
+
+# Every metric family of this process, in registration order
+REGISTRY: List[Family] = []
+
+# All metrics in the Prometheus text exposition format
+def render_metrics() -> str:
+    lines: List[str] = []
+    for family in REGISTRY:
+        lines.extend(family.render())
+    return "\n".join(lines) + "\n"
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f"{name}=\"{value}\"")
+    return "{" + ",".join(pairs) + "}"
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else f"{value:.6g}"
+
+# seconds, from a cached query to a large ingest batch
+STAGE_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+# Ingest
+INGEST_STAGE_SECONDS = HistogramFamily("sia_ingest_stage_seconds", "Seconds per ingest batch in each stage: copy, convert, clean, split, dedup, embed, write", ("agent", "stage"))
+INGEST_SECONDS = HistogramFamily("sia_ingest_seconds", "Seconds per ingest run", ("agent",))
+INGEST_FILES = Counter("sia_ingest_files_total", "Files seen by ingest runs: indexed, unchanged, deleted or failed", ("agent", "result"))
+INGEST_CHUNKS = Counter("sia_ingest_chunks_total", "Chunks of ingest runs: embedded, copied from the previous version or dropped as duplicates", ("agent", "source"))
+EMBED_BATCH_SIZE = HistogramFamily("sia_embed_batch_size", "Texts per embedding forward pass", ("kind",), [1, 2, 4, 8, 16, 32, 64, 128, 256])
+
+# Query
+QUERY_STAGE_SECONDS = HistogramFamily("sia_query_stage_seconds", "Seconds per query in each stage: embed, search, rerank, lexical, serialize", ("agent", "stage"))
+QUERIES = Counter("sia_queries_total", "Queries answered, by path: lexical fast path or vector search", ("agent", "path"))
+QUERY_CHUNKS = Counter("sia_query_chunks_total", "Chunks returned by queries", ("agent",))
+QUERY_EMBEDDING_CACHE = Counter("sia_query_embedding_cache_total", "Query embedding cache lookups: hit or miss", ("result",))
+QUERY_QUEUE_WAIT_MS = HistogramFamily("sia_query_queue_wait_milliseconds", "Milliseconds a prompt waited for its embedding batch", (), [0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000])
@@ -0,0 +1,73 @@
+# ranking.py
+
+# Re-ranking of a retrieved candidate pool. Every strategy works on the
+# candidate embedding matrix with NumPy; the only Python loop is MMR's
+# k selection steps, each of which is a single matrix-vector product.
+
+from typing import List, Sequence
+import numpy as np
+from haystack import Document
+
+# Scale the rows of a matrix to unit length
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+# Indices of the k most similar candidates, best first
+def rank_knn(similarities: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(similarities))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    # argpartition keeps the cost linear in the pool size
+    top = np.argpartition(-similarities, k - 1)[:k]
+    return top[np.argsort(-similarities[top], kind="stable")]
+
+# Indices of the candidates at or above the threshold, best first, at most k
+def rank_threshold(similarities: np.ndarray, k: int, threshold: float) -> np.ndarray:
+    above = np.flatnonzero(similarities >= threshold)
+    return above[rank_knn(similarities[above], k)]
+
+# Indices chosen by maximal marginal relevance: relevance to the query traded
+# off (by mmr_lambda) against similarity to the candidates already chosen
+def rank_mmr(similarities: np.ndarray, candidates: np.ndarray, k: int, mmr_lambda: float) -> np.ndarray:
+    n = len(similarities)
+    k = min(k, n)
+    selected = np.empty(k, dtype=np.int64)
+    if k <= 0:
+        return selected
+
+    relevance = mmr_lambda * similarities
+    redundancy = np.full(n, -np.inf)
+    chosen = np.zeros(n, dtype=bool)
+    for step in range(k):
+        scores = relevance if step == 0 else relevance - (1.0 - mmr_lambda) * redundancy
+        scores = np.where(chosen, -np.inf, scores)
+        index = int(np.argmax(scores))
+        selected[step] = index
+        chosen[index] = True
+        # track each candidate's highest similarity to anything selected so far
+        redundancy = np.maximum(redundancy, candidates @ candidates[index])
+    return selected
+
+# Rank a normalized query against a normalized candidate matrix with the given strategy
+def rank(strategy: str, query: np.ndarray, candidates: np.ndarray, k: int, threshold: float = 0.0, mmr_lambda: float = 0.5) -> np.ndarray:
+    similarities = candidates @ query
+    if strategy == "mmr":
+        return rank_mmr(similarities, candidates, k, mmr_lambda)
+    if strategy == "threshold":
+        return rank_threshold(similarities, k, threshold)
+    return rank_knn(similarities, k)
+
+# Re-rank retrieved documents by their embeddings and keep the best k
+def rerank_documents(strategy: str, query_embedding: Sequence[float], documents: List[Document], k: int, threshold: float = 0.0, mmr_lambda: float = 0.5) -> List[Document]:
+    if not documents:
+        return []
+    if any(d.embedding is None for d in documents):
+        # without embeddings the store order is the best we have
+        return documents[:k]
+
+    query = normalize_rows(np.asarray(query_embedding, dtype=np.float32))
+    candidates = normalize_rows(np.asarray([d.embedding for d in documents], dtype=np.float32))
+    order = rank(strategy, query, candidates, k, threshold=threshold, mmr_lambda=mmr_lambda)
+    return [documents[i] for i in order]
@@ -0,0 +1,156 @@
+# registry.py
+
+# Process-wide registry of open per-agent stores. Opening a store costs far
+# more than a single query, so stores are opened once and reused across
+# requests. Embedding models are cached in embedder.py.
+#
+# The agents opened most recently are listed in store_dir/recent_agents.json,
+# so a restarted server can open them during warm-up.
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from lexical import LexicalIndex, lexical_index_path
+from vector_store import VectorStore, open_vector_store
+from versions import collection_name, current_version
+
+# Handles kept for one agent: the vector store and the lexical index. The lexical
+# index holds every chunk text, so it is only loaded by the first query that uses
+# it, under RETRIEVAL_STRATEGY=hybrid; it is None under the other strategies or
+# if the agent has not been indexed yet.
+class StoreHandle:
+    def __init__(self, vector_store: VectorStore, lexical_path: Optional[str] = None, version: int = 0) -> None:
+        self.vector_store = vector_store
+        # the version of the agent's index the handles belong to
+        self.version = version
+        self.last_used = time.monotonic()
+        self._lexical_path = lexical_path
+        self._lexical_index: Optional[LexicalIndex] = None
+        self._lexical_loaded = False
+        self._lexical_lock = threading.Lock()
+
+    @property
+    def lexical_index(self) -> Optional[LexicalIndex]:
+        if settings.retrieval_strategy != "hybrid" or self._lexical_path is None:
+            return None
+        if not self._lexical_loaded:
+            with self._lexical_lock:
+                if not self._lexical_loaded:
+                    self._lexical_index = LexicalIndex.load(self._lexical_path)
+                    self._lexical_loaded = True
+        return self._lexical_index
+
+_stores_lock = threading.Lock()
+_stores: "OrderedDict[Tuple[str, str], StoreHandle]" = OrderedDict()
+# per agent: held while its store is being opened
+_opening: Dict[Tuple[str, str], threading.Lock] = {}
+
+# agents kept in the recently used list
+RECENT_AGENTS_MAX = 100
+
+# Get the store handle of an agent, opening it if it is not cached. A store is
+# opened outside _stores_lock, under a lock of its own agent, so opening one
+# agent neither blocks queries of the others nor happens twice at once.
+def get_store(agent_name: str, store_path: str) -> StoreHandle:
+    key = (agent_name, store_path)
+    # another worker process may have published a new version since the handle was opened
+    version = current_version(agent_name, store_path)
+    handle = _cached_handle(key, version)
+    if handle is not None:
+        return handle
+
+    with _opening_lock(key):
+        # opened by another thread while this one waited
+        handle = _cached_handle(key, version)
+        if handle is not None:
+            return handle
+        collection = collection_name(agent_name, version)
+        vector_store = open_vector_store(collection, store_path)
+        handle = StoreHandle(vector_store=vector_store, lexical_path=lexical_index_path(collection, store_path), version=version)
+        with _stores_lock:
+            cached = _stores.get(key)
+            # keep a newer version opened meanwhile for a later alias
+            if cached is None or cached.version <= version:
+                _stores[key] = handle
+                _stores.move_to_end(key)
+            # drop the least recently used agents beyond the cache size
+            while len(_stores) > max(settings.store_cache_size, 1):
+                _stores.popitem(last=False)
+    _record_recent(agent_name, store_path)
+    return handle
+
+# The cached handle of an agent if it is open at the given version
+def _cached_handle(key: Tuple[str, str], version: int) -> Optional[StoreHandle]:
+    now = time.monotonic()
+    with _stores_lock:
+        _evict_idle(now)
+        handle = _stores.get(key)
+        if handle is None or handle.version != version:
+            return None
+        _stores.move_to_end(key)
+        handle.last_used = now
+        return handle
+
+def _opening_lock(key: Tuple[str, str]) -> threading.Lock:
+    with _stores_lock:
+        lock = _opening.get(key)
+        if lock is None:
+            lock = _opening[key] = threading.Lock()
+        return lock
+
+# Drop the cached handles of an agent, e.g. after its store has been rebuilt
+def invalidate_agent(agent_name: str) -> None:
+    with _stores_lock:
+        for key in [k for k in _stores if k[0] == agent_name]:
+            del _stores[key]
+
+# Remove handles that have not been used within the idle timeout (lock must be held)
+def _evict_idle(now: float) -> None:
+    if settings.store_cache_idle_seconds <= 0:
+        return
+    cutoff = now - settings.store_cache_idle_seconds
+    # entries are ordered by last use, so stop at the first fresh one
+    while _stores:
+        key, handle = next(iter(_stores.items()))
+        if handle.last_used >= cutoff:
+            break
+        del _stores[key]
+
+# Path of the list of recently opened agents
+def recent_agents_path(store_path: str) -> str:
+    return os.path.join(store_path, "recent_agents.json")
+
+# The most recently opened agents, newest first
+def recent_agents(store_path: str, limit: int) -> List[str]:
+    opened = _read_recent(store_path)
+    return sorted(opened, key=opened.get, reverse=True)[:max(limit, 0)]
+
+def _read_recent(store_path: str) -> Dict[str, float]:
+    try:
+        with open(recent_agents_path(store_path), "r", encoding="utf-8") as f:
+            return {str(name): float(opened) for name, opened in json.load(f).items()}
+    except (FileNotFoundError, ValueError, AttributeError):
+        return {}
+
+# Note when an agent was opened. Runs only when a handle is (re)opened, not on
+# every query; other worker processes share the file, so their entries are kept.
+def _record_recent(agent_name: str, store_path: str) -> None:
+    try:
+        opened = _read_recent(store_path)
+        opened[agent_name] = time.time()
+        newest = sorted(opened, key=opened.get, reverse=True)[:RECENT_AGENTS_MAX]
+        path = recent_agents_path(store_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({name: opened[name] for name in newest}, f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        # the list only speeds up warm-up, a query must not fail over it
+        if settings.DEBUG:
+            print(f"Could not record recent agent {agent_name}: {e}")
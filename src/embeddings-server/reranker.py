@@ -0,0 +1,92 @@
+# reranker.py
+
+# Optional cross-encoder re-ranking of retrieved chunks, enabled by setting
+# RERANK_MODEL_NAME to a model in the models dir. The retrieval strategy selects
+# RERANK_CANDIDATES chunks, the cross-encoder scores them against the prompt
+# in batches and the best TOP_N are returned.
+#
+# Scoring is kept within RERANK_BUDGET_MS per request. A running average of the
+# cost per pair decides how many candidates fit in the budget; those are
+# re-ordered by score and the rest keep their vector order behind them. When
+# none fit, the vector order is returned unchanged.
+
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+from config import settings
+
+# weight of the latest batch in the running average of the cost per pair
+EWMA_ALPHA = 0.2
+
+class CrossEncoderReranker:
+    def __init__(self, model_path: str) -> None:
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_path)
+        self.batch_size = max(settings.rerank_batch_size, 1)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "full": 0, "partial": 0, "skipped": 0}
+        # estimated ms to score one pair, measured on a warm-up batch
+        self.pair_ms = 0.0
+        self._score("warm up", ["warm up the cross-encoder"] * self.batch_size)
+
+    # Score the texts against the query and update the cost estimate
+    def _score(self, query: str, texts: List[str]) -> List[float]:
+        started = time.perf_counter()
+        scores = self.model.predict([(query, text) for text in texts], batch_size=len(texts), show_progress_bar=False)
+        pair_ms = (time.perf_counter() - started) * 1000.0 / len(texts)
+        with self._lock:
+            self.pair_ms = pair_ms if self.pair_ms == 0.0 else EWMA_ALPHA * pair_ms + (1 - EWMA_ALPHA) * self.pair_ms
+        return [float(score) for score in scores]
+
+    # Re-order the candidates (in vector order) by cross-encoder score and keep top_n
+    def rerank(self, query: str, candidates: List[str], top_n: int, budget_ms: float) -> List[str]:
+        deadline = time.perf_counter() + budget_ms / 1000.0
+        scores: List[float] = []
+        while len(scores) < len(candidates):
+            size = min(self.batch_size, len(candidates) - len(scores))
+            remaining_ms = (deadline - time.perf_counter()) * 1000.0
+            # stop before a batch that would overrun the budget
+            if budget_ms > 0 and self.pair_ms * size > remaining_ms:
+                break
+            scores.extend(self._score(query, candidates[len(scores):len(scores) + size]))
+
+        scored = len(scores)
+        with self._lock:
+            self._stats["requests"] += 1
+            if scored == len(candidates):
+                self._stats["full"] += 1
+            elif scored:
+                self._stats["partial"] += 1
+            else:
+                self._stats["skipped"] += 1
+
+        # best scored first, then the unscored candidates in vector order
+        order = sorted(range(scored), key=lambda i: scores[i], reverse=True) + list(range(scored, len(candidates)))
+        return [candidates[i] for i in order[:top_n]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "pair_ms": round(self.pair_ms, 3)}
+
+_reranker_lock = threading.Lock()
+_reranker: Optional[CrossEncoderReranker] = None
+
+# Get the loaded reranker, or None when RERANK_MODEL_NAME is not set
+def get_reranker() -> Optional[CrossEncoderReranker]:
+    global _reranker
+    if not settings.rerank_model_name:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            # another thread may have loaded it while we waited
+            if _reranker is None:
+                _reranker = CrossEncoderReranker(os.path.join(settings.models_dir, settings.rerank_model_name))
+                if settings.DEBUG:
+                    print(f"Loaded rerank model {settings.rerank_model_name}, {_reranker.pair_ms:.2f} ms per pair")
+    return _reranker
+
+# Stats of the reranker, or None if it is disabled or not loaded yet
+def reranker_stats() -> Optional[Dict[str, Any]]:
+    return _reranker.stats() if _reranker is not None else None
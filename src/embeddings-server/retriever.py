@@ -1,35 +1,82 @@
-# chunker.py
+# retriever.py
 
-import os
-from pathlib import Path
-from haystack import Pipeline
-from haystack.components.embedders import SentenceTransformersDocumentEmbedder
-from haystack.components.embedders import SentenceTransformersTextEmbedder
-from haystack_integrations.document_stores.chroma import ChromaDocumentStore
-from haystack_integrations.components.retrievers.chroma import ChromaEmbeddingRetriever
+import time
+from typing import List, Optional
 
+from embedder import embed_texts
+from registry import get_store
+from ranking import rerank_documents
+from reranker import get_reranker
+from lexical import tokenize, reciprocal_rank_fusion
 from config import settings
+from metrics import QUERY_STAGE_SECONDS
 
-def get_chunks(agent_name:str, input: str, model_path: str, store_path: str):
-
-    # set the embedder
-    text_embedder = SentenceTransformersTextEmbedder(model=model_path)
-    # set the store
-    document_store = ChromaDocumentStore(collection_name=f"agent_{agent_name}", persist_path=store_path, distance_function=settings.distance_metric)
-    # set the retriever for the store
-    retriever = ChromaEmbeddingRetriever(document_store=document_store, top_k=settings.top_n)
-
-    # add components to the pipeline
-    querying_pipeline = Pipeline()
-    # embedder
-    querying_pipeline.add_component("query_embedder", text_embedder)
-    querying_pipeline.add_component("retriever", retriever)
-    querying_pipeline.connect("query_embedder.embedding", "retriever.query_embedding")
-    results = querying_pipeline.run({"query_embedder": {"text": input}})
-    chunks = []
-    count = 1
-    for d in results["retriever"]["documents"]:
-        count=count+1
-        chunks.append(d.content)
+# Whether a query is short enough for the lexical fast path. Only tokenizes the
+# input, so it is cheap enough to check on the event loop
+def lexical_fastpath_applies(input: str) -> bool:
+    if settings.retrieval_strategy != "hybrid" or settings.lexical_fastpath_max_terms <= 0:
+        return False
+    terms = tokenize(input)
+    return 0 < len(terms) <= settings.lexical_fastpath_max_terms
 
+# Answer a short keyword query from the lexical index alone, skipping the
+# embedding model. Returns None when the query should take the full path.
+def get_lexical_chunks(agent_name: str, input: str, store_path: str) -> Optional[List[str]]:
+    if not lexical_fastpath_applies(input):
+        return None
+
+    started = time.perf_counter()
+    index = get_store(agent_name, store_path).lexical_index
+    if index is None:
+        return None
+    hits = index.search(input, settings.top_n)
+    QUERY_STAGE_SECONDS.labels(agent_name, "lexical").observe(time.perf_counter() - started)
+    if not hits:
+        # nothing matched literally, so let the vector search try
+        return None
+    return [index.content(doc_id) for doc_id, _ in hits]
+
+def get_chunks(agent_name:str, input: str, model_path: str, store_path: str, query_embedding: Optional[List[float]] = None) -> List[str]:
+
+    # embed the input unless the caller already did (e.g. in a batch)
+    if query_embedding is None:
+        started = time.perf_counter()
+        query_embedding = embed_texts(model_path, [input])[0]
+        QUERY_STAGE_SECONDS.labels(agent_name, "embed").observe(time.perf_counter() - started)
+
+    # reuse the open store of the agent; components are shared between
+    # requests, so they are run directly instead of in a new pipeline
+    started = time.perf_counter()
+    store = get_store(agent_name, store_path)
+    strategy = settings.retrieval_strategy
+    # with a cross-encoder the strategy selects a wider list for it to re-order
+    reranker = get_reranker()
+    k = max(settings.rerank_candidates, settings.top_n) if reranker is not None else settings.top_n
+    pool_size = max(settings.initial_results, k)
+
+    if strategy == "hybrid" and store.lexical_index is not None:
+        # fuse the vector and BM25 rankings of a wider pool
+        vector_documents = store.vector_store.search(query_embedding, pool_size)
+        lexical_hits = store.lexical_index.search(input, pool_size)
+        fused = reciprocal_rank_fusion(
+            [[d.id for d in vector_documents], [doc_id for doc_id, _ in lexical_hits]],
+            k=settings.rrf_k)
+        contents = {d.id: d.content for d in vector_documents}
+        chunks = [contents.get(doc_id) or store.lexical_index.content(doc_id) for doc_id in fused[:k]]
+    elif strategy in ("mmr", "threshold"):
+        # pull a wider pool and re-rank it on the candidate embeddings
+        candidates = store.vector_store.search(query_embedding, pool_size)
+        documents = rerank_documents(
+            strategy, query_embedding, candidates, k,
+            threshold=settings.threshold_similarity, mmr_lambda=settings.mmr_lambda)
+        chunks = [d.content for d in documents]
+    else:
+        chunks = [d.content for d in store.vector_store.search(query_embedding, k)]
+
+    QUERY_STAGE_SECONDS.labels(agent_name, "search").observe(time.perf_counter() - started)
+
+    if reranker is not None:
+        started = time.perf_counter()
+        chunks = reranker.rerank(input, chunks, settings.top_n, settings.rerank_budget_ms)
+        QUERY_STAGE_SECONDS.labels(agent_name, "rerank").observe(time.perf_counter() - started)
     return chunks
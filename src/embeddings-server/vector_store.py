@@ -0,0 +1,593 @@
+# vector_store.py
+
+# Vector stores holding the embedded chunks of an agent, selected with VECTOR_STORE:
+#   chroma - ChromaDocumentStore under store_dir (default)
+#   flat   - exact search over a memory-mapped per-agent matrix under
+#            store_dir/flat, without SQLite or per-query serialization
+# The chunker writes through write/delete/clear/save and the retriever reads
+# through search, so neither depends on the backend. A store is opened by
+# collection name (agent_<name>_v<n>, see versions.py).
+
+import os
+import json
+import gzip
+import shutil
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from haystack import Document
+from haystack_integrations.document_stores.chroma import ChromaDocumentStore
+from haystack_integrations.components.retrievers.chroma import ChromaEmbeddingRetriever
+
+from config import settings
+
+VECTOR_STORES = ("chroma", "flat")
+
+# rows of a flat store widened to float32 at a time during a search, and
+# converted at a time when a build is saved
+SEARCH_BLOCK_ROWS = 4096
+SAVE_BLOCK_ROWS = 65536
+
+# chunks sent to Chroma per call
+CHROMA_BATCH = 1000
+
+# The scalar meta values of a chunk; Chroma rejects any other type
+def _scalar_meta(meta: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in meta.items() if isinstance(v, (str, int, float, bool))}
+
+class VectorStore:
+    # Add or replace chunks; each document carries its id, content and embedding
+    def write(self, documents: List[Document]) -> None:
+        raise NotImplementedError
+
+    # Remove chunks by id; unknown ids are ignored
+    def delete(self, ids: List[str]) -> None:
+        raise NotImplementedError
+
+    # Remove every chunk
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    # The chunks with these ids, with their embeddings; unknown ids are skipped
+    def get(self, ids: List[str]) -> List[Document]:
+        raise NotImplementedError
+
+    # Make the writes durable
+    def save(self) -> None:
+        pass
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    # The top_k chunks closest to the query embedding, with their embeddings, best first
+    def search(self, query_embedding: List[float], top_k: int) -> List[Document]:
+        raise NotImplementedError
+
+class ChromaVectorStore(VectorStore):
+    def __init__(self, collection: str, store_path: str) -> None:
+        self.collection = collection
+        self.store_path = store_path
+        self.document_store = ChromaDocumentStore(collection_name=collection, persist_path=store_path, distance_function=settings.distance_metric)
+        self.retriever = ChromaEmbeddingRetriever(document_store=self.document_store, top_k=settings.top_n)
+        self._chroma_collection: Optional[Any] = None
+
+    # ChromaDocumentStore.write_documents adds one chunk per call, so bulk writes
+    # and reads open the same collection, created with the same distance, through
+    # the chromadb client
+    def _collection(self) -> Any:
+        if self._chroma_collection is None:
+            import chromadb
+            client = chromadb.PersistentClient(path=self.store_path)
+            self._chroma_collection = client.get_or_create_collection(self.collection, metadata={"hnsw:space": settings.distance_metric})
+        return self._chroma_collection
+
+    def write(self, documents: List[Document]) -> None:
+        # identical chunks share an id; keep one of them
+        unique: Dict[str, Document] = {}
+        for document in documents:
+            unique.setdefault(document.id, document)
+        documents = list(unique.values())
+
+        collection = self._collection()
+        for start in range(0, len(documents), CHROMA_BATCH):
+            batch = documents[start:start + CHROMA_BATCH]
+            collection.upsert(
+                ids=[d.id for d in batch],
+                embeddings=[d.embedding for d in batch],
+                documents=[d.content or "" for d in batch],
+                metadatas=[_scalar_meta(d.meta) or None for d in batch])
+
+    def delete(self, ids: List[str]) -> None:
+        if ids:
+            self.document_store.delete_documents(ids)
+
+    def clear(self) -> None:
+        self.delete([d.id for d in self.document_store.filter_documents()])
+
+    def get(self, ids: List[str]) -> List[Document]:
+        collection = self._collection()
+        documents = []
+        for start in range(0, len(ids), CHROMA_BATCH):
+            result = collection.get(ids=ids[start:start + CHROMA_BATCH], include=["embeddings", "documents", "metadatas"])
+            for i, doc_id in enumerate(result["ids"]):
+                documents.append(Document(
+                    id=doc_id,
+                    content=result["documents"][i],
+                    meta=(result["metadatas"][i] or {}) if result["metadatas"] is not None else {},
+                    embedding=[float(x) for x in result["embeddings"][i]]))
+        return documents
+
+    def count(self) -> int:
+        return self.document_store.count_documents()
+
+    def search(self, query_embedding: List[float], top_k: int) -> List[Document]:
+        return self.retriever.run(query_embedding=query_embedding, top_k=top_k)["documents"]
+
+# Exact nearest-neighbour search over the chunk embeddings of an agent, stored
+# under store_dir/flat/agent_<name>/ as contiguous matrices that are memory-mapped
+# rather than loaded, so the page cache decides what stays resident:
+#   header.json      count, dim, dtype, metric and the current generation
+#   <generation>/    embeddings.bin  rows of float16, float32 or int8
+#                    scales.bin      float32 scale per row (int8 only)
+#                    sqnorms.bin     float32 squared norm per row (l2 only)
+#                    ids.bin         fixed-width ascii ids
+#                    offsets.bin     int64 start of each chunk in contents.bin
+#                    contents.bin    utf-8 chunk texts
+#                    metas.json.gz   chunk meta, read only when the store is modified
+# A save writes a new generation and then replaces header.json, so readers keep
+# the files they mapped and never see a half-written store.
+#
+# Writes to an empty store (an ingest building a new version) are spilled to
+# <store>/building as they arrive and converted block by block on save, so a build
+# keeps only the chunk ids in memory. Modifying a saved store loads it into memory.
+class FlatVectorStore(VectorStore):
+    def __init__(self, collection: str, store_path: str) -> None:
+        self.path = flat_store_path(collection, store_path)
+        self.metric = settings.distance_metric
+        self.header: Dict[str, Any] = {}
+        self.count_rows = 0
+        # mapped (or, once modified, in-memory float32) rows
+        self.embeddings: np.ndarray = np.zeros((0, 0), dtype=np.float32)
+        self.scales: Optional[np.ndarray] = None
+        self.sqnorms: Optional[np.ndarray] = None
+        self._ids: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._contents: Optional[np.ndarray] = None
+        # id -> row and metas of the mapped generation, built by the first get
+        self._mapped_positions: Optional[Dict[str, int]] = None
+        self._mapped_metas: Optional[List[Dict[str, Any]]] = None
+        # editable copy, created by the first write/delete/clear
+        self._editable = False
+        self.ids: List[str] = []
+        self.contents: List[str] = []
+        self.metas: List[Dict[str, Any]] = []
+        self._pending: List[np.ndarray] = []
+        self._positions: Dict[str, int] = {}
+        # rows spilled by the writes to an empty store, until it is saved
+        self._build: Optional[_FlatBuild] = None
+        self._open()
+
+    def write(self, documents: List[Document]) -> None:
+        if self._build is None and not self._editable and self.count_rows == 0:
+            self._build = _FlatBuild(os.path.join(self.path, "building"), self.metric)
+        if self._build is not None:
+            self._build.write(documents)
+            self.count_rows = self._build.count
+            return
+
+        self._make_editable()
+        # identical chunks share an id; keep one of them, as Chroma does
+        unique: Dict[str, Document] = {}
+        for document in documents:
+            unique.setdefault(document.id, document)
+        documents = list(unique.values())
+
+        self.delete([doc_id for doc_id in unique if doc_id in self._positions])
+        for document in documents:
+            self._positions[document.id] = len(self.ids)
+            self.ids.append(document.id)
+            self.contents.append(document.content or "")
+            # keep the scalar meta values, as Chroma does
+            self.metas.append(_scalar_meta(document.meta))
+        if documents:
+            self._pending.append(_embedding_rows(documents, self.metric))
+            self.count_rows = len(self.ids)
+
+    def delete(self, ids: List[str]) -> None:
+        self._make_editable()
+        rows = {self._positions[doc_id] for doc_id in ids if doc_id in self._positions}
+        if not rows:
+            return
+        keep = [row for row in range(len(self.ids)) if row not in rows]
+        matrix = self._matrix()
+        self.embeddings = matrix[keep] if len(matrix) else matrix
+        self.ids = [self.ids[row] for row in keep]
+        self.contents = [self.contents[row] for row in keep]
+        self.metas = [self.metas[row] for row in keep]
+        self._positions = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self.count_rows = len(self.ids)
+
+    def clear(self) -> None:
+        self._make_editable()
+        self.ids, self.contents, self.metas = [], [], []
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self._pending, self._positions = [], {}
+        self.count_rows = 0
+
+    def get(self, ids: List[str]) -> List[Document]:
+        if self._build is not None:
+            self._make_editable()
+        if self._editable:
+            positions, metas = self._positions, self.metas
+        else:
+            positions, metas = self._mapped_index()
+        matrix = self._matrix()
+        documents = []
+        for doc_id in ids:
+            row = positions.get(doc_id)
+            if row is not None:
+                documents.append(Document(id=doc_id, content=self._content(row), meta=dict(metas[row]), embedding=self._rows(matrix, row, row + 1)[0].tolist()))
+        return documents
+
+    def count(self) -> int:
+        return self.count_rows
+
+    # Write a new generation in FLAT_STORE_DTYPE and switch header.json to it
+    def save(self) -> None:
+        if self._build is not None:
+            self._save_build()
+            return
+        if not self._editable:
+            return
+        matrix = self._matrix()
+        dtype = settings.flat_store_dtype
+        generation = int(self.header.get("generation", 0)) + 1
+        generation_dir = os.path.join(self.path, f"{generation:08d}")
+        os.makedirs(generation_dir, exist_ok=True)
+
+        with _GenerationWriter(generation_dir, dtype, self.metric) as writer:
+            writer.write_rows(matrix)
+        id_width = max((len(doc_id) for doc_id in self.ids), default=1)
+        np.asarray(self.ids, dtype=f"S{id_width}").tofile(os.path.join(generation_dir, "ids.bin"))
+        encoded = [content.encode("utf-8") for content in self.contents]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(content) for content in encoded], dtype=np.int64)
+        offsets.tofile(os.path.join(generation_dir, "offsets.bin"))
+        with open(os.path.join(generation_dir, "contents.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+        with gzip.open(os.path.join(generation_dir, "metas.json.gz"), "wt", encoding="utf-8") as f:
+            json.dump(self.metas, f, separators=(",", ":"))
+
+        dim = int(matrix.shape[1]) if len(matrix) else 0
+        self._switch_generation(generation, len(self.ids), dim, dtype, id_width)
+
+    # Convert the spilled rows into a generation block by block, then map it
+    def _save_build(self) -> None:
+        build = self._build
+        build.close()
+        dtype = settings.flat_store_dtype
+        generation = int(self.header.get("generation", 0)) + 1
+        generation_dir = os.path.join(self.path, f"{generation:08d}")
+        os.makedirs(generation_dir, exist_ok=True)
+
+        count, dim = build.count, build.dim
+        with _GenerationWriter(generation_dir, dtype, self.metric) as writer:
+            if count:
+                rows = np.memmap(build.file("embeddings.f32"), dtype=np.float32, mode="r", shape=(count, dim))
+                for start in range(0, count, SAVE_BLOCK_ROWS):
+                    writer.write_rows(rows[start:start + SAVE_BLOCK_ROWS])
+                del rows
+        ids = list(build.positions)
+        id_width = max((len(doc_id) for doc_id in ids), default=1)
+        with open(os.path.join(generation_dir, "ids.bin"), "wb") as f:
+            for start in range(0, count, SAVE_BLOCK_ROWS):
+                np.asarray(ids[start:start + SAVE_BLOCK_ROWS], dtype=f"S{id_width}").tofile(f)
+        os.replace(build.file("offsets.bin"), os.path.join(generation_dir, "offsets.bin"))
+        os.replace(build.file("contents.bin"), os.path.join(generation_dir, "contents.bin"))
+        # the metas are one JSON list, written a line at a time
+        with gzip.open(os.path.join(generation_dir, "metas.json.gz"), "wt", encoding="utf-8") as f, \
+                open(build.file("metas.jsonl"), "r", encoding="utf-8") as lines:
+            f.write("[")
+            for i, line in enumerate(lines):
+                if i:
+                    f.write(",")
+                f.write(line.rstrip("\n"))
+            f.write("]")
+
+        self._switch_generation(generation, count, dim, dtype, id_width)
+        build.discard()
+        self._build = None
+        self._open()
+
+    # Point header.json at a written generation and remove the previous one
+    def _switch_generation(self, generation: int, count: int, dim: int, dtype: str, id_width: int) -> None:
+        previous = self.header.get("generation")
+        self.header = {
+            "version": 1,
+            "generation": generation,
+            "count": count,
+            "dim": dim,
+            "dtype": dtype,
+            "metric": self.metric,
+            "id_width": id_width,
+        }
+        header_path = os.path.join(self.path, "header.json")
+        temp_path = f"{header_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.header, f)
+        os.replace(temp_path, header_path)
+
+        # readers that mapped the previous generation keep their open files
+        if previous is not None:
+            shutil.rmtree(os.path.join(self.path, f"{int(previous):08d}"), ignore_errors=True)
+
+    def search(self, query_embedding: List[float], top_k: int) -> List[Document]:
+        if self._build is not None:
+            self._make_editable()
+        if self.count_rows == 0 or top_k <= 0:
+            return []
+        matrix = self._matrix()
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if self.metric == "cosine":
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        # score block by block so float16/int8 rows are widened a cache-sized block at a time
+        scores = np.empty(self.count_rows, dtype=np.float32)
+        for start in range(0, self.count_rows, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, self.count_rows)
+            block = np.asarray(matrix[start:end], dtype=np.float32) @ query
+            if self.scales is not None:
+                block *= self.scales[start:end]
+            scores[start:end] = block
+        if self.metric == "l2":
+            # closest first: -(|x|^2 - 2 x.q + |q|^2)
+            sqnorms = self.sqnorms if self.sqnorms is not None else np.sum(matrix.astype(np.float32) ** 2, axis=1)
+            scores = -(sqnorms - 2 * scores + float(query @ query))
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            Document(id=self._id(row), content=self._content(row), embedding=self._rows(matrix, row, row + 1)[0].tolist(), score=float(scores[row]))
+            for row in top
+        ]
+
+    # Rows start:end widened to float32
+    def _rows(self, matrix: np.ndarray, start: int, end: int) -> np.ndarray:
+        rows = np.asarray(matrix[start:end], dtype=np.float32)
+        if self.scales is not None:
+            rows = rows * self.scales[start:end, None]
+        return rows
+
+    def _id(self, row: int) -> str:
+        return self.ids[row] if self._editable else self._ids[row].decode("ascii")
+
+    def _content(self, row: int) -> str:
+        if self._editable:
+            return self.contents[row]
+        return self._contents[self._offsets[row]:self._offsets[row + 1]].tobytes().decode("utf-8")
+
+    # The embedding matrix including pending rows
+    def _matrix(self) -> np.ndarray:
+        if self._pending:
+            parts = ([self.embeddings] if len(self.embeddings) else []) + self._pending
+            self.embeddings = np.concatenate(parts)
+            self._pending = []
+        return self.embeddings
+
+    # Row of each id and the metas of the mapped generation, read once per opened store
+    def _mapped_index(self) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+        if self._mapped_positions is None:
+            metas: List[Dict[str, Any]] = []
+            if self.count_rows:
+                with gzip.open(os.path.join(self._generation_dir(), "metas.json.gz"), "rt", encoding="utf-8") as f:
+                    metas = json.load(f)
+            ids = np.char.decode(np.asarray(self._ids), "ascii").tolist() if self.count_rows else []
+            self._mapped_positions = {doc_id: row for row, doc_id in enumerate(ids)}
+            self._mapped_metas = metas
+        return self._mapped_positions, self._mapped_metas
+
+    def _generation_dir(self) -> str:
+        return os.path.join(self.path, f"{int(self.header['generation']):08d}")
+
+    # Map the current generation, if the store has been saved
+    def _open(self) -> None:
+        self._mapped_positions, self._mapped_metas = None, None
+        header_path = os.path.join(self.path, "header.json")
+        if not os.path.exists(header_path):
+            return
+        with open(header_path, "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        count, dim = self.header["count"], self.header["dim"]
+        self.count_rows = count
+        if count == 0:
+            return
+
+        generation_dir = self._generation_dir()
+        dtype = {"float16": np.float16, "int8": np.int8}.get(self.header["dtype"], np.float32)
+        self.embeddings = np.memmap(os.path.join(generation_dir, "embeddings.bin"), dtype=dtype, mode="r", shape=(count, dim))
+        if self.header["dtype"] == "int8":
+            self.scales = np.memmap(os.path.join(generation_dir, "scales.bin"), dtype=np.float32, mode="r", shape=(count,))
+        if self.header["metric"] == "l2":
+            self.sqnorms = np.memmap(os.path.join(generation_dir, "sqnorms.bin"), dtype=np.float32, mode="r", shape=(count,))
+        self._ids = np.memmap(os.path.join(generation_dir, "ids.bin"), dtype=f"S{self.header['id_width']}", mode="r", shape=(count,))
+        self._offsets = np.memmap(os.path.join(generation_dir, "offsets.bin"), dtype=np.int64, mode="r", shape=(count + 1,))
+        if self._offsets[-1] > 0:
+            self._contents = np.memmap(os.path.join(generation_dir, "contents.bin"), dtype=np.uint8, mode="r")
+        else:
+            self._contents = np.zeros(0, dtype=np.uint8)
+
+    # Copy the mapped (or spilled) store into memory as float32 before it is modified
+    def _make_editable(self) -> None:
+        if self._editable:
+            return
+        count = self.count_rows
+        if self._build is not None:
+            self.ids, self.contents, self.metas, self.embeddings = self._build.load()
+            self._build.discard()
+            self._build = None
+        elif count:
+            generation_dir = self._generation_dir()
+            self.ids = [self._id(row) for row in range(count)]
+            self.contents = [self._content(row) for row in range(count)]
+            with gzip.open(os.path.join(generation_dir, "metas.json.gz"), "rt", encoding="utf-8") as f:
+                self.metas = json.load(f)
+            self.embeddings = self._rows(self.embeddings, 0, count)
+        self.scales, self.sqnorms = None, None
+        self._ids, self._offsets, self._contents = None, None, None
+        self._mapped_positions, self._mapped_metas = None, None
+        self._positions = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._editable = True
+
+# Embeddings of documents as float32 rows, normalized for the cosine metric so
+# a search is a single dot product
+def _embedding_rows(documents: List[Document], metric: str) -> np.ndarray:
+    rows = np.asarray([d.embedding for d in documents], dtype=np.float32)
+    if metric == "cosine":
+        rows /= np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)
+    return rows
+
+# Writes the row files of a generation a block of rows at a time: embeddings.bin
+# in the store dtype, plus scales.bin (int8) and sqnorms.bin (l2)
+class _GenerationWriter:
+    def __init__(self, generation_dir: str, dtype: str, metric: str) -> None:
+        self.dtype = dtype
+        self._embeddings = open(os.path.join(generation_dir, "embeddings.bin"), "wb")
+        self._scales = open(os.path.join(generation_dir, "scales.bin"), "wb") if dtype == "int8" else None
+        self._sqnorms = open(os.path.join(generation_dir, "sqnorms.bin"), "wb") if metric == "l2" else None
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        if not len(rows):
+            return
+        rows = np.asarray(rows, dtype=np.float32)
+        if self.dtype == "int8":
+            # symmetric per-row quantization
+            scales = np.maximum(np.abs(rows).max(axis=1), 1e-12) / 127.0
+            np.round(rows / scales[:, None]).astype(np.int8).tofile(self._embeddings)
+            scales.astype(np.float32).tofile(self._scales)
+        else:
+            rows.astype(np.float16 if self.dtype == "float16" else np.float32).tofile(self._embeddings)
+        if self._sqnorms is not None:
+            np.sum(rows ** 2, axis=1).astype(np.float32).tofile(self._sqnorms)
+
+    def __enter__(self) -> "_GenerationWriter":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        for f in (self._embeddings, self._scales, self._sqnorms):
+            if f is not None:
+                f.close()
+
+# Rows written to an empty flat store, appended to files as they arrive: float32
+# embeddings, utf-8 contents with their int64 end offsets, and a JSON meta per
+# line. Only the ids, to keep one chunk per id, stay in memory.
+class _FlatBuild:
+    def __init__(self, path: str, metric: str) -> None:
+        self.path = path
+        self.metric = metric
+        # drop whatever an interrupted build left
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        self.positions: Dict[str, int] = {}
+        self.dim = 0
+        self._content_end = 0
+        self._embeddings = open(self.file("embeddings.f32"), "wb")
+        self._contents = open(self.file("contents.bin"), "wb")
+        self._offsets = open(self.file("offsets.bin"), "wb")
+        self._metas = open(self.file("metas.jsonl"), "w", encoding="utf-8")
+        np.zeros(1, dtype=np.int64).tofile(self._offsets)
+
+    @property
+    def count(self) -> int:
+        return len(self.positions)
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def write(self, documents: List[Document]) -> None:
+        # identical chunks share an id; keep the first one, as Chroma does
+        unique: Dict[str, Document] = {}
+        for document in documents:
+            if document.id not in self.positions:
+                unique.setdefault(document.id, document)
+        documents = list(unique.values())
+        if not documents:
+            return
+        rows = _embedding_rows(documents, self.metric)
+        self.dim = rows.shape[1]
+        rows.tofile(self._embeddings)
+        ends = []
+        for document in documents:
+            self.positions[document.id] = len(self.positions)
+            encoded = (document.content or "").encode("utf-8")
+            self._contents.write(encoded)
+            self._content_end += len(encoded)
+            ends.append(self._content_end)
+            # keep the scalar meta values, as Chroma does
+            self._metas.write(json.dumps(_scalar_meta(document.meta), separators=(",", ":")) + "\n")
+        np.asarray(ends, dtype=np.int64).tofile(self._offsets)
+
+    def close(self) -> None:
+        for f in (self._embeddings, self._contents, self._offsets, self._metas):
+            f.close()
+
+    # The spilled ids, contents, metas and float32 rows, read back into memory
+    def load(self) -> Tuple[List[str], List[str], List[Dict[str, Any]], np.ndarray]:
+        self.close()
+        ids = list(self.positions)
+        count = len(ids)
+        if not count:
+            return [], [], [], np.zeros((0, 0), dtype=np.float32)
+        embeddings = np.fromfile(self.file("embeddings.f32"), dtype=np.float32).reshape(count, self.dim)
+        offsets = np.fromfile(self.file("offsets.bin"), dtype=np.int64)
+        with open(self.file("contents.bin"), "rb") as f:
+            data = f.read()
+        contents = [data[offsets[row]:offsets[row + 1]].decode("utf-8") for row in range(count)]
+        with open(self.file("metas.jsonl"), "r", encoding="utf-8") as f:
+            metas = [json.loads(line) for line in f]
+        return ids, contents, metas, embeddings
+
+    def discard(self) -> None:
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+# Directory of a flat store
+def flat_store_path(collection: str, store_path: str) -> str:
+    return os.path.join(store_path, "flat", collection)
+
+# Chroma keeps its database in the store dir; it is only opened if it exists
+def _chroma_client(store_path: str) -> Optional[Any]:
+    if not os.path.exists(os.path.join(store_path, "chroma.sqlite3")):
+        return None
+    import chromadb
+    return chromadb.PersistentClient(path=store_path)
+
+# Names of the collections present in the store dir, in any backend
+def list_collections(store_path: str) -> List[str]:
+    names = set()
+    flat_dir = os.path.join(store_path, "flat")
+    if os.path.isdir(flat_dir):
+        names.update(entry for entry in os.listdir(flat_dir) if os.path.isdir(os.path.join(flat_dir, entry)))
+    client = _chroma_client(store_path)
+    if client is not None:
+        names.update(c if isinstance(c, str) else c.name for c in client.list_collections())
+    return sorted(names)
+
+# Remove a collection from every backend
+def drop_vector_store(collection: str, store_path: str) -> None:
+    shutil.rmtree(flat_store_path(collection, store_path), ignore_errors=True)
+    client = _chroma_client(store_path)
+    if client is not None:
+        try:
+            client.delete_collection(collection)
+        except Exception:
+            # not a Chroma collection
+            pass
+
+# Open a collection with the configured backend
+def open_vector_store(collection: str, store_path: str, backend: Optional[str] = None) -> VectorStore:
+    backend = backend or settings.vector_store
+    if backend == "chroma":
+        return ChromaVectorStore(collection, store_path)
+    if backend == "flat":
+        return FlatVectorStore(collection, store_path)
+    raise ValueError(f"Unknown VECTOR_STORE {backend}, expected one of {', '.join(VECTOR_STORES)}")
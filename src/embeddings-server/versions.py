@@ -0,0 +1,154 @@
+# versions.py
+
+# Blue/green versions of an agent's index. A rebuild writes a complete new
+# version next to the live one: vector store collection, lexical index and
+# manifest, all named agent_<name>_v<n>. The agent's alias file is then replaced
+# in one atomic rename, so queries switch from the old version to the new one
+# and never see a half-built index. Version 0 is the unversioned agent_<name>
+# used before versions existed.
+#
+# Superseded versions stay on disk for VERSION_GC_GRACE_SECONDS after the swap,
+# so queries already running on them can finish, and are then dropped by a
+# background thread.
+#
+# Builds of one agent are serialized by a file lock under store_dir/locks, held
+# from choosing the next version until it is published, so concurrent builds
+# (ingest workers, uvicorn workers or direct /generate calls) cannot both build
+# version n+1 and drop each other's half-built files.
+
+import os
+import re
+import json
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import settings
+from lexical import lexical_index_path
+from manifest import manifest_path
+from vector_store import drop_vector_store, list_collections
+
+# agent names are sanitized to [a-z0-9-], so the version suffix is unambiguous
+COLLECTION_PATTERN = re.compile(r"^agent_(?P<agent>.+?)(?:_v(?P<version>\d+))?$")
+
+_gc_stop = threading.Event()
+_gc_thread: Optional[threading.Thread] = None
+
+# alias path -> (inode, mtime, version) of the alias file last read, so a query
+# only stats the file unless it has been replaced
+_aliases_lock = threading.Lock()
+_aliases: Dict[str, Tuple[int, int, int]] = {}
+
+# Name of the collection of a version of an agent
+def collection_name(agent_name: str, version: int) -> str:
+    return f"agent_{agent_name}" if version == 0 else f"agent_{agent_name}_v{version}"
+
+# Path of the alias file that points an agent to its live version
+def alias_path(agent_name: str, store_path: str) -> str:
+    return os.path.join(store_path, "aliases", f"agent_{agent_name}.json")
+
+# The live version of an agent; 0 if it has never been built with versions
+def current_version(agent_name: str, store_path: str) -> int:
+    path = alias_path(agent_name, store_path)
+    try:
+        stat = os.stat(path)
+        with _aliases_lock:
+            cached = _aliases.get(path)
+        # publish_version replaces the file, so a new version has a new inode
+        if cached is not None and cached[:2] == (stat.st_ino, stat.st_mtime_ns):
+            return cached[2]
+        with open(path, "r", encoding="utf-8") as f:
+            version = int(json.load(f)["version"])
+    except FileNotFoundError:
+        return 0
+    with _aliases_lock:
+        _aliases[path] = (stat.st_ino, stat.st_mtime_ns, version)
+    return version
+
+# Hold the build lock of an agent; waits while another thread or process builds it
+@contextmanager
+def build_lock(agent_name: str, store_path: str) -> Iterator[None]:
+    path = os.path.join(store_path, "locks", f"agent_{agent_name}.lock")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # flock is per open file, so threads of one process exclude each other too
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+# Point an agent to a fully built version
+def publish_version(agent_name: str, store_path: str, version: int) -> None:
+    path = alias_path(agent_name, store_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "published_on": int(time.time())}, f)
+    os.replace(temp_path, path)
+
+# Remove every file of a version
+def drop_version(agent_name: str, store_path: str, version: int) -> None:
+    collection = collection_name(agent_name, version)
+    drop_vector_store(collection, store_path)
+    for path in (lexical_index_path(collection, store_path), manifest_path(collection, store_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+# Versions of each agent found in the store dir
+def _versions_on_disk(store_path: str) -> Dict[str, List[int]]:
+    names = set(list_collections(store_path))
+    for folder, suffix in (("lexical", ".json.gz"), ("manifests", ".json")):
+        path = os.path.join(store_path, folder)
+        if os.path.isdir(path):
+            names.update(entry[:-len(suffix)] for entry in os.listdir(path) if entry.endswith(suffix))
+
+    versions: Dict[str, List[int]] = {}
+    for name in names:
+        match = COLLECTION_PATTERN.match(name)
+        if match:
+            versions.setdefault(match.group("agent"), []).append(int(match.group("version") or 0))
+    return versions
+
+# Drop the versions older than the live one of every agent whose last swap is
+# more than grace_seconds old. Newer versions may be a build in progress and
+# are left alone; the next build of the agent reuses them. Returns the dropped collections.
+def collect_garbage(store_path: str, grace_seconds: float) -> List[str]:
+    dropped = []
+    now = time.time()
+    for agent_name, versions in _versions_on_disk(store_path).items():
+        path = alias_path(agent_name, store_path)
+        if not os.path.exists(path) or now - os.path.getmtime(path) < grace_seconds:
+            continue
+        live = current_version(agent_name, store_path)
+        for version in sorted(set(versions)):
+            if version < live:
+                drop_version(agent_name, store_path, version)
+                dropped.append(collection_name(agent_name, version))
+    if dropped and settings.DEBUG:
+        print(f"Dropped superseded versions: {', '.join(dropped)}")
+    return dropped
+
+# Run collect_garbage every VERSION_GC_INTERVAL_SECONDS in a daemon thread
+def start_version_gc(store_path: str) -> None:
+    global _gc_thread
+    if _gc_thread is not None or settings.version_gc_interval_seconds <= 0:
+        return
+
+    def run() -> None:
+        while not _gc_stop.wait(settings.version_gc_interval_seconds):
+            try:
+                collect_garbage(store_path, settings.version_gc_grace_seconds)
+            except Exception as e:
+                print(f"Version garbage collection failed: {str(e)}")
+
+    _gc_stop.clear()
+    _gc_thread = threading.Thread(target=run, name="version-gc", daemon=True)
+    _gc_thread.start()
+
+def stop_version_gc() -> None:
+    global _gc_thread
+    _gc_stop.set()
+    _gc_thread = None
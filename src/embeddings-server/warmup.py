@@ -0,0 +1,86 @@
+# warmup.py
+
+# Startup warm-up. Models load lazily on first use, which made the first query
+# after a restart take seconds. Warm-up loads the embedding model and runs a
+# dummy batch through it, loads the reranker if one is configured, and opens
+# the stores of the WARMUP_AGENTS most recently used agents. /ready reports 200
+# only once it is done; /health stays a plain liveness check.
+
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from config import settings
+from embedder import BATCH_SIZE, get_embedder
+from registry import get_store, recent_agents
+from reranker import get_reranker
+
+class Warmup:
+    def __init__(self, model_path: str, store_path: str) -> None:
+        self.model_path = model_path
+        self.store_path = store_path
+        self._lock = threading.Lock()
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+        # seconds spent in each finished phase, in order
+        self._phases: Dict[str, float] = {}
+        self._agents: List[str] = []
+        self.error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._finished is not None and self.error is None
+
+    # Run every phase; blocking, so call it from a thread
+    def run(self) -> None:
+        self._started = time.perf_counter()
+        try:
+            self._phase("load_model", lambda: get_embedder(self.model_path))
+            self._phase("embed_batch", lambda: get_embedder(self.model_path).embed(["warm up the embedding model"] * BATCH_SIZE))
+            if settings.rerank_model_name:
+                self._phase("load_reranker", get_reranker)
+            if settings.warmup_agents > 0:
+                self._phase("open_agents", self._open_agents)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"Warm-up failed: {self.error}")
+        self._finished = time.perf_counter()
+        if settings.DEBUG and self.error is None:
+            print(f"Warm-up done in {self._finished - self._started:.2f}s: {self._phases}")
+
+    def _phase(self, name: str, work: Callable[[], Any]) -> None:
+        started = time.perf_counter()
+        work()
+        with self._lock:
+            self._phases[name] = time.perf_counter() - started
+
+    # Open the stores of the most recently used agents; an agent that fails to
+    # open is skipped, it is not worth keeping the server unready for
+    def _open_agents(self) -> None:
+        for agent_name in recent_agents(self.store_path, settings.warmup_agents):
+            try:
+                handle = get_store(agent_name, self.store_path)
+                # loads the lexical index under the hybrid strategy
+                handle.lexical_index
+                self._agents.append(agent_name)
+            except Exception as e:
+                if settings.DEBUG:
+                    print(f"Warm-up could not open agent {agent_name}: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        if self.error is not None:
+            state = "failed"
+        elif self._finished is not None:
+            state = "ready"
+        else:
+            state = "warming_up" if self._started is not None else "starting"
+        end = self._finished if self._finished is not None else time.perf_counter()
+        with self._lock:
+            phases = {name: round(seconds, 3) for name, seconds in self._phases.items()}
+        return {
+            "status": state,
+            "startup_seconds": round(end - self._started, 3) if self._started is not None else 0.0,
+            "phases": phases,
+            "agents": list(self._agents),
+            "error": self.error,
+        }
@@ -7,6 +7,10 @@ embedding_repo_id = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all
 embedding_model_dir = os.path.join(os.getenv("DATA_DIR", "data"), "models", embedding_repo_id)
 tokenizer_repo_id = os.getenv("TOKENIZER_MODEL_NAME", "google-bert/bert-base-uncased")
 tokenizer_model_dir = os.path.join(os.getenv("DATA_DIR", "data"), "models", tokenizer_repo_id)
+rerank_repo_id = os.getenv("RERANK_MODEL_NAME", "").strip()
+rerank_model_dir = os.path.join(os.getenv("DATA_DIR", "data"), "models", rerank_repo_id)
+llm_tokenizer_repo_id = os.getenv("LLM_TOKENIZER_NAME", "").strip() or os.getenv("LLM_MODEL_NAME", "").strip()
+llm_tokenizer_dir = os.path.join(os.getenv("DATA_DIR", "data"), "models", llm_tokenizer_repo_id)
 DEBUG = os.getenv("DEBUG", "false").strip().lower() == "true"
 
 # downloading embeddings model
@@ -21,3 +25,22 @@ snapshot_download(
     local_dir=tokenizer_model_dir,  # Ensure it's downloaded to /data/models
     token=token
 )
+# downloading the optional rerank model
+if rerank_repo_id:
+    snapshot_download(
+        repo_id=rerank_repo_id,
+        local_dir=rerank_model_dir,  # Ensure it's downloaded to /data/models
+        token=token
+    )
+# downloading the tokenizer of the llm, used by the api-server to fit prompts in MAX_INPUT_TOKENS;
+# without it the api-server estimates tokens, so a failure (e.g. a gated model) is not fatal
+if llm_tokenizer_repo_id:
+    try:
+        snapshot_download(
+            repo_id=llm_tokenizer_repo_id,
+            local_dir=llm_tokenizer_dir,
+            allow_patterns=["tokenizer.json", "tokenizer_config.json"],
+            token=token
+        )
+    except Exception as e:
+        print(f"Tokenizer of {llm_tokenizer_repo_id} not downloaded, the api-server will estimate tokens: {e}")
@@ -47,6 +47,9 @@ const Agent = () => {
   const [newFiles, setNewFiles] = useState([]);
   const [deletedFiles, setDeletedFiles] = useState('');
   const [embeddingsStatus, setEmbeddingsStatus] = useState('');
+  // 'I' while files are being processed, 'F' when processing them failed
+  const embeddingsFailed = embeddingsStatus === 'F';
+  const isProcessing = !!embeddingsStatus && !embeddingsFailed;
 
   // State for UI interactions
   //const [canEdit, setCanEdit] = useState(true);
@@ -281,10 +284,10 @@ I’m here to help you navigate your insurance needs and provide expert advice o
                 <ButtonPlain width="auto">Return to Agents</ButtonPlain>
               </Link>
             )}
-            {embeddingsStatus &&
+            {isProcessing &&
               <ButtonFilled width="auto" onClick={handleRefresh}>Refresh</ButtonFilled>
             }
-            {!embeddingsStatus && isEditMode && !agentData.name && (
+            {!isProcessing && isEditMode && !agentData.name && (
               <>
                 <Link to="/agents">
                   <ButtonPlain>Return to Agents</ButtonPlain>
@@ -294,7 +297,7 @@ I’m here to help you navigate your insurance needs and provide expert advice o
                 </ButtonFilled>
               </>
             )}
-            {!embeddingsStatus && isEditMode && agentData.name && (
+            {!isProcessing && isEditMode && agentData.name && (
               <>
                 <ButtonPlain onClick={handleReset}>Reset</ButtonPlain>
                 <ButtonFilled width="auto" onClick={handleSave}>
@@ -309,11 +312,16 @@ I’m here to help you navigate your insurance needs and provide expert advice o
             <ErrorBlock>{error}</ErrorBlock>
           </div>
         }
-        {embeddingsStatus &&
+        {isProcessing &&
           <div className="float-right pr-4">
             <InfoBlock>Files are being processed ...</InfoBlock>
           </div>
         }
+        {embeddingsFailed &&
+          <div className="float-right pr-4">
+            <ErrorBlock>Processing the files failed. Update the files to try again.</ErrorBlock>
+          </div>
+        }
 
       </header>
       <div className="flex flex-grow flex-col items-center bg-gray-50 p-8">
@@ -330,21 +338,21 @@ I’m here to help you navigate your insurance needs and provide expert advice o
             data={agentData.instructions}
             value={instructions}
             placeholder={agentData.name ? '' : instructionsPlaceholder}
-            canEdit={!embeddingsStatus}
+            canEdit={!isProcessing}
             onEdit={() => handleEdit('instructions')}
           />
           <WelcomeMessageView
             data={agentData.welcome_message}
             value={welcomeMessage}
             placeholder={agentData.name ? '' : welcomeMessagePlaceholder}
-            canEdit={!embeddingsStatus}
+            canEdit={!isProcessing}
             onEdit={() => handleEdit('welcomeMessage')}
           />
           <SuggestedPromptsView
             data={agentData.suggested_prompts}
             value={suggestedPrompts}
             placeholder={agentData.name ? '' : suggestedPromptsPlaceholder}
-            canEdit={!embeddingsStatus}
+            canEdit={!isProcessing}
             onEdit={() => handleEdit('suggestedPrompts')}
           />
           <FilesView
@@ -352,7 +360,7 @@ I’m here to help you navigate your insurance needs and provide expert advice o
             new_files={newFiles}
             deleted_files={deletedFiles}
             placeholder={agentData.name ? '' : filesPlaceholder}
-            canEdit={!embeddingsStatus}
+            canEdit={!isProcessing}
             onEdit={() => handleEdit('files')}
           />
         </div>